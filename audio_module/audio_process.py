@@ -0,0 +1,444 @@
+"""
+Motor de audio en un proceso independiente
+El callback de PyAudio corre en otro intérprete, así no compite por el GIL con MediaPipe, OpenCV e imshow.
+El proceso principal usa ProcessSynthesizer, que tiene la misma interfaz que ThereminSynthesizer
+(update_position, update_parameters, get_info, wave_type...), y escribe los controles en un bloque de
+memoria compartida protegido con un seqlock (un solo escritor por campo, sin locks entre procesos).
+El motor publica en el mismo bloque su estado y la duración de cada callback para las métricas.
+"""
+
+import math
+import multiprocessing
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from audio_recorder import AsyncAudioRecorder
+from note_table import NoteTable
+from theremin_synthesizer import PA_OUTPUT_UNDERFLOW, ThereminSynthesizer
+
+WAVE_TYPES = ['sine', 'square', 'saw', 'triangle']
+
+# Número de duraciones de callback que caben en el anillo de tiempos (unos 6 s con buffers de 1024)
+TIMING_SLOTS = 256
+
+# Controles (los escribe solo el proceso principal). NaN = mano no detectada / parámetro sin fijar
+CONTROL_DTYPE = np.dtype([
+    ('sequence', 'u8'),         # seqlock: impar mientras se escribe
+    ('position_count', 'u8'),   # número de llamadas a update_position
+    ('right_hand_y', 'f8'),
+    ('left_hand_x', 'f8'),
+    ('vibrato_depth', 'f8'),
+    ('delay_seconds', 'f8'),
+    ('reverb_mix', 'f8'),
+    ('wave_type', 'i4'),
+    ('reverb_enabled', 'u1'),
+])
+
+# Estado del motor (lo escribe solo el proceso de audio)
+STATUS_DTYPE = np.dtype([
+    ('sequence', 'u8'),
+    ('current_frequency', 'f8'),
+    ('sounding_frequency', 'f8'),
+    ('current_volume', 'f8'),
+    ('vibrato_depth', 'f8'),
+    ('delay_seconds', 'f8'),
+    ('reverb_mix', 'f8'),
+    ('is_playing', 'u1'),
+    ('underflows', 'u8'),
+    ('timing_count', 'u8'),
+    ('timings', 'f8', (TIMING_SLOTS,)),
+    ('timing_starts', 'f8', (TIMING_SLOTS,)),   # inicio de cada callback (perf_counter, común a los procesos)
+])
+
+STATE_DTYPE = np.dtype([('control', CONTROL_DTYPE), ('status', STATUS_DTYPE)])
+
+# Campos de estado que se copian en cada lectura (los tiempos se leen aparte)
+_STATUS_FIELDS = ('current_frequency', 'sounding_frequency', 'current_volume', 'vibrato_depth',
+                  'delay_seconds', 'reverb_mix', 'is_playing')
+
+
+def _state_view(shm):
+    return np.ndarray((), dtype=STATE_DTYPE, buffer=shm.buf)
+
+
+# Lectura consistente de varios campos: se reintenta si el escritor estaba a mitad de una actualización.
+# El número de intentos está acotado por si el escritor murió con la secuencia impar
+def _read_fields(block, fields, retries=100):
+    for _ in range(retries):
+        before = int(block['sequence'])
+        if before & 1:
+            continue
+        values = {name: block[name].item() for name in fields}
+        if int(block['sequence']) == before:
+            return values
+    return {name: block[name].item() for name in fields}
+
+
+# Escritura con seqlock (un único escritor por bloque)
+def _write_fields(block, values):
+    block['sequence'] += 1
+    for name, value in values.items():
+        block[name] = value
+    block['sequence'] += 1
+
+
+# Sintetizador del proceso de audio: antes de cada bloque aplica los controles compartidos y después publica su estado
+class _EngineSynthesizer(ThereminSynthesizer):
+
+    def __init__(self, state, **kwargs):
+        super().__init__(**kwargs)
+        self.control = state['control']
+        self.status = state['status']
+        self.last_position_count = 0
+
+    def _apply_controls(self):
+        control = _read_fields(self.control, ('position_count', 'right_hand_y', 'left_hand_x', 'vibrato_depth',
+                                              'delay_seconds', 'reverb_mix', 'wave_type', 'reverb_enabled'))
+        self.wave_type = WAVE_TYPES[control['wave_type']]
+        self.reverb_enabled = bool(control['reverb_enabled'])
+
+        pending = control['position_count'] - self.last_position_count
+        if pending <= 0:
+            return
+        self.last_position_count = control['position_count']
+
+        right_hand_y = control['right_hand_y']
+        left_hand_x = control['left_hand_x']
+        right_hand_y = None if math.isnan(right_hand_y) else right_hand_y
+        left_hand_x = None if math.isnan(left_hand_x) else left_hand_x
+        # Si llegaron varios frames en un mismo bloque se repite el último para que el suavizado
+        # y el desvanecimiento del volumen avancen al mismo ritmo que en el proceso principal
+        for _ in range(min(pending, self.frequency_history.maxlen)):
+            self.update_position(right_hand_y, left_hand_x)
+
+        parameters = {name: control[name] for name in ('vibrato_depth', 'delay_seconds', 'reverb_mix')
+                      if not math.isnan(control[name])}
+        if parameters:
+            self.update_parameters(**parameters)
+
+    def _publish_status(self, start, seconds, status):
+        block = self.status
+        _write_fields(block, {
+            'current_frequency': self.current_frequency,
+            'sounding_frequency': self.sounding_frequency,
+            'current_volume': self.current_volume,
+            'vibrato_depth': self.vibrato_depth,
+            'delay_seconds': self.delay_seconds,
+            'reverb_mix': self.reverb_mix,
+            'is_playing': self.is_playing,
+        })
+        if status & PA_OUTPUT_UNDERFLOW:
+            block['underflows'] += 1
+        # El contador se incrementa después de escribir el tiempo para que el lector no vea un hueco vacío
+        count = int(block['timing_count'])
+        block['timings'][count % TIMING_SLOTS] = seconds
+        block['timing_starts'][count % TIMING_SLOTS] = start
+        block['timing_count'] = count + 1
+
+    # Comando del proceso principal: conecta (o desconecta con None) el anillo de grabación compartido
+    def attach_record_ring(self, ring):
+        previous = self.record_ring
+        self.record_ring = ring
+        if previous is not None:
+            previous.close()
+
+    def _audio_callback(self, in_data, frame_count, time_info, status):
+        callback_start = time.perf_counter()
+        self._apply_controls()
+        result = super()._audio_callback(in_data, frame_count, time_info, status)
+        self._publish_status(callback_start, time.perf_counter() - callback_start, status)
+        return result
+
+
+# Punto de entrada del proceso de audio
+def _engine_main(shm_name, commands, ready, config):
+    # El bloque lo crea y lo libera (unlink) el proceso principal; aquí solo nos conectamos
+    shm = shared_memory.SharedMemory(name=shm_name)
+    state = _state_view(shm)
+    synthesizer = _EngineSynthesizer(state, **config)
+    parent = multiprocessing.parent_process()
+    try:
+        synthesizer.start()
+        ready.set()
+        while True:
+            try:
+                command, kwargs = commands.get(timeout=0.5)
+            except queue.Empty:
+                # Si el proceso principal muere sin avisar, no dejamos el audio sonando
+                if parent is not None and not parent.is_alive():
+                    break
+                continue
+            if command == 'stop':
+                break
+            # Comandos poco frecuentes (set_quantization, set_reverb_mode, set_effects): se calculan aquí, fuera del callback
+            getattr(synthesizer, command)(**kwargs)
+    finally:
+        synthesizer.cleanup()
+        del synthesizer, state
+        shm.close()
+
+
+# Frente del motor de audio en otro proceso, con la misma interfaz que ThereminSynthesizer.
+# Un hilo supervisor vuelca los tiempos del callback en metrics y relanza el proceso si se cae
+class ProcessSynthesizer:
+
+    def __init__(self,
+                 sample_rate=44100,
+                 min_frequency=200.0,
+                 max_frequency=2000.0,
+                 wave_type='sine',
+                 buffer_size=1024,
+                 metrics=None,
+                 reverb_mode='echo',
+                 impulse_response=None,
+                 max_restarts=3,
+                 start_timeout=10.0):
+        self.sample_rate = sample_rate
+        self.min_frequency = min_frequency
+        self.max_frequency = max_frequency
+        self.buffer_size = buffer_size
+        self.metrics = metrics
+        self.max_restarts = max_restarts
+        self.start_timeout = start_timeout
+
+        # Configuración con la que se crea (o se relanza) el motor
+        self.config = {
+            'sample_rate': sample_rate,
+            'min_frequency': min_frequency,
+            'max_frequency': max_frequency,
+            'wave_type': wave_type,
+            'buffer_size': buffer_size,
+            'reverb_mode': reverb_mode,
+            'impulse_response': impulse_response,
+        }
+        # Últimos comandos enviados, para repetirlos si hay que relanzar el proceso
+        self.sticky_commands = {}
+        self.reverb_mode = reverb_mode
+        self.scale = None
+
+        # Nombres de nota calculados en este proceso, igual que ThereminSynthesizer.get_info
+        self.note_table = NoteTable(min_frequency, max_frequency)
+        self._note_cache = (None, "N/A", 0.0)
+
+        self.context = multiprocessing.get_context('spawn')
+        self.shm = shared_memory.SharedMemory(create=True, size=STATE_DTYPE.itemsize)
+        self.state = _state_view(self.shm)
+        self.state[()] = np.zeros((), dtype=STATE_DTYPE)
+        self.control = self.state['control']
+        self.status = self.state['status']
+        _write_fields(self.control, {
+            'right_hand_y': np.nan, 'left_hand_x': np.nan,
+            'vibrato_depth': np.nan, 'delay_seconds': np.nan, 'reverb_mix': np.nan,
+            'wave_type': WAVE_TYPES.index(wave_type), 'reverb_enabled': True,
+        })
+        self._wave_type = wave_type
+        self._reverb_enabled = True
+
+        self.process = None
+        self.commands = None
+        self.restarts = 0
+        self.last_timing_count = 0
+        self.last_underflows = 0
+        self.stopping = threading.Event()
+        self.supervisor = None
+        self.audio_recorder = None
+
+    # El bucle principal cambia la forma de onda asignando el atributo, como con ThereminSynthesizer
+    @property
+    def wave_type(self):
+        return self._wave_type
+
+    @wave_type.setter
+    def wave_type(self, value):
+        _write_fields(self.control, {'wave_type': WAVE_TYPES.index(value)})
+        self._wave_type = value
+
+    @property
+    def reverb_enabled(self):
+        return self._reverb_enabled
+
+    @reverb_enabled.setter
+    def reverb_enabled(self, value):
+        _write_fields(self.control, {'reverb_enabled': bool(value)})
+        self._reverb_enabled = bool(value)
+
+    @property
+    def is_playing(self):
+        return self.process is not None and self.process.is_alive() and bool(self.status['is_playing'])
+
+    def start(self):
+        if self.process is not None and self.process.is_alive():
+            return
+        self._launch()
+        self.stopping.clear()
+        self.supervisor = threading.Thread(target=self._supervise, name="audio-supervisor", daemon=True)
+        self.supervisor.start()
+
+    def _launch(self):
+        self.commands = self.context.Queue()
+        ready = self.context.Event()
+        self.process = self.context.Process(target=_engine_main, name="theremin-audio",
+                                            args=(self.shm.name, self.commands, ready, self.config), daemon=True)
+        self.process.start()
+        # Los comandos en cola se aplican en cuanto el motor arranca
+        for command, kwargs in self.sticky_commands.items():
+            self.commands.put((command, kwargs))
+        if not ready.wait(self.start_timeout):
+            self.process.terminate()
+            self.process.join()
+            raise RuntimeError("El proceso de audio no arrancó (¿dispositivo de audio disponible?)")
+        print(f"Motor de audio iniciado en el proceso {self.process.pid}")
+
+    # Vuelca los tiempos del callback en las métricas y relanza el motor si termina inesperadamente
+    def _supervise(self):
+        while not self.stopping.wait(0.2):
+            self._drain_timings()
+            if self.process.is_alive():
+                continue
+            if self.restarts >= self.max_restarts:
+                print(f"Advertencia: el proceso de audio terminó (código {self.process.exitcode}) y no se relanza más")
+                return
+            self.restarts += 1
+            print(f"Advertencia: el proceso de audio terminó (código {self.process.exitcode}), "
+                  f"relanzando ({self.restarts}/{self.max_restarts})")
+            if self.metrics is not None:
+                self.metrics.set_counter('audio_process_restarts', self.restarts)
+            try:
+                self._launch()
+            except RuntimeError as e:
+                print(f"Advertencia: {e}")
+                return
+
+    def _drain_timings(self):
+        if self.metrics is None:
+            return
+        status = self.status
+        count = int(status['timing_count'])
+        # Si el supervisor se retrasa más que el anillo, los tiempos más antiguos se pierden
+        first = max(self.last_timing_count, count - TIMING_SLOTS)
+        timings = status['timings']
+        starts = status['timing_starts']
+        # Los tramos del motor van a la traza con su instante real y el pid del proceso de audio
+        # (perf_counter usa el reloj monótono del sistema, comparable entre procesos)
+        tracer = self.metrics.tracer
+        pid = self.process.pid
+        for i in range(first, count):
+            seconds = float(timings[i % TIMING_SLOTS])
+            self.metrics.record('audio_callback', seconds, traced=False)
+            if tracer is not None:
+                start = float(starts[i % TIMING_SLOTS])
+                tracer.add_span('audio_callback', start, start + seconds, pid=pid, tid=0)
+        self.last_timing_count = count
+        if tracer is not None and pid not in tracer.process_names:
+            tracer.name_process(pid, 'audio engine')
+            tracer.name_thread(pid, 0, 'audio callback')
+
+        # Los underflows solo se cuentan: en la traza aparecen en el momento del volcado (hasta 0.2 s después)
+        underflows = int(status['underflows'])
+        for _ in range(underflows - self.last_underflows):
+            self.metrics.record_audio_underflow(traced=False)
+            if tracer is not None:
+                tracer.instant('audio_underflow', pid=pid, tid=0)
+        self.last_underflows = underflows
+
+    def stop(self):
+        self.stopping.set()
+        if self.supervisor is not None:
+            self.supervisor.join()
+            self.supervisor = None
+        if self.process is not None:
+            if self.process.is_alive():
+                self.commands.put(('stop', {}))
+                self.process.join(timeout=2.0)
+                if self.process.is_alive():
+                    self.process.terminate()
+                    self.process.join()
+            self.process = None
+        print("Sintetizador detenido")
+
+    def cleanup(self):
+        self.stop()
+        self.stop_recording()
+        if self.shm is not None:
+            self.control = self.status = self.state = None
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    # Misma semántica que ThereminSynthesizer.update_position: None = mano no detectada
+    def update_position(self, right_hand_y, left_hand_x):
+        _write_fields(self.control, {
+            'position_count': int(self.control['position_count']) + 1,
+            'right_hand_y': np.nan if right_hand_y is None else right_hand_y,
+            'left_hand_x': np.nan if left_hand_x is None else left_hand_x,
+        })
+
+    def update_parameters(self, vibrato_depth=None, delay_seconds=None, reverb_mix=None):
+        values = {name: value for name, value in (('vibrato_depth', vibrato_depth), ('delay_seconds', delay_seconds),
+                                                  ('reverb_mix', reverb_mix)) if value is not None}
+        if values:
+            _write_fields(self.control, values)
+
+    def _send(self, command, **kwargs):
+        self.sticky_commands[command] = kwargs
+        if self.process is not None and self.process.is_alive():
+            self.commands.put((command, kwargs))
+
+    def set_reverb_mode(self, mode, impulse_response=None):
+        if mode not in ('echo', 'convolution'):
+            raise ValueError(f"Modo de reverb desconocido: {mode} (opciones: echo, convolution)")
+        self._send('set_reverb_mode', mode=mode, impulse_response=impulse_response)
+        self.reverb_mode = mode
+
+    # Los efectos se envían por pickle y se preparan en el motor; sus tiempos por efecto quedan en ese proceso
+    def set_effects(self, effects=(), post_effects=()):
+        self._send('set_effects', effects=tuple(effects), post_effects=tuple(post_effects))
+
+    def set_quantization(self, scale=None, root='C', glide_time=None, custom_steps=None):
+        self._send('set_quantization', scale=scale, root=root, glide_time=glide_time, custom_steps=custom_steps)
+        self.scale = scale
+
+    # Misma interfaz que ThereminSynthesizer: el anillo está en memoria compartida, el motor escribe en él
+    # y el hilo escritor de este proceso lo vuelca al fichero
+    def start_recording(self, path, **options):
+        self.stop_recording()
+        self.audio_recorder = AsyncAudioRecorder(path, sample_rate=self.sample_rate, metrics=self.metrics, **options)
+        self._send('attach_record_ring', ring=self.audio_recorder.ring)
+        return self.audio_recorder
+
+    def stop_recording(self):
+        recorder = self.audio_recorder
+        if recorder is None:
+            return None
+        self.audio_recorder = None
+        self._send('attach_record_ring', ring=None)
+        recorder.release()
+        return recorder.get_stats()
+
+    def get_current_note_name(self):
+        return self.get_info()['note']
+
+    def get_info(self):
+        status = _read_fields(self.status, _STATUS_FIELDS)
+        frequency = status['sounding_frequency'] if self.scale is not None else status['current_frequency']
+        if frequency != self._note_cache[0]:
+            name, cents = self.note_table.lookup(frequency)
+            self._note_cache = (frequency, name, cents)
+        _, note, cents = self._note_cache
+
+        return {
+            'frequency': frequency,
+            'volume': status['current_volume'] * 100,
+            'note': note,
+            'cents': cents,
+            'scale': self.scale,
+            'is_playing': self.is_playing,
+            'vibrato_depth': status['vibrato_depth'],
+            'delay_seconds': status['delay_seconds'],
+            'reverb_mode': self.reverb_mode,
+            'reverb_mix': status['reverb_mix']
+        }
@@ -0,0 +1,296 @@
+"""
+Grabación del audio sintetizado sin bloquear el callback
+El callback copia cada bloque en un anillo preasignado en memoria compartida (un productor, un consumidor,
+sin locks: cada lado solo escribe su propio contador) y un hilo escritor lo vacía a un WAV PCM de 16 bits
+en bloques grandes. Si el anillo se llena el bloque se descarta y se cuenta como desbordamiento; el callback
+nunca espera ni reserva memoria. El hilo escritor rellena cada hueco con el mismo número de muestras de silencio
+en su posición, así la posición en el fichero sigue siendo el tiempo transcurrido (el audio no se adelanta al video).
+
+Al estar en memoria compartida el mismo anillo sirve cuando el audio se genera en otro proceso (audio_process).
+"""
+
+import threading
+import wave
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Huecos recordados por el anillo (posición y descartes acumulados); si el escritor se retrasa más huecos que estos,
+# el silencio de los perdidos se inserta en el siguiente que conserve
+GAP_SLOTS = 64
+
+RING_HEADER_DTYPE = np.dtype([
+    ('written', 'u8'),      # muestras escritas en total (solo lo modifica el productor)
+    ('read', 'u8'),         # muestras leídas en total (solo lo modifica el consumidor)
+    ('overflows', 'u8'),    # bloques descartados por anillo lleno
+    ('dropped', 'u8'),      # muestras descartadas en total
+    ('first_time', 'f8'),   # perf_counter del primer bloque escrito (NaN = todavía ninguno)
+    ('gap_count', 'u8'),    # huecos registrados (el último se amplía si el siguiente descarte cae en la misma posición)
+    ('gap_position', 'u8', (GAP_SLOTS,)),  # valor de written cuando se produjo el hueco
+    ('gap_dropped', 'u8', (GAP_SLOTS,)),   # valor de dropped después del hueco (acumulado)
+])
+
+# Alineación del inicio de las muestras dentro del bloque compartido
+_ALIGNMENT = 64
+
+
+# Anillo de muestras float32 en memoria compartida, un productor y un consumidor
+class AudioRingBuffer:
+
+    def __init__(self, capacity, name=None, _create=True):
+        self.capacity = int(capacity)
+        self.owner = _create
+        self.data_offset = -(-RING_HEADER_DTYPE.itemsize // _ALIGNMENT) * _ALIGNMENT
+        size = self.data_offset + self.capacity * 4
+        if _create:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.header = np.ndarray((), dtype=RING_HEADER_DTYPE, buffer=self.shm.buf)
+        self.data = np.ndarray(self.capacity, dtype=np.float32, buffer=self.shm.buf, offset=self.data_offset)
+        if _create:
+            self.header[()] = np.zeros((), dtype=RING_HEADER_DTYPE)
+            self.header['first_time'] = np.nan
+
+    # Se pasa a otro proceso (p.ej. en un comando del motor de audio) por nombre
+    def __getstate__(self):
+        return {'capacity': self.capacity, 'name': self.shm.name}
+
+    def __setstate__(self, state):
+        self.__init__(state['capacity'], name=state['name'], _create=False)
+
+    # --- Productor (callback de audio) ---
+
+    # Copia un bloque en el anillo. Coste proporcional al bloque y sin esperas; False si no cabía (descartado)
+    def write(self, samples, timestamp=None):
+        header = self.header
+        data = self.data
+        if data is None:
+            return False
+        count = len(samples)
+        written = int(header['written'])
+        if count > self.capacity - (written - int(header['read'])):
+            header['overflows'] += 1
+            dropped = int(header['dropped']) + count
+            header['dropped'] = dropped
+            # Se anota dónde falta el bloque; con el anillo lleno written no avanza y los descartes seguidos
+            # amplían el mismo hueco. El contador se publica después de la entrada
+            gaps = int(header['gap_count'])
+            if gaps > 0 and int(header['gap_position'][(gaps - 1) % GAP_SLOTS]) == written:
+                header['gap_dropped'][(gaps - 1) % GAP_SLOTS] = dropped
+            else:
+                header['gap_position'][gaps % GAP_SLOTS] = written
+                header['gap_dropped'][gaps % GAP_SLOTS] = dropped
+                header['gap_count'] = gaps + 1
+            return False
+        if written == 0 and timestamp is not None:
+            header['first_time'] = timestamp
+        start = written % self.capacity
+        first = min(count, self.capacity - start)
+        data[start:start + first] = samples[:first]
+        if first < count:
+            data[:count - first] = samples[first:]
+        # El contador se publica después de copiar las muestras
+        header['written'] = written + count
+        return True
+
+    # --- Consumidor (hilo escritor) ---
+
+    def available(self):
+        return int(self.header['written']) - int(self.header['read'])
+
+    # Copia hasta len(out) muestras en out y las libera. Devuelve cuántas copió
+    def read_into(self, out):
+        header = self.header
+        read = int(header['read'])
+        count = min(len(out), int(header['written']) - read)
+        start = read % self.capacity
+        first = min(count, self.capacity - start)
+        out[:first] = self.data[start:start + first]
+        if first < count:
+            out[first:count] = self.data[:count - first]
+        header['read'] = read + count
+        return count
+
+    # Siguiente hueco a partir del índice gap_index: (índice, posición, descartes acumulados) o None.
+    # Si el productor ya ha reutilizado su entrada se salta al más antiguo que se conserva
+    def next_gap(self, gap_index):
+        header = self.header
+        gaps = int(header['gap_count'])
+        if gap_index >= gaps:
+            return None
+        gap_index = max(gap_index, gaps - GAP_SLOTS)
+        slot = gap_index % GAP_SLOTS
+        return gap_index, int(header['gap_position'][slot]), int(header['gap_dropped'][slot])
+
+    # Descarta hasta count muestras sin leerlas. Devuelve cuántas descartó
+    def skip(self, count):
+        header = self.header
+        read = int(header['read'])
+        count = min(count, int(header['written']) - read)
+        header['read'] = read + count
+        return count
+
+    @property
+    def overflows(self):
+        return int(self.header['overflows'])
+
+    @property
+    def dropped(self):
+        return int(self.header['dropped'])
+
+    @property
+    def first_time(self):
+        return float(self.header['first_time'])
+
+    # Cierra la conexión; el creador además libera la memoria compartida
+    def close(self):
+        if self.shm is None:
+            return
+        # Primero los datos: el productor comprueba data después de leer header
+        self.data = None
+        self.header = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # El callback todavía tiene una vista del anillo; la memoria se libera cuando la suelte
+            pass
+        if self.owner:
+            self.shm.unlink()
+        self.shm = None
+
+
+class AsyncAudioRecorder:
+
+    # ring_seconds: capacidad del anillo (margen si el disco se atasca); chunk_seconds: cada cuánto escribe el hilo
+    # wait_for_start: no escribe nada hasta align_start() (p.ej. para empezar a la vez que el video)
+    def __init__(self, path, sample_rate=44100, ring_seconds=10.0, chunk_seconds=0.5, wait_for_start=False,
+                 metrics=None):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.chunk_seconds = chunk_seconds
+        self.metrics = metrics
+        self.ring = AudioRingBuffer(int(ring_seconds * sample_rate))
+
+        self.file = wave.open(path, 'wb')
+        self.file.setnchannels(1)
+        self.file.setsampwidth(2)
+        self.file.setframerate(sample_rate)
+
+        # Buffers del hilo escritor, reutilizados en cada bloque
+        chunk = max(1, int(chunk_seconds * sample_rate))
+        self.chunk = np.empty(chunk, dtype=np.float32)
+        self.pcm = np.empty(chunk, dtype='<i2')
+
+        self.start_time = None
+        self.waiting_start = wait_for_start
+        self.pending_skip = None  # Muestras que sobran (o faltan, negativo) al principio para alinear con start_time
+        self.samples_written = 0
+        self.gap_index = 0  # Siguiente hueco del anillo por rellenar
+        self.gap_filled = 0  # Muestras de silencio ya insertadas por huecos (o descontadas del salto inicial)
+        self.max_fill = 0
+        self.final_overflows = None  # Copias de los contadores al cerrar el anillo
+        self.final_dropped = None
+        self.stop_event = threading.Event()
+
+        self.thread = threading.Thread(target=self._writer_loop, name='AsyncAudioRecorder', daemon=True)
+        self.thread.start()
+
+    # Fija el instante (perf_counter) que corresponde a la primera muestra del fichero, p.ej. el primer frame
+    # grabado en video. Lo anterior se descarta; si el audio empezó después se rellena con silencio
+    def align_start(self, timestamp):
+        self.start_time = timestamp
+        self.waiting_start = False
+
+    # Calcula el desfase del principio en cuanto se conocen el primer bloque y el instante de inicio
+    def _resolve_start(self):
+        first_time = self.ring.first_time
+        if self.waiting_start or np.isnan(first_time):
+            return False
+        if self.start_time is None:
+            self.start_time = first_time
+        self.pending_skip = int(round((self.start_time - first_time) * self.sample_rate))
+        return True
+
+    def _write_pcm(self, samples):
+        pcm = self.pcm[:len(samples)]
+        np.multiply(samples, 32767.0, out=samples)
+        np.clip(samples, -32768, 32767, out=samples)
+        pcm[:] = samples
+        self.file.writeframes(memoryview(pcm))
+        self.samples_written += len(samples)
+
+    def _write_silence(self, count):
+        while count > 0:
+            block = min(count, len(self.chunk))
+            self.chunk[:block] = 0.0
+            self._write_pcm(self.chunk[:block])
+            count -= block
+
+    def _drain(self):
+        ring = self.ring
+        self.max_fill = max(self.max_fill, ring.available())
+        if self.pending_skip is None and not self._resolve_start():
+            return
+        if self.pending_skip < 0:
+            # El audio empezó después del instante de inicio: silencio hasta ese momento
+            self._write_silence(-self.pending_skip)
+            self.pending_skip = 0
+        while True:
+            # Se lee como mucho hasta el siguiente hueco; al llegar a él se inserta su silencio
+            limit = len(self.chunk)
+            gap = ring.next_gap(self.gap_index)
+            if gap is not None:
+                gap_index, position, dropped = gap
+                read = int(ring.header['read'])
+                if read >= position:
+                    silence = dropped - self.gap_filled
+                    self.gap_filled = dropped
+                    self.gap_index = gap_index + 1
+                    # Los huecos anteriores al instante de inicio cuentan como parte de lo que se salta
+                    skipped = min(silence, self.pending_skip)
+                    self.pending_skip -= skipped
+                    self._write_silence(silence - skipped)
+                    continue
+                limit = min(limit, position - read)
+            if self.pending_skip > 0:
+                count = ring.skip(min(self.pending_skip, limit))
+                self.pending_skip -= count
+            else:
+                count = ring.read_into(self.chunk[:limit])
+                if count > 0:
+                    self._write_pcm(self.chunk[:count])
+            if count == 0:
+                break
+        if self.metrics is not None:
+            self.metrics.set_counter('audio_record_overflows', ring.overflows)
+
+    def _writer_loop(self):
+        while not self.stop_event.wait(self.chunk_seconds):
+            self._drain()
+        # Lo que quede en el anillo al parar también se escribe
+        self.waiting_start = False
+        self._drain()
+        # Descartes que el productor anotó después de que se rellenara su hueco (carrera con la última lectura)
+        if self.pending_skip is not None:
+            self._write_silence(max(0, self.ring.dropped - self.gap_filled - max(self.pending_skip, 0)))
+
+    def get_stats(self):
+        return {
+            'seconds_written': self.samples_written / self.sample_rate,
+            'overflows': self.ring.overflows if self.final_overflows is None else self.final_overflows,
+            'dropped_seconds': (self.ring.dropped if self.final_dropped is None else self.final_dropped)
+                               / self.sample_rate,
+            'max_fill_seconds': self.max_fill / self.sample_rate,
+        }
+
+    # Vacía el anillo, cierra el fichero y libera la memoria compartida
+    def release(self):
+        if self.stop_event.is_set():
+            return
+        self.stop_event.set()
+        self.thread.join()
+        self.file.close()
+        self.final_overflows = self.ring.overflows
+        self.final_dropped = self.ring.dropped
+        self.ring.close()
@@ -0,0 +1,147 @@
+"""
+Reverb por convolución con partición uniforme (overlap-add en el dominio de la frecuencia)
+La respuesta al impulso (IR) se divide en particiones del tamaño del bloque de audio; sus espectros
+se calculan una sola vez y en cada bloque solo hay una FFT directa, una inversa y una suma de productos
+sobre la línea de retardo de espectros (FDL). El coste por bloque es constante y cabe en el callback.
+"""
+
+import wave
+
+import numpy as np
+
+# numpy >= 2.0 acepta out= en np.fft: los espectros y las salidas se escriben en los buffers preasignados.
+# Con versiones anteriores el resultado se copia (una reserva temporal por FFT)
+try:
+    np.fft.rfft(np.zeros(2, dtype=np.float32), out=np.empty(2, dtype=np.complex64))
+    FFT_OUT = True
+except TypeError:
+    FFT_OUT = False
+
+
+def rfft_into(signal, out):
+    if FFT_OUT:
+        np.fft.rfft(signal, out=out)
+    else:
+        out[:] = np.fft.rfft(signal)
+
+
+def irfft_into(spectrum, n, out):
+    if FFT_OUT:
+        np.fft.irfft(spectrum, n=n, out=out)
+    else:
+        out[:] = np.fft.irfft(spectrum, n=n)
+
+
+# Convolución por bloques de tamaño fijo con una IR precalculada
+class PartitionedConvolver:
+
+    def __init__(self, impulse_response, block_size):
+        impulse_response = np.asarray(impulse_response, dtype=np.float32)
+        self.impulse_response = impulse_response
+        self.block_size = block_size
+        self.fft_size = 2 * block_size
+        self.num_partitions = max(1, int(np.ceil(len(impulse_response) / block_size)))
+        bins = block_size + 1
+
+        # Espectros de cada partición, guardados en orden inverso para poder sumar la FDL circular con dos slices
+        padded = np.zeros(self.num_partitions * block_size, dtype=np.float32)
+        padded[:len(impulse_response)] = impulse_response
+        partitions = padded.reshape(self.num_partitions, block_size)
+        spectra = np.fft.rfft(partitions, n=self.fft_size, axis=1).astype(np.complex64)
+        self.reversed_spectra = np.ascontiguousarray(spectra[::-1])
+
+        # Buffers reutilizados en cada bloque
+        self.fdl = np.zeros((self.num_partitions, bins), dtype=np.complex64)  # espectros de entrada recientes
+        self.fdl_index = 0
+        self.input_buffer = np.zeros(self.fft_size, dtype=np.float32)  # bloque + ceros
+        self.accumulator = np.zeros(bins, dtype=np.complex64)
+        self.scratch = np.zeros(bins, dtype=np.complex64)
+        self.tail = np.zeros(block_size, dtype=np.float32)  # cola del overlap-add
+        self.result = np.zeros(self.fft_size, dtype=np.float32)  # salida de la FFT inversa
+        self.output = np.zeros(block_size, dtype=np.float32)
+
+    # Procesa exactamente block_size muestras. Devuelve un array interno (se sobrescribe en la siguiente llamada)
+    def process_block(self, block):
+        B = self.block_size
+        P = self.num_partitions
+
+        self.input_buffer[:B] = block
+        rfft_into(self.input_buffer, self.fdl[self.fdl_index])
+
+        # Suma de X[n-k] * H[k]: la ranura fdl_index es la más reciente (k=0)
+        pos = self.fdl_index
+        np.einsum('kf,kf->f', self.fdl[:pos + 1], self.reversed_spectra[P - 1 - pos:], out=self.accumulator)
+        if pos + 1 < P:
+            np.einsum('kf,kf->f', self.fdl[pos + 1:], self.reversed_spectra[:P - 1 - pos], out=self.scratch)
+            self.accumulator += self.scratch
+
+        result = self.result
+        irfft_into(self.accumulator, self.fft_size, result)
+        np.add(result[:B], self.tail, out=self.output)
+        self.tail[:] = result[B:]
+
+        self.fdl_index = (pos + 1) % P
+        return self.output
+
+    # Procesa un bloque de cualquier múltiplo de block_size. Con out (mismo tamaño que signal) no reserva memoria
+    def process(self, signal, out=None):
+        if out is None:
+            if len(signal) == self.block_size:
+                return self.process_block(signal)
+            out = np.empty(len(signal), dtype=np.float32)
+        for start in range(0, len(signal), self.block_size):
+            out[start:start + self.block_size] = self.process_block(signal[start:start + self.block_size])
+        return out
+
+    def reset(self):
+        self.fdl[:] = 0
+        self.tail[:] = 0
+        self.fdl_index = 0
+
+
+# IR sintética: ruido con decaimiento exponencial (T60 = decay_seconds), normalizada a energía unidad
+def synthetic_impulse_response(sample_rate=44100, decay_seconds=1.5, seed=0):
+    length = int(sample_rate * decay_seconds)
+    t = np.arange(length) / sample_rate
+    rng = np.random.default_rng(seed)
+    # -60 dB en decay_seconds
+    envelope = np.exp(-6.907755 * t / decay_seconds)
+    ir = rng.standard_normal(length) * envelope
+    # Pequeño pre-delay sin reflexiones para separar la señal seca de la cola
+    ir[:int(0.01 * sample_rate)] = 0.0
+    return (ir / np.sqrt(np.sum(ir ** 2))).astype(np.float32)
+
+
+# Carga una IR desde un WAV PCM (8/16/24/32 bits), la pasa a mono, la remuestrea si hace falta y la normaliza
+def load_impulse_response(path, sample_rate=44100):
+    with wave.open(path, 'rb') as f:
+        channels = f.getnchannels()
+        sample_width = f.getsampwidth()
+        file_rate = f.getframerate()
+        raw = f.readframes(f.getnframes())
+
+    if sample_width == 1:
+        data = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif sample_width == 2:
+        data = np.frombuffer(raw, dtype='<i2').astype(np.float32) / 32768
+    elif sample_width == 3:
+        bytes_ = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)
+        ints = (bytes_[:, 0].astype(np.int32) | (bytes_[:, 1].astype(np.int32) << 8)
+                | (bytes_[:, 2].astype(np.int32) << 16))
+        ints = np.where(ints & 0x800000, ints - 0x1000000, ints)
+        data = ints.astype(np.float32) / 8388608
+    elif sample_width == 4:
+        data = np.frombuffer(raw, dtype='<i4').astype(np.float32) / 2147483648
+    else:
+        raise ValueError(f"Formato WAV no soportado en {path}: {sample_width * 8} bits")
+
+    data = data.reshape(-1, channels).mean(axis=1)
+    if file_rate != sample_rate:
+        duration = len(data) / file_rate
+        new_length = int(round(duration * sample_rate))
+        data = np.interp(np.linspace(0, len(data) - 1, new_length), np.arange(len(data)), data)
+
+    energy = np.sqrt(np.sum(data ** 2))
+    if energy == 0:
+        raise ValueError(f"La respuesta al impulso de {path} está vacía")
+    return (data / energy).astype(np.float32)
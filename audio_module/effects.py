@@ -0,0 +1,455 @@
+"""
+Cadena de efectos DSP procesada por bloques
+Cada efecto modifica el bloque float32 in situ usando buffers reservados en prepare(), fuera del callback.
+EffectChain los aplica en orden y mide el tiempo de CPU de cada uno para poder comprobar que la cadena
+cabe en el tiempo de un bloque. Para cambiar la cadena en marcha se construye y prepara una nueva y se
+sustituye la referencia de golpe: el callback usa la que leyó al empezar el bloque, y los efectos que
+siguen en la cadena nueva conservan su estado (sin cortes en el eco ni en la cola de la reverb).
+Un bloque mayor que lo preparado se procesa por trozos de block_size: el callback nunca reserva memoria ni
+reconstruye nada.
+"""
+
+import math
+import time
+
+import numpy as np
+
+from convolution_reverb import PartitionedConvolver, irfft_into, rfft_into
+
+
+# Base de los efectos: prepare() reserva los buffers para bloques de hasta block_size muestras y process()
+# transforma el bloque in situ. Los parámetros se pueden cambiar en marcha con los métodos set_*
+class Effect:
+
+    name = 'effect'
+
+    def __init__(self, name=None):
+        if name is not None:
+            self.name = name
+        self.enabled = True
+        self.sample_rate = None
+        self.block_size = 0
+        self.dry_blocks = 0  # Bloques que el efecto dejó pasar sin procesar porque no encajaban con lo preparado
+
+    # Sin coste si ya estaba preparado para el mismo formato (un efecto puede pasar de una cadena a otra)
+    def prepare(self, sample_rate, block_size):
+        if sample_rate == self.sample_rate and block_size <= self.block_size:
+            return
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.allocate()
+
+    # Reserva los buffers y el estado (lo llama prepare cuando cambia el formato)
+    def allocate(self):
+        pass
+
+    def process(self, block):
+        raise NotImplementedError
+
+    def reset(self):
+        pass
+
+
+# Ganancia fija (la de salida del sintetizador evita saturar)
+class Gain(Effect):
+
+    name = 'gain'
+
+    def __init__(self, gain=1.0, name=None):
+        super().__init__(name)
+        self.gain = gain
+
+    def process(self, block):
+        block *= self.gain
+
+
+# Filtro de variables de estado (SVF con integradores trapezoidales): paso bajo, banda o alto con resonancia.
+# La recursión muestra a muestra se resuelve por bloques: la salida es la respuesta al estado inicial más la
+# convolución del bloque con la respuesta al impulso, ambas precalculadas al cambiar la frecuencia de corte
+class StateVariableFilter(Effect):
+
+    name = 'svf'
+    MODES = ('lowpass', 'bandpass', 'highpass')
+
+    def __init__(self, mode='lowpass', cutoff=2000.0, resonance=0.707, name=None):
+        super().__init__(name)
+        if mode not in self.MODES:
+            raise ValueError(f"Modo de filtro desconocido: {mode} (opciones: {', '.join(self.MODES)})")
+        self.mode = mode
+        self.cutoff = cutoff
+        self.resonance = resonance
+        self.state = np.zeros(2, dtype=np.float64)  # Memorias de los dos integradores
+        self.tables = None
+
+    def allocate(self):
+        N = self.block_size
+        self.state[:] = 0.0
+        self.input = np.zeros(2 * N, dtype=np.float64)  # bloque + ceros para la FFT
+        self.spectrum = np.zeros(N + 1, dtype=np.complex128)
+        self.forced = np.zeros(2 * N, dtype=np.float64)  # convolución del bloque con la respuesta al impulso
+        self.state_term = np.zeros(N, dtype=np.float64)  # respuesta al estado inicial
+        self.new_state = np.zeros(2, dtype=np.float64)
+        self.input_state = np.zeros(2, dtype=np.float64)
+        self.tables = self._compute_tables(self.cutoff, self.resonance)
+
+    # Cambia la frecuencia de corte y/o la resonancia. Las tablas se calculan aquí y se sustituyen de golpe
+    def set_parameters(self, cutoff=None, resonance=None):
+        if cutoff is not None:
+            self.cutoff = cutoff
+        if resonance is not None:
+            self.resonance = resonance
+        if self.sample_rate is not None:
+            self.tables = self._compute_tables(self.cutoff, self.resonance)
+
+    # Sistema de estados s[n+1] = A s[n] + B x[n], y[n] = C s[n] + D x[n] y sus potencias hasta block_size
+    def _compute_tables(self, cutoff, resonance):
+        N = self.block_size
+        cutoff = min(max(cutoff, 10.0), 0.49 * self.sample_rate)
+        g = math.tan(math.pi * cutoff / self.sample_rate)
+        k = 1.0 / max(resonance, 0.05)
+        a1 = 1.0 / (1.0 + g * (g + k))
+        a2 = g * a1
+        a3 = g * a2
+
+        A = np.array([[2 * a1 - 1, -2 * a2], [2 * a2, 1 - 2 * a3]])
+        B = np.array([2 * a2, 2 * a3])
+        if self.mode == 'lowpass':
+            C, D = np.array([a2, 1 - a3]), a3
+        elif self.mode == 'bandpass':
+            C, D = np.array([a1, -a2]), a2
+        else:
+            C, D = np.array([-k * a1 - a2, k * a2 - (1 - a3)]), 1 - k * a2 - a3
+
+        # powers[m] = A^m, m = 0..N
+        powers = np.empty((N + 1, 2, 2))
+        powers[0] = np.eye(2)
+        for m in range(N):
+            powers[m + 1] = A @ powers[m]
+        state_response = np.einsum('j,njk->nk', C, powers[:N])       # fila n: C A^n
+        input_powers = powers[:N] @ B                                # fila m: A^m B
+        impulse = np.empty(N)
+        impulse[0] = D
+        impulse[1:] = input_powers[:N - 1] @ C
+        spectrum = np.fft.rfft(impulse, n=2 * N)
+        # Filas en orden inverso: el estado final es A^n s + sum_k A^(n-1-k) B x[k]
+        return powers, state_response, np.ascontiguousarray(input_powers[::-1]), impulse, spectrum
+
+    # Todo sobre los buffers de allocate(). Un bloque menor que N también va por la FFT de 2N: con ceros detrás,
+    # sus n primeras salidas solo dependen de impulse[:n]
+    def process(self, block):
+        powers, state_response, reversed_input_powers, impulse, spectrum = self.tables
+        n = len(block)
+        N = self.block_size
+        state = self.state
+        self.input[:n] = block
+        self.input[n:] = 0.0
+        rfft_into(self.input, self.spectrum)
+        self.spectrum *= spectrum
+        irfft_into(self.spectrum, 2 * N, self.forced)
+        forced = self.forced[:n]
+
+        # Estado al final del bloque: A^n s + sum_k A^(n-1-k) B x[k]
+        np.matmul(powers[n], state, out=self.new_state)
+        np.matmul(self.input[:n], reversed_input_powers[N - n:], out=self.input_state)
+        self.new_state += self.input_state
+
+        state_term = self.state_term[:n]
+        np.matmul(state_response[:n], state, out=state_term)
+        forced += state_term
+        block[:] = forced
+        state[:] = self.new_state
+
+    def reset(self):
+        self.state[:] = 0.0
+
+
+# Chorus: una copia retrasada unos milisegundos con el retardo modulado por un LFO (interpolación lineal)
+class Chorus(Effect):
+
+    name = 'chorus'
+
+    def __init__(self, rate=0.8, delay_ms=15.0, depth_ms=4.0, mix=0.5, name=None):
+        super().__init__(name)
+        # Con depth_ms >= delay_ms la lectura alcanzaría la posición de escritura (muestras aún no escritas)
+        if not 0 <= depth_ms < delay_ms:
+            raise ValueError(f"La profundidad del chorus debe ser menor que el retardo ({depth_ms}, {delay_ms} ms)")
+        self.rate = rate
+        self.delay_ms = delay_ms
+        self.depth_ms = depth_ms
+        self.mix = mix
+        self.lfo_phase = 0.0
+
+    def allocate(self):
+        B = self.block_size
+        # Cabe el retardo máximo más un bloque (el bloque se escribe antes de leer)
+        self.size = int(math.ceil((self.delay_ms + self.depth_ms) * 1e-3 * self.sample_rate)) + B + 2
+        self.buffer = np.zeros(self.size, dtype=np.float32)
+        self.write_index = 0
+        self.lfo_phase = 0.0
+        self.ramp = np.arange(B, dtype=np.float64)
+        self.positions = np.empty(B, dtype=np.float64)
+        self.fraction = np.empty(B, dtype=np.float64)
+        self.indices = np.empty(B, dtype=np.int64)
+        self.next_indices = np.empty(B, dtype=np.int64)
+        self.taps = np.empty(B, dtype=np.float32)
+        self.wet = np.empty(B, dtype=np.float32)
+
+    def process(self, block):
+        n = len(block)
+        size = self.size
+        start = self.write_index
+        first = min(n, size - start)
+        self.buffer[start:start + first] = block[:first]
+        self.buffer[:n - first] = block[first:]
+
+        # Retardo de cada muestra (en muestras) y posición de lectura en el buffer circular
+        positions = self.positions[:n]
+        increment = 2 * math.pi * self.rate / self.sample_rate
+        np.multiply(self.ramp[:n], increment, out=positions)
+        positions += self.lfo_phase
+        self.lfo_phase = (self.lfo_phase + n * increment) % (2 * math.pi)
+        np.sin(positions, out=positions)
+        positions *= -self.depth_ms * 1e-3 * self.sample_rate
+        positions += start - self.delay_ms * 1e-3 * self.sample_rate + size
+        positions += self.ramp[:n]
+
+        fraction = self.fraction[:n]
+        indices = self.indices[:n]
+        next_indices = self.next_indices[:n]
+        np.floor(positions, out=fraction)
+        np.copyto(indices, fraction, casting='unsafe')
+        np.subtract(positions, fraction, out=fraction)
+        np.remainder(indices, size, out=indices)
+        np.add(indices, 1, out=next_indices)
+        np.remainder(next_indices, size, out=next_indices)
+
+        # wet = a + (b - a) * fraction
+        taps = self.taps[:n]
+        wet = self.wet[:n]
+        np.take(self.buffer, indices, out=wet)
+        np.take(self.buffer, next_indices, out=taps)
+        taps -= wet
+        np.multiply(taps, fraction, out=taps, casting='same_kind')
+        wet += taps
+        wet *= self.mix
+        block += wet
+        self.write_index = (start + n) % size
+
+    def reset(self):
+        self.buffer[:] = 0.0
+        self.lfo_phase = 0.0
+
+
+# Limitador suave: por debajo de threshold no toca la señal; por encima la curva tanh la acerca a ceiling
+# sin llegar a superarlo
+class SoftLimiter(Effect):
+
+    name = 'limiter'
+
+    def __init__(self, threshold=0.8, ceiling=1.0, name=None):
+        super().__init__(name)
+        if not 0 < threshold < ceiling:
+            raise ValueError(f"El umbral del limitador debe estar entre 0 y ceiling ({threshold}, {ceiling})")
+        self.threshold = threshold
+        self.ceiling = ceiling
+
+    def allocate(self):
+        self.magnitude = np.empty(self.block_size, dtype=np.float32)
+        self.excess = np.empty(self.block_size, dtype=np.float32)
+
+    def process(self, block):
+        n = len(block)
+        knee = self.ceiling - self.threshold
+        magnitude = self.magnitude[:n]
+        excess = self.excess[:n]
+        np.abs(block, out=magnitude)
+        np.subtract(magnitude, self.threshold, out=excess)
+        np.maximum(excess, 0.0, out=excess)
+        excess *= 1.0 / knee
+        np.tanh(excess, out=excess)
+        excess *= knee
+        np.minimum(magnitude, self.threshold, out=magnitude)
+        magnitude += excess
+        np.copysign(magnitude, block, out=block)
+
+
+# Eco con realimentación. El buffer se reserva para el retardo máximo: cambiar el retardo solo mueve
+# la posición de lectura, sin reservar memoria ni borrar el eco que ya suena
+class EchoDelay(Effect):
+
+    name = 'delay'
+
+    def __init__(self, delay_seconds=0.2, feedback=0.4, mix=0.3, max_delay_seconds=2.0, name=None):
+        super().__init__(name)
+        self.delay_seconds = delay_seconds
+        self.feedback = feedback
+        self.mix = mix
+        self.max_delay_seconds = max_delay_seconds
+
+    def allocate(self):
+        B = self.block_size
+        self.size = int(self.max_delay_seconds * self.sample_rate) + B
+        self.buffer = np.zeros(self.size, dtype=np.float32)
+        self.write_index = 0
+        self.delayed = np.empty(B, dtype=np.float32)
+        self.feedback_signal = np.empty(B, dtype=np.float32)
+
+    def set_delay(self, delay_seconds):
+        self.delay_seconds = min(max(delay_seconds, 0.0), self.max_delay_seconds)
+
+    def _read(self, out, start):
+        n = len(out)
+        first = min(n, self.size - start)
+        out[:first] = self.buffer[start:start + first]
+        out[first:] = self.buffer[:n - first]
+
+    def _write(self, samples, start):
+        n = len(samples)
+        first = min(n, self.size - start)
+        self.buffer[start:start + first] = samples[:first]
+        self.buffer[:n - first] = samples[first:]
+
+    def process(self, block):
+        n = len(block)
+        # Con retardos menores que el bloque el eco se realimenta una vez por bloque
+        delay = max(int(self.delay_seconds * self.sample_rate), n)
+        start = self.write_index
+        delayed = self.delayed[:n]
+        self._read(delayed, (start - delay) % self.size)
+
+        # Al buffer: señal seca + eco realimentado; a la salida: señal seca + eco mezclado
+        feedback_signal = self.feedback_signal[:n]
+        np.multiply(delayed, self.feedback, out=feedback_signal)
+        feedback_signal += block
+        self._write(feedback_signal, start)
+        delayed *= self.mix
+        block += delayed
+        self.write_index = (start + n) % self.size
+
+    def reset(self):
+        self.buffer[:] = 0.0
+
+
+# Reverb por convolución (ver convolution_reverb.py): señal seca + mix * señal húmeda.
+# partition_size: tamaño de las particiones de la IR (por defecto el bloque preparado). Convoluciona la parte del
+# bloque múltiplo de la partición; si el stream puede entregar varios tamaños, una partición que los divida todos
+# (p.ej. 256 para bloques de 256, 512 y 1024) evita que el resto pase seco
+class ConvolutionReverb(Effect):
+
+    name = 'convolution_reverb'
+
+    def __init__(self, impulse_response, mix=0.3, partition_size=None, name=None):
+        super().__init__(name)
+        self.impulse_response = np.asarray(impulse_response, dtype=np.float32)
+        self.mix = mix
+        self.partition_size = partition_size
+        self.convolver = None
+
+    # Además del formato, las particiones tienen que dividir el nuevo bloque; si no, se vuelven a calcular
+    def prepare(self, sample_rate, block_size):
+        if self.convolver is not None and block_size % self.convolver.block_size != 0:
+            self.sample_rate = None
+        super().prepare(sample_rate, block_size)
+
+    # Los espectros de la IR y todos los buffers se calculan aquí, fuera del callback
+    def allocate(self):
+        partition = self.partition_size or self.block_size
+        if self.block_size % partition != 0:
+            raise ValueError(f"La partición de la reverb ({partition}) no divide el bloque ({self.block_size})")
+        self.convolver = PartitionedConvolver(self.impulse_response, partition)
+        self.wet = np.empty(self.block_size, dtype=np.float32)
+
+    def process(self, block):
+        n = len(block)
+        # Solo se convoluciona la parte múltiplo de la partición; el resto (o un bloque mayor que lo preparado)
+        # pasa seco y se cuenta: recalcular la IR aquí reservaría memoria y borraría la cola en mitad del callback
+        if n > self.block_size:
+            self.dry_blocks += 1
+            return
+        full = n - n % self.convolver.block_size
+        if full < n:
+            self.dry_blocks += 1
+        if full == 0:
+            return
+        wet = self.wet[:full]
+        self.convolver.process(block[:full], out=wet)
+        wet *= self.mix
+        block[:full] += wet
+
+    def reset(self):
+        if self.convolver is not None:
+            self.convolver.reset()
+
+
+# Lista de efectos que se aplica en orden. No se modifica una vez en uso: para cambiarla se crea otra
+class EffectChain:
+
+    def __init__(self, effects=()):
+        self.effects = tuple(effects)
+        self.sample_rate = None
+        self.block_size = 0
+        # Tiempo de CPU por efecto (listas de floats: más baratas que arrays de numpy en el callback)
+        count = len(self.effects)
+        self.last_seconds = [0.0] * count
+        self.total_seconds = [0.0] * count
+        self.max_seconds = [0.0] * count
+        self.blocks = 0
+        # Bloques mayores que lo preparado (se procesan por trozos) y el mayor visto, para prepararlo la próxima vez
+        self.oversized_blocks = 0
+        self.largest_block = 0
+
+    def prepare(self, sample_rate, block_size):
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        for effect in self.effects:
+            effect.prepare(sample_rate, block_size)
+        return self
+
+    # Aplica los efectos activos al bloque in situ. Con metrics cada efecto se registra como etapa 'dsp.<nombre>'
+    def process(self, block, metrics=None):
+        n = len(block)
+        if n <= self.block_size:
+            self._process_block(block, metrics)
+            return block
+        # El stream entrega bloques mayores de lo previsto: reservar aquí bloquearía el callback, así que se procesa
+        # por trozos del tamaño preparado y se anota el tamaño para preparar la siguiente cadena
+        self.oversized_blocks += 1
+        self.largest_block = max(self.largest_block, n)
+        if metrics is not None:
+            metrics.set_counter('dsp_oversized_blocks', self.oversized_blocks)
+        for start in range(0, n, self.block_size):
+            self._process_block(block[start:start + self.block_size], metrics)
+        return block
+
+    def _process_block(self, block, metrics):
+        for i, effect in enumerate(self.effects):
+            if not effect.enabled:
+                continue
+            start = time.perf_counter()
+            effect.process(block)
+            seconds = time.perf_counter() - start
+            self.last_seconds[i] = seconds
+            self.total_seconds[i] += seconds
+            if seconds > self.max_seconds[i]:
+                self.max_seconds[i] = seconds
+            if metrics is not None:
+                metrics.record('dsp.' + effect.name, seconds)
+        self.blocks += 1
+
+    # Tiempo de cada efecto en ms; con budget_seconds (duración de un bloque) también la fracción que consume
+    def get_stats(self, budget_seconds=None):
+        stats = []
+        for i, effect in enumerate(self.effects):
+            mean = self.total_seconds[i] / self.blocks if self.blocks else 0.0
+            item = {
+                'name': effect.name,
+                'enabled': effect.enabled,
+                'last_ms': self.last_seconds[i] * 1000,
+                'mean_ms': mean * 1000,
+                'max_ms': self.max_seconds[i] * 1000,
+                'dry_blocks': effect.dry_blocks,
+            }
+            if budget_seconds:
+                item['budget_share'] = mean / budget_seconds
+            stats.append(item)
+        return stats
@@ -0,0 +1,88 @@
+"""
+Tabla precalculada de notas en temperamento igual y cuantización a escalas
+Evita calcular logaritmos y formatear cadenas en cada consulta: los nombres y frecuencias
+se generan una vez para el rango del sintetizador y se buscan con búsqueda binaria.
+"""
+
+import math
+from bisect import bisect_left
+
+NOTE_NAMES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+
+# Escalas predefinidas como semitonos desde la tónica
+SCALES = {
+    'chromatic': [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11],
+    'major': [0, 2, 4, 5, 7, 9, 11],
+    'minor': [0, 2, 3, 5, 7, 8, 10],
+    'pentatonic': [0, 2, 4, 7, 9],
+    'minor_pentatonic': [0, 3, 5, 7, 10],
+}
+
+A4_MIDI = 69
+
+
+def midi_to_frequency(midi, a4_frequency=440.0):
+    return a4_frequency * 2.0 ** ((midi - A4_MIDI) / 12.0)
+
+
+def midi_to_name(midi):
+    return f"{NOTE_NAMES[midi % 12]}{midi // 12 - 1}"
+
+
+# Tabla de notas entre min_frequency y max_frequency (con un semitono de margen a cada lado)
+class NoteTable:
+
+    def __init__(self, min_frequency=200.0, max_frequency=2000.0, a4_frequency=440.0):
+        self.a4_frequency = a4_frequency
+        low = int(math.floor(A4_MIDI + 12 * math.log2(min_frequency / a4_frequency))) - 1
+        high = int(math.ceil(A4_MIDI + 12 * math.log2(max_frequency / a4_frequency))) + 1
+
+        self.midi_numbers = list(range(low, high + 1))
+        self.frequencies = [midi_to_frequency(m, a4_frequency) for m in self.midi_numbers]
+        self.names = [midi_to_name(m) for m in self.midi_numbers]
+        # Fronteras entre notas consecutivas (media geométrica = medio semitono)
+        self.boundaries = [math.sqrt(self.frequencies[i] * self.frequencies[i + 1])
+                           for i in range(len(self.frequencies) - 1)]
+
+    # Índice de la nota más cercana (en escala logarítmica)
+    def nearest_index(self, frequency):
+        return bisect_left(self.boundaries, frequency)
+
+    # Devuelve (nombre, desviación en cents) de la nota más cercana
+    def lookup(self, frequency):
+        if frequency <= 0:
+            return "N/A", 0.0
+        index = self.nearest_index(frequency)
+        cents = 1200.0 * math.log2(frequency / self.frequencies[index])
+        return self.names[index], cents
+
+    def note_name(self, frequency):
+        if frequency <= 0:
+            return "N/A"
+        return self.names[self.nearest_index(frequency)]
+
+
+# Cuantiza frecuencias a las notas de una escala (tabla de frecuencias permitidas + búsqueda binaria)
+class ScaleQuantizer:
+
+    def __init__(self, note_table, scale='chromatic', root='C', custom_steps=None):
+        if scale == 'custom':
+            if not custom_steps:
+                raise ValueError("La escala 'custom' necesita custom_steps (semitonos desde la tónica)")
+            steps = sorted({int(step) % 12 for step in custom_steps})
+        elif scale in SCALES:
+            steps = SCALES[scale]
+        else:
+            raise ValueError(f"Escala desconocida: {scale} (opciones: {', '.join(list(SCALES) + ['custom'])})")
+
+        root_index = NOTE_NAMES.index(root) if isinstance(root, str) else int(root) % 12
+        allowed = {(root_index + step) % 12 for step in steps}
+
+        self.scale = scale
+        self.root = NOTE_NAMES[root_index]
+        self.frequencies = [f for m, f in zip(note_table.midi_numbers, note_table.frequencies) if m % 12 in allowed]
+        self.boundaries = [math.sqrt(self.frequencies[i] * self.frequencies[i + 1])
+                           for i in range(len(self.frequencies) - 1)]
+
+    def quantize(self, frequency):
+        return self.frequencies[bisect_left(self.boundaries, frequency)]
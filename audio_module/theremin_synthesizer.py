@@ -1,10 +1,27 @@
 
 
 import numpy as np
-import pyaudio
+import math
+import os
+import sys
 import threading
+import time
 from collections import deque
 
+from note_table import NoteTable, ScaleQuantizer
+from convolution_reverb import load_impulse_response, synthetic_impulse_response
+from audio_recorder import AsyncAudioRecorder
+from effects import ConvolutionReverb, EchoDelay, EffectChain, Gain
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'utils'))
+
+from tracing import traced_lock
+
+# PyAudio se importa en start() para no pagar su carga (y la de PortAudio) al importar el módulo.
+# Valores de PortAudio que usa el callback: paContinue y el flag paOutputUnderflow
+PA_CONTINUE = 0
+PA_OUTPUT_UNDERFLOW = 0x00000004
+
 
 class ThereminSynthesizer:
     
@@ -13,7 +30,10 @@ class ThereminSynthesizer:
                  min_frequency=200.0,
                  max_frequency=2000.0,
                  wave_type='sine',
-                 buffer_size=1024):
+                 buffer_size=1024,
+                 metrics=None,
+                 reverb_mode='echo',
+                 impulse_response=None):
         # Frecuencia de muestreo. Define cuantas muestras de audio se generan por segundo.
         #  44100 Hz es estándar para audio de alta calidad. Se podria reducir para mejorar la latencia aunque perdiendo calidad.
         self.sample_rate = sample_rate 
@@ -27,13 +47,18 @@ class ThereminSynthesizer:
         self.vibrato_depth = 0.001  # Profundidad del vibrato (valor por defecto mínimo)
         self.harmonics = [1.0, 0.5, 0.25, 0.125]  # Amplitudes de armónicos (Fundamental, 2do, 3ro, 4to)
         # Configuración de Reverb (Eco simple)
-        self.reverb_enabled = True
+        self._reverb_enabled = True
         self.delay_seconds = 0.2
-        self.delay_feedback = 0.4
-        self.delay_mix = 0.3
-        self.delay_buffer_size = int(self.sample_rate * self.delay_seconds)
-        self.delay_buffer = np.zeros(self.delay_buffer_size, dtype=np.float32)
-        self.delay_index = 0
+        self.echo = EchoDelay(delay_seconds=self.delay_seconds, feedback=0.4, mix=0.3, max_delay_seconds=2.0)
+        # Reverb por convolución: 'echo' usa el eco simple de arriba, 'convolution' una IR (fichero WAV o sintética)
+        self.reverb_mode = 'echo'
+        self.reverb_mix = 0.3  # Nivel de la señal húmeda en modo convolución (lo controla la mano izquierda)
+        self.convolution_reverb = None
+        # Ganancia final para evitar clipping
+        self.output_gain = Gain(0.3, name='output_gain')
+        # Efectos añadidos con set_effects: effects antes de la reverb, post_effects después de la ganancia
+        self.effects = ()
+        self.post_effects = ()
         # Estado actual, con el que empieza la aplicación
         self.current_frequency = 440.0  # A4 por defecto
         self.current_volume = 0.0  # Silencio por defecto
@@ -42,9 +67,24 @@ class ThereminSynthesizer:
         # Para suavizado de transiciones
         self.frequency_history = deque(maxlen=5)
         self.volume_history = deque(maxlen=3)
+
+        # Mapeo logarítmico precalculado (posición -> frecuencia)
+        self._log_min_frequency = math.log(self.min_frequency)
+        self._log_frequency_range = math.log(self.max_frequency) - self._log_min_frequency
+
+        # Tabla de notas precalculada para nombres y cents
+        self.note_table = NoteTable(self.min_frequency, self.max_frequency)
+        self._note_cache = (None, "N/A", 0.0)  # (frecuencia, nombre, cents) de la última consulta
+
+        # Cuantización a escala (None = desactivada) y glide entre notas, aplicados dentro del bloque de audio
+        self.quantizer = None
+        self.glide_time = 0.0  # Segundos (constante de tiempo del portamento)
+        self._glide_log_frequency = math.log(self.current_frequency)
+        self._glide_ramp = None  # Curva de decaimiento precalculada para un bloque
+        self.sounding_frequency = self.current_frequency  # Frecuencia que suena al final del último bloque
         
-        # PyAudio
-        self.pyaudio = pyaudio.PyAudio()
+        # PyAudio (se crea en start() para poder renderizar audio sin abrir el dispositivo, p.ej. en benchmarks)
+        self.pyaudio = None
         self.stream = None
         self.phase = 0.0
         self.lfo_phase = 0.0  # Fase para el oscilador de baja frecuencia (LFO)
@@ -53,10 +93,30 @@ class ThereminSynthesizer:
 
         # Thread control
         self.lock = threading.Lock()
+
+        # Métricas de rendimiento opcionales (PerformanceMetrics), registra la duración de cada callback
+        self.metrics = metrics
+
+        # Grabación del audio generado: el callback solo copia cada bloque en este anillo (None = sin grabar)
+        self.record_ring = None
+        self.audio_recorder = None
+
+        # Cadena de efectos que aplica el callback (se sustituye entera al reconfigurarla) y bloque de salida.
+        # largest_block: mayor bloque pedido por el host; la cadena y el bloque se preparan para él al reconstruirla
+        self.effects_chain = None
+        self.output_block = np.zeros(self.buffer_size, dtype=np.float32)
+        self.largest_block = self.buffer_size
+        if reverb_mode != 'echo':
+            self.set_reverb_mode(reverb_mode, impulse_response)
+        else:
+            self._rebuild_chain()
         
     def start(self):
         # Comienza el stream de audio si no está ya iniciado.
         if self.stream is None:
+            import pyaudio
+            if self.pyaudio is None:
+                self.pyaudio = pyaudio.PyAudio()
             self.stream = self.pyaudio.open(
                 format=pyaudio.paFloat32,
                 channels=1,
@@ -79,15 +139,19 @@ class ThereminSynthesizer:
         print("Sintetizador detenido")
     
     def cleanup(self):
-        # Limpia los recursos de PyAudio
+        # Limpia los recursos de PyAudio (con el stream parado ya no llegan bloques a la grabación)
         self.stop()
-        self.pyaudio.terminate()
+        self.stop_recording()
+        if self.pyaudio is not None:
+            self.pyaudio.terminate()
+            self.pyaudio = None
     
     
     # Actualiza la posición de las manos para modificar frecuencia y volumen de salida del audio
     def update_position(self, right_hand_y, left_hand_x):
         
-        with self.lock:
+        # Con trazas activadas se mide también la espera por el lock (contención con el callback de audio)
+        with traced_lock(self.lock, self._tracer(), 'synth.lock.update_position'):
             # Actualizar frecuencia basada en mano derecha (Eje Y)
             if right_hand_y is not None:
                 # Invertir: Y cercano a 0 = agudo, Y cercano a 1 = grave
@@ -114,31 +178,131 @@ class ThereminSynthesizer:
                     self.current_volume = 0.0
                     self.volume_history.clear()
     
-    def update_parameters(self, vibrato_depth=None, delay_seconds=None):
+    # Activa o desactiva la reverb (eco o convolución); el callback se la salta en la cadena
+    @property
+    def reverb_enabled(self):
+        return self._reverb_enabled
+
+    @reverb_enabled.setter
+    def reverb_enabled(self, value):
+        self._reverb_enabled = bool(value)
+        self.echo.enabled = self._reverb_enabled
+        if self.convolution_reverb is not None:
+            self.convolution_reverb.enabled = self._reverb_enabled
+
+    def update_parameters(self, vibrato_depth=None, delay_seconds=None, reverb_mix=None):
 
         with self.lock:
+            if reverb_mix is not None:
+                self.reverb_mix = float(np.clip(reverb_mix, 0.0, 1.0))
+                if self.convolution_reverb is not None:
+                    self.convolution_reverb.mix = self.reverb_mix
+
             if vibrato_depth is not None:
                 # Limitar al rango real usado (0.001 a 0.021)
                 self.vibrato_depth = np.clip(vibrato_depth, 0.001, 0.025)
                 
             if delay_seconds is not None:
-                # Si cambia el tiempo de delay, necesitamos redimensionar el buffer
+                # El buffer del eco ya tiene el tamaño máximo: solo se mueve la posición de lectura
                 new_delay = np.clip(delay_seconds, 0.0, 2.0)
                 if abs(new_delay - self.delay_seconds) > 0.01:
                     self.delay_seconds = new_delay
-                    self.delay_buffer_size = int(self.sample_rate * self.delay_seconds)
-                    # Crear nuevo buffer manteniendo datos antiguos si es posible (opcional, aquí reseteamos para simpleza)
-                    self.delay_buffer = np.zeros(self.delay_buffer_size, dtype=np.float32)
-                    self.delay_index = 0
+                    self.echo.set_delay(new_delay)
     
+    # Cambia el tipo de reverb. 'convolution' acepta la ruta de un WAV, un array con la IR o None (IR sintética).
+    # Los espectros de la IR se precalculan aquí, fuera del callback, y el convolucionador se sustituye de golpe
+    def set_reverb_mode(self, mode, impulse_response=None):
+        if mode == 'echo':
+            convolution_reverb = None
+        elif mode == 'convolution':
+            if impulse_response is None:
+                impulse_response = synthetic_impulse_response(self.sample_rate)
+            elif isinstance(impulse_response, str):
+                impulse_response = load_impulse_response(impulse_response, self.sample_rate)
+            # Particiones del tamaño del buffer aunque la cadena se prepare para bloques mayores
+            convolution_reverb = ConvolutionReverb(impulse_response, mix=self.reverb_mix,
+                                                   partition_size=self.buffer_size)
+            convolution_reverb.enabled = self.reverb_enabled
+            convolution_reverb.prepare(self.sample_rate, self.buffer_size)
+        else:
+            raise ValueError(f"Modo de reverb desconocido: {mode} (opciones: echo, convolution)")
+
+        with self.lock:
+            self.reverb_mode = mode
+            self.convolution_reverb = convolution_reverb
+        self._rebuild_chain()
+
+    # Cambia los efectos de la cadena: effects van antes de la reverb (filtro, chorus...) y post_effects después
+    # de la ganancia de salida (p.ej. un SoftLimiter). Se preparan aquí y la cadena se sustituye sin parar el audio
+    def set_effects(self, effects=(), post_effects=()):
+        with self.lock:
+            self.effects = tuple(effects)
+            self.post_effects = tuple(post_effects)
+        self._rebuild_chain()
+
+    # Construye y prepara la cadena fuera del callback; asignar la referencia es atómico, así que el callback
+    # procesa cada bloque entero con la cadena anterior o con la nueva. Se prepara para el mayor bloque que haya
+    # pedido el host (redondeado a múltiplos del buffer) y el bloque de salida crece aquí, nunca en el callback
+    def _rebuild_chain(self):
+        with self.lock:
+            reverb = self.convolution_reverb if self.reverb_mode == 'convolution' else self.echo
+            effects = (*self.effects, reverb, self.output_gain, *self.post_effects)
+        block_size = -(-self.largest_block // self.buffer_size) * self.buffer_size
+        chain = EffectChain(effects).prepare(self.sample_rate, block_size)
+        if len(self.output_block) < block_size:
+            self.output_block = np.zeros(block_size, dtype=np.float32)
+        self.effects_chain = chain
+
+    # Tiempo de CPU de cada efecto de la cadena actual y la fracción del tiempo de un bloque que consume
+    def get_effect_stats(self):
+        return self.effects_chain.get_stats(budget_seconds=self.buffer_size / self.sample_rate)
+
+    # Activa la cuantización a una escala ('chromatic', 'major', 'minor', 'pentatonic', 'minor_pentatonic' o 'custom'
+    # con custom_steps en semitonos). scale=None la desactiva. glide_time en segundos suaviza el salto entre notas.
+    def set_quantization(self, scale=None, root='C', glide_time=None, custom_steps=None):
+        quantizer = None
+        if scale is not None:
+            quantizer = ScaleQuantizer(self.note_table, scale=scale, root=root, custom_steps=custom_steps)
+        with self.lock:
+            self.quantizer = quantizer
+            self._glide_log_frequency = math.log(self.sounding_frequency)
+            if glide_time is not None:
+                self.glide_time = max(0.0, float(glide_time))
+                self._glide_ramp = None
+
     # Calcula la frecuencia basada en la posición normalizada.
     def _calculate_frequency(self, normalized_pitch):
         
         # Escala logarítmica para una mejor progresión musical
-        log_min = np.log(self.min_frequency)
-        log_max = np.log(self.max_frequency)
-        log_freq = log_min + normalized_pitch * (log_max - log_min)
-        return np.exp(log_freq)
+        return math.exp(self._log_min_frequency + normalized_pitch * self._log_frequency_range)
+
+    # Frecuencia por muestra del bloque: cuantizada a la escala y con glide exponencial (en escala logarítmica).
+    # glide_time y glide_ramp son los leídos por el callback bajo el lock (set_quantization puede cambiarlos a la vez)
+    def _block_frequencies(self, frequency, quantizer, num_samples, glide_time, glide_ramp):
+        if quantizer is not None:
+            frequency = quantizer.quantize(frequency)
+        target = math.log(frequency)
+
+        if glide_time <= 0.0:
+            self._glide_log_frequency = target
+            self.sounding_frequency = frequency
+            return frequency
+
+        # Curva exp(-n/tau) precalculada mientras no cambie el tamaño de bloque ni el glide. Se construye sobre la
+        # variable local y solo se guarda si set_quantization no la ha invalidado entretanto
+        if glide_ramp is None or len(glide_ramp) != num_samples:
+            previous = glide_ramp
+            tau = glide_time * self.sample_rate
+            glide_ramp = np.exp(-np.arange(1, num_samples + 1) / tau)
+            with self.lock:
+                if self._glide_ramp is previous and self.glide_time == glide_time:
+                    self._glide_ramp = glide_ramp
+
+        log_frequencies = target + (self._glide_log_frequency - target) * glide_ramp
+        self._glide_log_frequency = float(log_frequencies[-1])
+        frequencies = np.exp(log_frequencies)
+        self.sounding_frequency = float(frequencies[-1])
+        return frequencies
     
     
     # Calcula el volumen basado en la posición normalizada.
@@ -197,76 +361,108 @@ class ThereminSynthesizer:
         
         return wave
     
+    # Empieza a grabar lo que suena en un WAV; las opciones se pasan a AsyncAudioRecorder
+    # (wait_for_start=True + align_start() para que empiece a la vez que el video)
+    def start_recording(self, path, **options):
+        self.stop_recording()
+        self.audio_recorder = AsyncAudioRecorder(path, sample_rate=self.sample_rate, metrics=self.metrics, **options)
+        self.record_ring = self.audio_recorder.ring
+        return self.audio_recorder
+
+    # Termina la grabación y devuelve sus estadísticas (None si no se estaba grabando)
+    def stop_recording(self):
+        recorder = self.audio_recorder
+        if recorder is None:
+            return None
+        self.record_ring = None
+        self.audio_recorder = None
+        recorder.release()
+        return recorder.get_stats()
+
+    # Tracer de las métricas (None si no hay métricas o no se están grabando trazas)
+    def _tracer(self):
+        return self.metrics.tracer if self.metrics is not None else None
+
     def _audio_callback(self, in_data, frame_count, time_info, status):
+        callback_start = time.perf_counter()
+        output_block = self.output_block
+        if frame_count <= len(output_block):
+            data = self._render_block(output_block[:frame_count], callback_start).tobytes()
+        else:
+            # El host pide más de lo preasignado: se genera por trozos sin agrandar el bloque de salida, y el tamaño
+            # se guarda para que la próxima reconstrucción de la cadena lo prepare
+            self.largest_block = max(self.largest_block, frame_count)
+            size = len(output_block)
+            data = b''.join(
+                self._render_block(output_block[:min(size, frame_count - start)],
+                                   callback_start + start / self.sample_rate).tobytes()
+                for start in range(0, frame_count, size))
+
+        if self.metrics is not None:
+            self.metrics.record('audio_callback', time.perf_counter() - callback_start)
+            # PortAudio nos avisa si el buffer de salida se quedó vacío (corte audible)
+            if status & PA_OUTPUT_UNDERFLOW:
+                self.metrics.record_audio_underflow()
+        
+        return (data, PA_CONTINUE)
+
+    # Genera len(audio_data) muestras sobre audio_data (vista del bloque de salida) y las pasa a la grabación
+    def _render_block(self, audio_data, timestamp):
+        frame_count = len(audio_data)
         # Usamos un lock para evitar que otro hilo modifique los valores mientras generamos audio
-        with self.lock:
+        with traced_lock(self.lock, self._tracer(), 'synth.lock.audio_callback'):
             frequency = self.current_frequency
             volume = self.current_volume
+            quantizer = self.quantizer
+            glide_time = self.glide_time
+            glide_ramp = self._glide_ramp
+
+        # Cuantización y glide por bloque (escalar o array con una frecuencia por muestra)
+        if quantizer is not None or glide_time > 0.0:
+            frequency = self._block_frequencies(frequency, quantizer, frame_count, glide_time, glide_ramp)
+        else:
+            self.sounding_frequency = frequency
         
         # Generar onda base
         wave = self._generate_wave(frequency, frame_count)
         
-        # Aplicar volumen inicial
-        dry_signal = (wave * volume).astype(np.float32)
-        
-        # Aplicar Reverb si está habilitado
-        if self.reverb_enabled:
-            # Índices para el buffer circular
-            indices = (self.delay_index + np.arange(frame_count)) % self.delay_buffer_size
-            
-            # Leer señal retardada
-            delayed_signal = self.delay_buffer[indices]
-            
-            # Mezclar señal seca y retardada
-            output_signal = dry_signal + delayed_signal * self.delay_mix
-            
-            # Calcular señal para realimentar al buffer (feedback)
-            feedback_signal = dry_signal + delayed_signal * self.delay_feedback
-            
-            # Escribir en el buffer
-            self.delay_buffer[indices] = feedback_signal
-            
-            # Actualizar índice
-            self.delay_index = (self.delay_index + frame_count) % self.delay_buffer_size
-            
-            # Usar la señal mezclada como salida final
-            final_output = output_signal
-        else:
-            final_output = dry_signal
-            
-        # Aplicar ganancia final para evitar clipping
-        audio_data = (final_output * 0.3).astype(np.float32)
-        
-        return (audio_data.tobytes(), pyaudio.paContinue)
+        # Aplicar volumen inicial sobre el bloque de salida reutilizado
+        np.multiply(wave, volume, out=audio_data)
+
+        # Efectos (reverb, ganancia final y los añadidos con set_effects), in situ sobre el bloque
+        self.effects_chain.process(audio_data, self.metrics)
+
+        # Copia del bloque para la grabación (sin esperas; si el anillo está lleno se descarta y se cuenta)
+        record_ring = self.record_ring
+        if record_ring is not None:
+            record_ring.write(audio_data, timestamp)
+        return audio_data
     
+    # Nombre y desviación en cents de la nota que suena, buscados en la tabla precalculada.
+    # Se cachea la última consulta porque get_info() se llama varias veces por frame con la misma frecuencia
+    def _lookup_note(self):
+        frequency = self.sounding_frequency if self.quantizer is not None else self.current_frequency
+        if frequency != self._note_cache[0]:
+            name, cents = self.note_table.lookup(frequency)
+            self._note_cache = (frequency, name, cents)
+        return self._note_cache
+
     def get_current_note_name(self):
-        # Nombres de notas
-        note_names = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
-        
-        # A4 = 440 Hz es la referencia
-        a4_freq = 440.0
-        
-        # Calcular número de semitonos desde A4
-        if self.current_frequency > 0:
-            semitones_from_a4 = 12 * np.log2(self.current_frequency / a4_freq)
-            note_number = int(round(semitones_from_a4))
-            
-            # A4 es la nota 9 de la octava 4
-            note_index = (9 + note_number) % 12
-            octave = 4 + (9 + note_number) // 12
-            
-            return f"{note_names[note_index]}{octave}"
-        
-        return "N/A"
+        return self._lookup_note()[1]
     
     # Información del estado actual del sintetizador, usado para mostrar en pantalla0
     def get_info(self):
+        frequency, note, cents = self._lookup_note()
       
         return {
-            'frequency': self.current_frequency,
+            'frequency': frequency,
             'volume': self.current_volume * 100,  # En porcentaje
-            'note': self.get_current_note_name(),
+            'note': note,
+            'cents': cents,
+            'scale': self.quantizer.scale if self.quantizer is not None else None,
             'is_playing': self.is_playing,
             'vibrato_depth': self.vibrato_depth,
-            'delay_seconds': self.delay_seconds
+            'delay_seconds': self.delay_seconds,
+            'reverb_mode': self.reverb_mode,
+            'reverb_mix': self.reverb_mix
         }
@@ -0,0 +1,186 @@
+"""
+Utilidades comunes para los benchmarks del Theremín Virtual
+Medición de tiempos, guardado/comparación de baselines y generación de datos sintéticos
+(landmarks de MediaPipe y un video de prueba) para poder ejecutar todo sin cámara ni pantalla
+"""
+
+import json
+import os
+import platform
+import sys
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+# Agregar paths para importar módulos del proyecto
+ROOT_DIR = os.path.join(os.path.dirname(__file__), '..')
+for module_dir in ('video_module', 'audio_module', 'utils', 'main_module'):
+    sys.path.append(os.path.join(ROOT_DIR, module_dir))
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), 'baselines')
+
+SYNTHETIC_VIDEO_PATH = os.path.join(DATA_DIR, 'synthetic_hands.avi')
+
+
+# Mide una función varias veces y devuelve las estadísticas en segundos por llamada
+def time_callable(fn, number=100, repeat=5, warmup=3):
+    for _ in range(warmup):
+        fn()
+
+    samples = np.empty(number * repeat, dtype=np.float64)
+    for i in range(number * repeat):
+        start = time.perf_counter()
+        fn()
+        samples[i] = time.perf_counter() - start
+
+    return {
+        'calls': int(samples.size),
+        'min': float(samples.min()),
+        'median': float(np.median(samples)),
+        'mean': float(samples.mean()),
+        'p95': float(np.percentile(samples, 95)),
+    }
+
+
+# Recoge los resultados de todos los casos de un grupo
+class BenchmarkRunner:
+
+    def __init__(self, quick=False, name_filter=None):
+        self.quick = quick
+        self.name_filter = name_filter
+        self.results = {}
+        self.skipped = {}
+
+    # Ejecuta un caso. En modo rápido se reducen las repeticiones
+    def run(self, name, fn, number=100, repeat=5):
+        if self.name_filter and self.name_filter not in name:
+            return None
+        if self.quick:
+            number = max(1, number // 10)
+            repeat = min(repeat, 2)
+        stats = time_callable(fn, number=number, repeat=repeat)
+        self.results[name] = stats
+        print(f"  {name:<55} median {stats['median'] * 1e3:9.4f} ms   p95 {stats['p95'] * 1e3:9.4f} ms")
+        return stats
+
+    # Registra un resultado medido fuera de time_callable (p.ej. throughput de un video completo)
+    def add_result(self, name, stats):
+        if self.name_filter and self.name_filter not in name:
+            return
+        self.results[name] = stats
+        print(f"  {name:<55} median {stats['median'] * 1e3:9.4f} ms   p95 {stats['p95'] * 1e3:9.4f} ms")
+
+    def skip(self, group, reason):
+        self.skipped[group] = reason
+        print(f"  [skip] {group}: {reason}")
+
+
+def environment_info():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'numpy': np.__version__,
+    }
+
+
+def save_baseline(results, path, skipped=None):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    data = {
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'environment': environment_info(),
+        'results': results,
+        'skipped': skipped or {},
+    }
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    print(f"\nBaseline guardado en {path}")
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+# Compara con un baseline usando la mediana. Devuelve la lista de casos que han empeorado más del umbral
+def compare_with_baseline(results, baseline, threshold=0.15):
+    regressions = []
+    baseline_results = baseline.get('results', {})
+
+    print(f"\n{'case':<55} {'baseline':>10} {'current':>10} {'change':>9}")
+    for name, stats in sorted(results.items()):
+        reference = baseline_results.get(name)
+        if reference is None:
+            print(f"{name:<55} {'-':>10} {stats['median'] * 1e3:9.4f}m {'new':>9}")
+            continue
+        change = (stats['median'] - reference['median']) / reference['median'] if reference['median'] > 0 else 0.0
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append((name, change))
+        elif change < -threshold:
+            flag = '  improved'
+        print(f"{name:<55} {reference['median'] * 1e3:9.4f}m {stats['median'] * 1e3:9.4f}m {change * 100:+8.1f}%{flag}")
+
+    return regressions
+
+
+# ---------------------------- DATOS SINTÉTICOS ----------------------------
+
+# Posiciones relativas de los 21 landmarks de una mano abierta (unidades de "palma")
+_HAND_TEMPLATE = np.array([
+    [0.00, 0.00],                                                   # 0 muñeca
+    [-0.35, -0.20], [-0.55, -0.45], [-0.70, -0.70], [-0.80, -0.90],  # 1-4 pulgar
+    [-0.25, -0.95], [-0.28, -1.35], [-0.30, -1.60], [-0.32, -1.80],  # 5-8 índice
+    [0.00, -1.00], [0.00, -1.45], [0.00, -1.72], [0.00, -1.95],      # 9-12 medio
+    [0.22, -0.95], [0.25, -1.35], [0.27, -1.60], [0.29, -1.78],      # 13-16 anular
+    [0.42, -0.85], [0.48, -1.15], [0.52, -1.35], [0.55, -1.52],      # 17-20 meñique
+], dtype=np.float64)
+
+
+# Genera un array (21, 3) de landmarks normalizados para una mano centrada en (cx, cy).
+# pinch entre 0 (pulgar e índice juntos) y 1 (separados)
+def synthetic_hand_array(cx=0.5, cy=0.5, scale=0.08, pinch=1.0):
+    points = _HAND_TEMPLATE.copy()
+    # Acercar la punta del pulgar a la del índice según el pinch
+    points[4] = points[8] + (points[4] - points[8]) * pinch
+    landmarks = np.zeros((21, 3), dtype=np.float64)
+    landmarks[:, 0] = cx + points[:, 0] * scale
+    landmarks[:, 1] = cy + points[:, 1] * scale + scale
+    return landmarks
+
+
+# Convierte un array (21, 3) en un objeto con la misma interfaz que los landmarks de MediaPipe
+def landmarks_from_array(array):
+    return SimpleNamespace(landmark=[SimpleNamespace(x=float(x), y=float(y), z=float(z)) for x, y, z in array])
+
+
+def synthetic_hand(cx=0.5, cy=0.5, scale=0.08, pinch=1.0):
+    return landmarks_from_array(synthetic_hand_array(cx, cy, scale, pinch))
+
+
+# Genera (una sola vez) un video sintético con dos "manos" moviéndose, para medir el throughput de VideoProcessor
+def ensure_synthetic_video(path=SYNTHETIC_VIDEO_PATH, size=(640, 480), fps=30, seconds=4):
+    import cv2
+
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    width, height = size
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, size)
+    total_frames = fps * seconds
+    skin = (120, 160, 220)
+    for i in range(total_frames):
+        t = i / total_frames
+        frame = np.full((height, width, 3), 40, dtype=np.uint8)
+        for cx, cy in ((0.25 + 0.15 * np.sin(2 * np.pi * t), 0.6),
+                       (0.75, 0.5 + 0.25 * np.sin(4 * np.pi * t))):
+            points = synthetic_hand_array(cx, cy, scale=0.12)
+            pixels = (points[:, :2] * (width, height)).astype(np.int32)
+            cv2.fillConvexPoly(frame, cv2.convexHull(pixels), skin)
+        writer.write(frame)
+    writer.release()
+    return path
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+Latencia de extremo a extremo: del movimiento de la mano en el frame al cambio en el audio sintetizado
+
+Reproduce una secuencia con movimientos conocidos (landmarks generados con saltos de altura y de volumen, o un
+fichero .thlm / video con sus instantes anotados) a través de la fuente de video (LandmarkReplaySource o
+VideoProcessor), integrate_audio_with_tracking y el callback real del sintetizador, con un sumidero de audio
+offline en un reloj virtual con precisión de muestra:
+    - el frame k se captura en su marca temporal; se procesa cuando termina el anterior y sus controles llegan
+      al sintetizador tras el tiempo de cómputo medido (fuente + mapeo)
+    - el bloque j lo pide el dispositivo en j * buffer_size / sample_rate y su muestra n suena
+      output_blocks bloques después (el buffer del dispositivo)
+Después detecta cada cambio en el audio (pico del espectro para la altura, RMS para el volumen; el instante en
+que cruza la mitad del salto) y da la distribución de latencias por configuración.
+
+Solo mide el sintetizador en hilo (ThereminSynthesizer): con audio_process=True el motor corre en su propio
+proceso y su propio reloj, que este reloj virtual no reproduce.
+
+Uso:
+    python benchmarks/latency_harness.py                                     # configuraciones por defecto
+    python benchmarks/latency_harness.py --buffer-sizes 256 1024 --smoothing default 1
+    python benchmarks/latency_harness.py --source session.thlm --onsets session.onsets.json --save latency.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from bench_utils import DATA_DIR, environment_info, synthetic_hand_array
+
+from audio_video_integration import integrate_audio_with_tracking
+from landmark_recorder import LandmarkRecorder, LandmarkReplaySource
+
+SAMPLE_RATE = 44100
+BUFFER_SIZES = [256, 512, 1024, 2048]
+SCRIPT_PATH = os.path.join(DATA_DIR, 'latency_steps.thlm')
+
+# Posiciones de la secuencia generada: la mano derecha salta entre dos alturas (~1125 Hz / ~400 Hz) y la
+# izquierda entre dos volúmenes, sin llegar al silencio para que la altura se pueda seguir en todo momento
+PITCH_POSITIONS = (0.25, 0.70)
+VOLUME_POSITIONS = (0.10, 0.45)
+
+# Análisis del audio: ventana y salto (muestras) del seguimiento de altura y de nivel
+PITCH_WINDOW = 1024
+LEVEL_WINDOW = 256
+HOP = 32
+# Segundos antes de cada cambio (y del siguiente) en los que se mide el nivel de partida y de llegada
+LEVEL_SPAN = 0.15
+
+
+# Genera la secuencia de landmarks con saltos instantáneos en instantes aleatorios (no alineados con los frames
+# ni con los bloques de audio). Devuelve la lista de cambios [{'time', 'kind'}] y la guarda junto al fichero
+def make_step_script(path=SCRIPT_PATH, duration=20.0, fps=30, spacing=(0.6, 0.9), lead_in=1.0, seed=0):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    onsets = []
+    t = lead_in
+    kinds = ('pitch', 'volume')
+    while t < duration - max(spacing):
+        onsets.append({'time': float(t), 'kind': kinds[len(onsets) % 2]})
+        t += rng.uniform(*spacing)
+
+    recorder = LandmarkRecorder(path)
+    try:
+        for k in range(int(duration * fps)):
+            timestamp = k / fps
+            steps = {kind: sum(1 for onset in onsets if onset['kind'] == kind and onset['time'] <= timestamp)
+                     for kind in kinds}
+            right_y = PITCH_POSITIONS[steps['pitch'] % 2]
+            left_x = VOLUME_POSITIONS[steps['volume'] % 2]
+            # Pulgar e índice juntos: vibrato mínimo
+            landmarks = np.stack([synthetic_hand_array(0.75, right_y, pinch=0.0),
+                                  synthetic_hand_array(left_x, 0.6, pinch=0.0)])
+            recorder.write_arrays(['Right', 'Left'], [1.0, 1.0], landmarks, timestamp)
+    finally:
+        recorder.close()
+
+    save_onsets(onsets, onsets_path(path))
+    return onsets
+
+
+def onsets_path(path):
+    return os.path.splitext(path)[0] + '.onsets.json'
+
+
+def save_onsets(onsets, path):
+    with open(path, 'w') as f:
+        json.dump(onsets, f, indent=2)
+
+
+def load_onsets(path):
+    with open(path) as f:
+        return [{'time': float(onset['time']), 'kind': onset['kind']} for onset in json.load(f)]
+
+
+# Sustituto del sintetizador para la pasada de video: guarda las llamadas de integrate_audio_with_tracking
+# para aplicarlas después, en su instante, sobre el sintetizador real
+class _ControlRecorder:
+
+    def __init__(self):
+        self.calls = []
+
+    def update_position(self, right_hand_y, left_hand_x):
+        self.calls.append(('update_position', (right_hand_y, left_hand_x), {}))
+
+    def update_parameters(self, **kwargs):
+        self.calls.append(('update_parameters', (), kwargs))
+
+
+# Pasada de video: captura, tracking y mapeo de cada frame. Devuelve [(instante de captura, instante en que los
+# controles llegan al sintetizador, llamadas)] en el reloj virtual (0 = primer frame)
+def run_video_pass(source_path, size=(640, 360)):
+    if source_path.endswith('.thlm'):
+        source = LandmarkReplaySource(source_path, size=size, realtime=False, draw_landmarks=False)
+        capture_times = np.asarray(source.records['timestamp'], dtype=np.float64)
+    else:
+        import cv2
+        from video_processor import VideoProcessor
+
+        source = VideoProcessor(source=source_path, size=size, save_video=False, background_init=False,
+                                draw_landmarks=False)
+        fps = source.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        capture_times = None
+
+    events = []
+    busy_until = 0.0
+    try:
+        k = 0
+        while True:
+            start = time.perf_counter()
+            frame, position_calculator, _ = source.process_frame()
+            if frame is None:
+                break
+            recorder = _ControlRecorder()
+            integrate_audio_with_tracking(position_calculator, recorder)
+            compute = time.perf_counter() - start
+
+            capture = capture_times[k] if capture_times is not None else k / fps
+            # El bucle es secuencial: un frame no se empieza a procesar hasta que termina el anterior
+            busy_until = max(capture, busy_until) + compute
+            events.append((float(capture), busy_until, recorder.calls))
+            k += 1
+    finally:
+        source.cleanup()
+    return events
+
+
+# Sintetizador sin stream y la función que renderiza un bloque con su callback real
+def _make_synthesizer(buffer_size, smoothing):
+    from collections import deque
+    from theremin_synthesizer import ThereminSynthesizer
+
+    synthesizer = ThereminSynthesizer(sample_rate=SAMPLE_RATE, buffer_size=buffer_size)
+    # Sin reverb: los ecos de la nota anterior ocultarían el cambio
+    synthesizer.reverb_enabled = False
+    if smoothing is not None:
+        synthesizer.frequency_history = deque(maxlen=smoothing)
+        synthesizer.volume_history = deque(maxlen=smoothing)
+
+    def render():
+        data, _ = synthesizer._audio_callback(None, buffer_size, None, 0)
+        return np.frombuffer(data, dtype=np.float32)
+
+    return synthesizer, render
+
+
+# Sumidero offline: el bloque j se pide en j * buffer_size / sample_rate y antes se aplican los controles que ya
+# han llegado. Devuelve el audio completo (la muestra n suena en n / sample_rate + output_latency)
+def render_audio(events, buffer_size, smoothing=None, tail=0.5):
+    synthesizer, render = _make_synthesizer(buffer_size, smoothing)
+    duration = events[-1][1] + tail if events else tail
+    num_blocks = int(np.ceil(duration * SAMPLE_RATE / buffer_size))
+    audio = np.empty(num_blocks * buffer_size, dtype=np.float32)
+    next_event = 0
+    for j in range(num_blocks):
+        request_time = j * buffer_size / SAMPLE_RATE
+        while next_event < len(events) and events[next_event][1] <= request_time:
+            for name, args, kwargs in events[next_event][2]:
+                getattr(synthesizer, name)(*args, **kwargs)
+            next_event += 1
+        audio[j * buffer_size:(j + 1) * buffer_size] = render()
+    return audio
+
+
+# Frecuencia dominante por ventana (Hann, pico del espectro con interpolación parabólica).
+# Devuelve (centros de ventana en muestras, frecuencias)
+def pitch_track(audio, window=PITCH_WINDOW, hop=HOP, chunk=2048):
+    frames = np.lib.stride_tricks.sliding_window_view(audio, window)[::hop]
+    taper = np.hanning(window).astype(np.float32)
+    frequencies = np.empty(len(frames))
+    for start in range(0, len(frames), chunk):
+        spectrum = np.abs(np.fft.rfft(frames[start:start + chunk] * taper, axis=1))
+        spectrum[:, 0] = 0.0
+        peak = np.clip(np.argmax(spectrum, axis=1), 1, spectrum.shape[1] - 2)
+        rows = np.arange(len(peak))
+        left, center, right = spectrum[rows, peak - 1], spectrum[rows, peak], spectrum[rows, peak + 1]
+        denominator = left - 2 * center + right
+        offset = np.divide(0.5 * (left - right), denominator, out=np.zeros_like(center), where=denominator != 0)
+        frequencies[start:start + chunk] = (peak + offset) * SAMPLE_RATE / window
+    return np.arange(len(frames)) * hop + window / 2, frequencies
+
+
+# Nivel RMS por ventana, con suma acumulada. Devuelve (centros de ventana en muestras, niveles)
+def level_track(audio, window=LEVEL_WINDOW, hop=HOP):
+    energy = np.concatenate(([0.0], np.cumsum(audio.astype(np.float64) ** 2)))
+    starts = np.arange(0, len(audio) - window + 1, hop)
+    levels = np.sqrt((energy[starts + window] - energy[starts]) / window)
+    return starts + window / 2, levels
+
+
+# Primer instante de [start, end) en que la curva cruza threshold (en el sentido del salto), interpolado
+def _crossing_time(times, values, start, end, threshold, rising):
+    selected = np.flatnonzero((times >= start) & (times < end))
+    if selected.size == 0:
+        return None
+    beyond = values[selected] >= threshold if rising else values[selected] <= threshold
+    hits = np.flatnonzero(beyond)
+    if hits.size == 0:
+        return None
+    i = selected[hits[0]]
+    if i == 0:
+        return float(times[i])
+    v0, v1 = values[i - 1], values[i]
+    fraction = (threshold - v0) / (v1 - v0) if v1 != v0 else 1.0
+    return float(times[i - 1] + fraction * (times[i] - times[i - 1]))
+
+
+# Busca en el audio la respuesta a cada cambio. Devuelve, por cambio, el instante en que suena (None si no se
+# detecta). La altura se compara en escala logarítmica (el cruce es la media geométrica)
+def detect_onsets(audio, onsets, output_latency):
+    tracks = {'pitch': pitch_track(audio), 'volume': level_track(audio)}
+    end_time = len(audio) / SAMPLE_RATE + output_latency
+    detected = []
+    for i, onset in enumerate(onsets):
+        centers, values = tracks[onset['kind']]
+        times = centers / SAMPLE_RATE + output_latency
+        if onset['kind'] == 'pitch':
+            values = np.log(np.maximum(values, 1.0))
+        following = [later['time'] for later in onsets[i + 1:] if later['kind'] == onset['kind']]
+        next_time = following[0] if following else end_time
+
+        before = values[(times >= onset['time'] - LEVEL_SPAN) & (times < onset['time'])]
+        after = values[(times >= next_time - LEVEL_SPAN) & (times < next_time)]
+        if before.size == 0 or after.size == 0:
+            detected.append(None)
+            continue
+        level_before, level_after = float(np.median(before)), float(np.median(after))
+        # Un salto menor que el ruido de la medida no cuenta (p.ej. mano fuera de la zona de control)
+        if abs(level_after - level_before) < (0.1 if onset['kind'] == 'pitch' else 0.1 * max(level_after, level_before)):
+            detected.append(None)
+            continue
+        detected.append(_crossing_time(times, values, onset['time'], next_time, 0.5 * (level_before + level_after),
+                                       level_after > level_before))
+    return detected
+
+
+# Estadísticas (milisegundos) de una lista de latencias en segundos
+def _distribution(values):
+    values = np.asarray(values, dtype=np.float64) * 1000.0
+    if values.size == 0:
+        return None
+    return {
+        'count': int(values.size),
+        'min': float(values.min()),
+        'median': float(np.median(values)),
+        'mean': float(values.mean()),
+        'p95': float(np.percentile(values, 95)),
+        'max': float(values.max()),
+    }
+
+
+# Mide una configuración sobre la pasada de video ya hecha. La latencia se descompone en muestreo (del
+# movimiento al primer frame que lo ve), procesado (del frame a los controles en el sintetizador, con la cola
+# del bucle) y audio (de los controles al sonido: espera al bloque, suavizado y buffer del dispositivo)
+def measure(events, onsets, buffer_size=1024, smoothing=None, output_blocks=2):
+    output_latency = output_blocks * buffer_size / SAMPLE_RATE
+    audio = render_audio(events, buffer_size, smoothing)
+    detected = detect_onsets(audio, onsets, output_latency)
+
+    captures = np.array([event[0] for event in events])
+    applied = np.array([event[1] for event in events])
+    latency, sampling, processing, synthesis = {}, [], [], []
+    for onset, sounded in zip(onsets, detected):
+        if sounded is None:
+            continue
+        latency.setdefault(onset['kind'], []).append(sounded - onset['time'])
+        k = min(int(np.searchsorted(captures, onset['time'])), len(events) - 1)
+        sampling.append(captures[k] - onset['time'])
+        processing.append(applied[k] - captures[k])
+        synthesis.append(sounded - applied[k])
+
+    all_latency = [value for values in latency.values() for value in values]
+    return {
+        'buffer_size': buffer_size,
+        'smoothing': 'default' if smoothing is None else smoothing,
+        'output_latency_ms': output_latency * 1000.0,
+        'onsets': len(onsets),
+        'missed': sum(1 for sounded in detected if sounded is None),
+        'latency_ms': _distribution(all_latency),
+        'latency_ms_by_kind': {kind: _distribution(values) for kind, values in latency.items()},
+        'breakdown_median_ms': {
+            'sampling': float(np.median(sampling) * 1000.0) if sampling else None,
+            'processing': float(np.median(processing) * 1000.0) if processing else None,
+            'audio': float(np.median(synthesis) * 1000.0) if synthesis else None,
+        },
+    }
+
+
+def _format_row(result):
+    stats = result['latency_ms']
+    breakdown = result['breakdown_median_ms']
+    name = f"{result['buffer_size']},smoothing={result['smoothing']}"
+    if stats is None:
+        return f"  {name:<36} sin cambios detectados ({result['missed']}/{result['onsets']} perdidos)"
+    return (f"  {name:<36} median {stats['median']:7.1f} ms  p95 {stats['p95']:7.1f} ms  max {stats['max']:7.1f} ms"
+            f"  (muestreo {breakdown['sampling']:.1f} + procesado {breakdown['processing']:.1f}"
+            f" + audio {breakdown['audio']:.1f})  perdidos {result['missed']}/{result['onsets']}")
+
+
+def _parse_smoothing(value):
+    return None if value == 'default' else int(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Latencia movimiento -> sonido del Theremín Virtual")
+    parser.add_argument('--source', default=None,
+                        help="Fichero .thlm o video (por defecto se genera una secuencia de saltos en benchmarks/data)")
+    parser.add_argument('--onsets', default=None,
+                        help="JSON con los cambios [{\"time\": s, \"kind\": \"pitch\"|\"volume\"}] "
+                             "(por defecto <source>.onsets.json)")
+    parser.add_argument('--duration', type=float, default=20.0, help="Duración de la secuencia generada (s)")
+    parser.add_argument('--buffer-sizes', nargs='+', type=int, default=BUFFER_SIZES)
+    parser.add_argument('--smoothing', nargs='+', type=_parse_smoothing, default=[None, 1],
+                        help="Longitud del suavizado de frecuencia y volumen; 'default' = el del sintetizador (5/3)")
+    parser.add_argument('--output-blocks', type=float, default=2,
+                        help="Bloques entre el callback y la salida del dispositivo")
+    parser.add_argument('--save', metavar='PATH', help="Guardar los resultados en JSON")
+    args = parser.parse_args(argv)
+
+    if args.source is None:
+        source = SCRIPT_PATH
+        onsets = make_step_script(source, duration=args.duration)
+    else:
+        source = args.source
+        onsets = load_onsets(args.onsets or onsets_path(source))
+
+    print(f"Pasada de video: {source} ({len(onsets)} cambios)")
+    events = run_video_pass(source)
+
+    results = []
+    for buffer_size in args.buffer_sizes:
+        for smoothing in args.smoothing:
+            result = measure(events, onsets, buffer_size, smoothing, args.output_blocks)
+            results.append(result)
+            print(_format_row(result))
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w') as f:
+            json.dump({'created': time.strftime('%Y-%m-%d %H:%M:%S'), 'environment': environment_info(),
+                       'source': source, 'results': results}, f, indent=2)
+        print(f"\nResultados guardados en {args.save}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+Suite de benchmarks del Theremín Virtual (sin cámara, sin pantalla y sin dispositivo de audio)
+
+Uso:
+    python benchmarks/run_benchmarks.py                                  # todos los grupos
+    python benchmarks/run_benchmarks.py --groups synth delay --quick
+    python benchmarks/run_benchmarks.py --save benchmarks/baselines/local.json
+    python benchmarks/run_benchmarks.py --compare benchmarks/baselines/local.json --threshold 0.15
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from bench_utils import (BenchmarkRunner, compare_with_baseline, ensure_synthetic_video, load_baseline,
+                         save_baseline, synthetic_hand, synthetic_hand_array)
+
+WAVE_TYPES = ['sine', 'square', 'saw', 'triangle']
+BUFFER_SIZES = [256, 512, 1024, 2048]
+RESOLUTIONS = [(640, 480), (1280, 720), (1920, 1080)]
+
+
+def _make_synthesizer(**kwargs):
+    from theremin_synthesizer import ThereminSynthesizer
+    synthesizer = ThereminSynthesizer(**kwargs)
+    synthesizer.current_volume = 0.8
+    synthesizer.current_frequency = 440.0
+    return synthesizer
+
+
+# Tiempo de render del callback de audio por tipo de onda y tamaño de buffer (sin reverb)
+def bench_synth(runner):
+    for wave_type in WAVE_TYPES:
+        for buffer_size in BUFFER_SIZES:
+            synthesizer = _make_synthesizer(wave_type=wave_type, buffer_size=buffer_size)
+            synthesizer.reverb_enabled = False
+            runner.run(f"synth.callback[{wave_type},{buffer_size}]",
+                       lambda s=synthesizer, n=buffer_size: s._audio_callback(None, n, None, 0),
+                       number=200)
+
+
+# Coste añadido por grabar el audio: el callback solo copia el bloque en el anillo compartido
+def bench_recording(runner):
+    import os
+    import tempfile
+
+    for buffer_size in (256, 1024):
+        synthesizer = _make_synthesizer(wave_type='sine', buffer_size=buffer_size)
+        synthesizer.reverb_enabled = False
+        runner.run(f"recording.callback[off,{buffer_size}]",
+                   lambda s=synthesizer, n=buffer_size: s._audio_callback(None, n, None, 0), number=200)
+        path = os.path.join(tempfile.gettempdir(), 'theremin-bench-recording.wav')
+        synthesizer.start_recording(path, chunk_seconds=0.05)
+        try:
+            runner.run(f"recording.callback[on,{buffer_size}]",
+                       lambda s=synthesizer, n=buffer_size: s._audio_callback(None, n, None, 0), number=200)
+        finally:
+            synthesizer.stop_recording()
+            os.remove(path)
+
+
+# Coste de la línea de retardo (reverb) y de cambiar su longitud
+def bench_delay(runner):
+    for delay_seconds in (0.1, 0.4, 0.8):
+        synthesizer = _make_synthesizer(wave_type='sine', buffer_size=1024)
+        synthesizer.reverb_enabled = True
+        synthesizer.update_parameters(delay_seconds=delay_seconds)
+        runner.run(f"delay.callback[sine,1024,{delay_seconds}s]",
+                   lambda s=synthesizer: s._audio_callback(None, 1024, None, 0),
+                   number=200)
+
+    # Alternar el delay en cada llamada fuerza a reasignar el buffer
+    synthesizer = _make_synthesizer(wave_type='sine', buffer_size=1024)
+    delays = [0.1, 0.8]
+    state = {'i': 0}
+
+    def change_delay():
+        state['i'] ^= 1
+        synthesizer.update_parameters(delay_seconds=delays[state['i']])
+
+    runner.run("delay.update_parameters[resize]", change_delay, number=200)
+
+
+# Reverb por convolución: coste por bloque según la longitud de la IR y el tamaño de buffer
+def bench_reverb(runner):
+    from convolution_reverb import PartitionedConvolver, synthetic_impulse_response
+
+    block = np.random.default_rng(0).standard_normal(2048).astype(np.float32)
+    for ir_seconds in (0.5, 1.0, 2.0, 4.0):
+        ir = synthetic_impulse_response(44100, decay_seconds=ir_seconds)
+        for buffer_size in (256, 512, 1024):
+            convolver = PartitionedConvolver(ir, buffer_size)
+            runner.run(f"reverb.process_block[{ir_seconds}s,{buffer_size}]",
+                       lambda c=convolver, b=block[:buffer_size]: c.process_block(b),
+                       number=200)
+
+    # Callback completo en modo convolución, comparable con delay.callback
+    synthesizer = _make_synthesizer(wave_type='sine', buffer_size=1024, reverb_mode='convolution')
+    runner.run("reverb.callback[sine,1024,1.5s]",
+               lambda: synthesizer._audio_callback(None, 1024, None, 0), number=200)
+
+
+# Coste por bloque de cada efecto de la cadena DSP, de una cadena completa en el callback y de sustituirla
+def bench_effects(runner):
+    from effects import Chorus, ConvolutionReverb, EchoDelay, SoftLimiter, StateVariableFilter
+    from convolution_reverb import synthetic_impulse_response
+
+    rng = np.random.default_rng(0)
+    for buffer_size in (256, 1024):
+        source = rng.standard_normal(buffer_size).astype(np.float32)
+        block = source.copy()
+        effects = [StateVariableFilter('lowpass', cutoff=1200.0, resonance=2.0), Chorus(), SoftLimiter(),
+                   EchoDelay(), ConvolutionReverb(synthetic_impulse_response(44100))]
+        for effect in effects:
+            effect.prepare(44100, buffer_size)
+
+            # Se reinicia el bloque para que la realimentación no lo haga crecer sin límite
+            def process(e=effect):
+                block[:] = source
+                e.process(block)
+
+            runner.run(f"effects.process[{effect.name},{buffer_size}]", process, number=200)
+
+    synthesizer = _make_synthesizer(wave_type='sine', buffer_size=1024)
+    synthesizer.set_effects([StateVariableFilter('lowpass', cutoff=1200.0), Chorus()], [SoftLimiter()])
+    runner.run("effects.callback[svf+chorus+delay+limiter,1024]",
+               lambda: synthesizer._audio_callback(None, 1024, None, 0), number=200)
+
+    # Sustituir la cadena reutilizando efectos ya preparados (lo que cuesta reconfigurarla en marcha)
+    chains = [([StateVariableFilter('lowpass')], []), ([Chorus()], [SoftLimiter()])]
+    state = {'i': 0}
+
+    def swap_chain():
+        state['i'] ^= 1
+        synthesizer.set_effects(*chains[state['i']])
+
+    runner.run("effects.set_effects[swap]", swap_chain, number=200)
+
+
+# Mapeo de landmarks a parámetros del sintetizador con manos sintéticas
+def bench_mapping(runner):
+    from handPositionCalculator import HandPositionCalculator
+    from audio_video_integration import integrate_audio_with_tracking
+
+    synthesizer = _make_synthesizer()
+    calculator = HandPositionCalculator(1280, 720)
+    right_hand = synthetic_hand(cx=0.8, cy=0.4, pinch=0.5)
+    left_hand = synthetic_hand(cx=0.3, cy=0.6, pinch=0.1)
+
+    def update_positions():
+        calculator.reset()
+        calculator.update_hand_position(right_hand, 'Right')
+        calculator.update_hand_position(left_hand, 'Left')
+
+    update_positions()
+    runner.run("mapping.update_hand_position[2 hands]", update_positions, number=500)
+    runner.run("mapping.detect_ok_gesture", lambda: calculator.detect_ok_gesture(left_hand, 'Left'), number=500)
+    from gesture_recognizer import GestureRecognizer
+    gestures = GestureRecognizer(aspect_ratio=1280 / 720)
+    landmarks = np.stack([synthetic_hand_array(cx=0.8, cy=0.4), synthetic_hand_array(cx=0.3, cy=0.6, pinch=0.0)])
+    runner.run("mapping.gesture_recognizer.update[2 hands]",
+               lambda: gestures.update(['Right', 'Left'], landmarks), number=500)
+    runner.run("mapping.integrate_audio_with_tracking",
+               lambda: integrate_audio_with_tracking(calculator, synthesizer), number=500)
+    runner.run("mapping.get_info", synthesizer.get_info, number=500)
+
+
+# Cada llamada de dibujo del HUD a resoluciones habituales
+def bench_hud(runner):
+    from opencv_draw import cv_draw
+    from opencv_dynamic import AdvancedVisualizer
+
+    synthesizer = _make_synthesizer()
+    for width, height in RESOLUTIONS:
+        frame = np.full((height, width, 3), 60, dtype=np.uint8)
+        tag = f"{width}x{height}"
+
+        visualizer = AdvancedVisualizer(frame_width=width, frame_height=height)
+        # Rellenar los rastros para medir el caso de régimen permanente
+        for i in range(visualizer.left_hand_trail.maxlen):
+            visualizer.draw_hand_trails(frame, left_hand_x=0.2 + i * 0.005, right_hand_y=0.3 + i * 0.01)
+
+        runner.run(f"hud.draw_theremin_guide[{tag}]", lambda f=frame: cv_draw.draw_theremin_guide(f), number=50)
+        runner.run(f"hud.draw_fps_info[{tag}]", lambda f=frame: cv_draw.draw_fps_info(f, 30.0, 0.02), number=50)
+        runner.run(f"hud.draw_hand_position[{tag}]",
+                   lambda f=frame: cv_draw.draw_hand_position(f, 0.4, 0.3), number=50)
+        runner.run(f"hud.draw_audio_info[{tag}]",
+                   lambda f=frame: cv_draw.draw_audio_info(f, synthesizer, position=(50, 370)), number=50)
+        runner.run(f"hud.draw_wave_type[{tag}]", lambda f=frame: cv_draw.draw_wave_type(f, 'sine'), number=50)
+        runner.run(f"hud.draw_gesture_indicator[{tag}]",
+                   lambda f=frame: cv_draw.draw_gesture_indicator(f, gesture_active=False), number=50)
+        runner.run(f"hud.viz.draw_hand_trails[{tag}]",
+                   lambda f=frame, v=visualizer: v.draw_hand_trails(f, left_hand_x=0.3, right_hand_y=0.4), number=50)
+        runner.run(f"hud.viz.draw_dynamic_colors[{tag}]",
+                   lambda f=frame, v=visualizer: v.draw_dynamic_colors(f, 440.0, 0.7, 0.3, 0.4), number=50)
+
+    # Dibujo de las manos: SkeletonRenderer por nivel de detalle y, si MediaPipe está instalado, mp_drawing como
+    # referencia (estilos construidos en cada llamada, como hacía VideoProcessor.draw_hands)
+    from types import SimpleNamespace
+    from skeleton_renderer import OVERLAY_DETAILS, SkeletonRenderer
+
+    results = SimpleNamespace(
+        multi_hand_landmarks=[synthetic_hand(0.7, 0.4, scale=0.1, pinch=0.5), synthetic_hand(0.3, 0.5, scale=0.1)],
+        multi_handedness=[SimpleNamespace(classification=[SimpleNamespace(label=label, score=1.0)])
+                          for label in ('Right', 'Left')])
+    renderer = SkeletonRenderer()
+    try:
+        import mediapipe as mp
+        from mediapipe.framework.formats import landmark_pb2
+        protos = [landmark_pb2.NormalizedLandmarkList(
+            landmark=[landmark_pb2.NormalizedLandmark(x=lm.x, y=lm.y, z=lm.z) for lm in hand.landmark])
+            for hand in results.multi_hand_landmarks]
+    except ImportError:
+        mp = None
+    for width, height in RESOLUTIONS:
+        frame = np.full((height, width, 3), 60, dtype=np.uint8)
+        tag = f"{width}x{height}"
+        for detail in OVERLAY_DETAILS:
+            runner.run(f"hud.draw_hands[{detail},{tag}]",
+                       lambda f=frame, d=detail: renderer.draw(f, results, d), number=50)
+        if mp is not None:
+            runner.run(f"hud.mp_draw_landmarks[{tag}]",
+                       lambda f=frame: [mp.solutions.drawing_utils.draw_landmarks(
+                           f, hand, mp.solutions.hands.HAND_CONNECTIONS,
+                           mp.solutions.drawing_styles.get_default_hand_landmarks_style(),
+                           mp.solutions.drawing_styles.get_default_hand_connections_style()) for hand in protos],
+                       number=50)
+
+
+# Throughput completo de VideoProcessor sobre el video sintético (captura + MediaPipe + dibujo de landmarks)
+def bench_video(runner):
+    import cv2
+    from video_processor import VideoProcessor
+
+    # Lo que ahorra negociar el modo de la cámara: el reescalado por frame desde el modo por defecto del driver
+    for source_size, target_size in (((640, 480), (1280, 720)), ((1920, 1080), (1280, 720)),
+                                     ((1280, 720), (1440, 810))):
+        frame = np.full((source_size[1], source_size[0], 3), 90, dtype=np.uint8)
+        runner.run(f"video.resize[{source_size[0]}x{source_size[1]}->{target_size[0]}x{target_size[1]}]",
+                   lambda f=frame, t=target_size: cv2.resize(f, t), number=50)
+
+    # Preparación de la entrada de MediaPipe: antes espejo + RGB nuevo, ahora RGB sobre un buffer reutilizado
+    # (el espejo se aplica a los landmarks)
+    for width, height in RESOLUTIONS:
+        frame = np.full((height, width, 3), 90, dtype=np.uint8)
+        rgb = np.empty_like(frame)
+        runner.run(f"video.preprocess.flip_cvt[{width}x{height}]",
+                   lambda f=frame: cv2.cvtColor(cv2.flip(f, 1), cv2.COLOR_BGR2RGB), number=50)
+        runner.run(f"video.preprocess.cvt_into[{width}x{height}]",
+                   lambda f=frame, b=rgb: cv2.cvtColor(f, cv2.COLOR_BGR2RGB, dst=b), number=50)
+
+    # Throughput con cada backend de inferencia: 'solutions' bloquea el bucle, 'live_stream' infiere en otro hilo
+    # y descarta los frames que llegan con el modelo ocupado (results_per_s = frames con landmarks nuevos)
+    import os
+    from hand_landmarker import DEFAULT_MODEL_PATH
+
+    path = ensure_synthetic_video()
+    backends = ['solutions']
+    if os.path.exists(DEFAULT_MODEL_PATH):
+        backends.append('live_stream')
+    else:
+        print(f"  [skip] video.process_frame[live_stream]: falta el modelo {DEFAULT_MODEL_PATH}")
+    for backend in backends:
+        for width, height in RESOLUTIONS[:2]:
+            processor = VideoProcessor(source=path, size=(width, height), save_video=False, background_init=False,
+                                       inference_backend=backend)
+            frame_times = []
+            new_results = 0
+            last_results = None
+            loop_start = time.perf_counter()
+            try:
+                while True:
+                    start = time.perf_counter()
+                    frame, _, _ = processor.process_frame()
+                    if frame is None:
+                        break
+                    frame_times.append(time.perf_counter() - start)
+                    if processor.results_time != last_results:
+                        new_results += 1
+                        last_results = processor.results_time
+                    if runner.quick and len(frame_times) >= 20:
+                        break
+            finally:
+                elapsed = time.perf_counter() - loop_start
+                processor.cap.release()
+                processor.hands.close()
+
+            samples = np.array(frame_times[3:] or frame_times)
+            # El backend síncrono conserva el nombre de siempre para poder comparar con baselines anteriores
+            name = f"{width}x{height}" if backend == 'solutions' else f"{backend},{width}x{height}"
+            runner.add_result(f"video.process_frame[{name}]", {
+                'calls': int(samples.size),
+                'min': float(samples.min()),
+                'median': float(np.median(samples)),
+                'mean': float(samples.mean()),
+                'p95': float(np.percentile(samples, 95)),
+            })
+            print(f"    {backend} {width}x{height}: {len(frame_times) / elapsed:.1f} frames/s, "
+                  f"{new_results / elapsed:.1f} results/s")
+
+
+# Latencia movimiento -> sonido en el reloj virtual de latency_harness (segundos, como el resto de casos)
+def bench_latency(runner):
+    import latency_harness
+
+    onsets = latency_harness.make_step_script(duration=8.0 if runner.quick else 20.0)
+    events = latency_harness.run_video_pass(latency_harness.SCRIPT_PATH)
+    for buffer_size in (256, 1024):
+        result = latency_harness.measure(events, onsets, buffer_size)
+        stats = result['latency_ms']
+        if stats is None:
+            continue
+        runner.add_result(f"latency.motion_to_sound[{buffer_size}]", {
+            'calls': stats['count'],
+            'min': stats['min'] / 1000.0,
+            'median': stats['median'] / 1000.0,
+            'mean': stats['mean'] / 1000.0,
+            'p95': stats['p95'] / 1000.0,
+        })
+
+
+GROUPS = {
+    'synth': bench_synth,
+    'delay': bench_delay,
+    'reverb': bench_reverb,
+    'recording': bench_recording,
+    'effects': bench_effects,
+    'mapping': bench_mapping,
+    'hud': bench_hud,
+    'video': bench_video,
+    'latency': bench_latency,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks del Theremín Virtual")
+    parser.add_argument('--groups', nargs='+', choices=sorted(GROUPS), default=list(GROUPS),
+                        help="Grupos a ejecutar (por defecto todos)")
+    parser.add_argument('--filter', default=None, help="Ejecutar solo los casos cuyo nombre contenga este texto")
+    parser.add_argument('--quick', action='store_true', help="Menos repeticiones, para comprobaciones rápidas")
+    parser.add_argument('--save', metavar='PATH', help="Guardar los resultados como baseline JSON")
+    parser.add_argument('--compare', metavar='PATH', help="Comparar con un baseline y marcar regresiones")
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help="Empeoramiento relativo de la mediana que se considera regresión (0.15 = 15%%)")
+    args = parser.parse_args(argv)
+
+    runner = BenchmarkRunner(quick=args.quick, name_filter=args.filter)
+    for group in args.groups:
+        print(f"\n[{group}]")
+        try:
+            GROUPS[group](runner)
+        except ImportError as e:
+            # Dependencias opcionales (mediapipe, pyaudio...) que no estén instaladas
+            runner.skip(group, str(e))
+
+    if args.save:
+        save_baseline(runner.results, args.save, runner.skipped)
+
+    if args.compare:
+        regressions = compare_with_baseline(runner.results, load_baseline(args.compare), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regresiones por encima del {args.threshold * 100:.0f}%")
+            return 1
+        print("\nSin regresiones")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
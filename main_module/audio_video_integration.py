@@ -11,6 +11,7 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'utils'))
 
 from theremin_synthesizer import ThereminSynthesizer
 from opencv_draw import cv_draw
+from control_mapping import ControlMapper, features_from_calculator
 
 # ---------------CONSTANTES DE CONFIGURACIÓN ----------------------
 
@@ -28,54 +29,69 @@ REVERB_TOP = 0.30      # Posición Y para reverb máximo
 REVERB_BOTTOM = 0.85   # Posición Y para reverb mínimo
 DELAY_MAX = 0.8        # Segundos máx de reverb
 DELAY_MIN = 0.1        # Segundos mín de reverb
+WET_MAX = 0.6          # Mezcla máx de la reverb por convolución
+WET_MIN = 0.0          # Mezcla mín de la reverb por convolución
 
 #------------------------------- ----------------------
 
 
-def integrate_audio_with_tracking(position_calculator, synthesizer):
+# Mapeo por defecto, equivalente a las constantes anteriores (ver mappings.json para cargarlo desde fichero)
+DEFAULT_MAPPING_CONFIG = {
+    'mappings': [
+        # Mano derecha Y -> pitch (el sintetizador aplica la escala logarítmica)
+        {'source': 'right_hand_y', 'target': 'pitch_position', 'in_range': [0.0, 1.0], 'out_range': [0.0, 1.0],
+         'clamp': False},
+        # Mano izquierda X -> volumen, limitado a la zona izquierda
+        {'source': 'left_hand_x', 'target': 'volume_position', 'in_range': [0.0, LEFT_ZONE_LIMIT],
+         'out_range': [0.0, 1.0]},
+        # Pinch mano derecha -> vibrato
+        {'source': 'right_hand_pinch', 'target': 'vibrato_depth', 'in_range': [PINCH_MIN, PINCH_MAX],
+         'out_range': [VIBRATO_MIN, VIBRATO_MAX]},
+        # Mano izquierda Y -> reverb. Invertido: arriba = más reverb, abajo = menos
+        {'source': 'left_hand_y', 'target': 'delay_seconds', 'in_range': [REVERB_TOP, REVERB_BOTTOM],
+         'out_range': [DELAY_MAX, DELAY_MIN]},
+        # La misma mano controla la mezcla cuando la reverb es por convolución
+        {'source': 'left_hand_y', 'target': 'reverb_mix', 'in_range': [REVERB_TOP, REVERB_BOTTOM],
+         'out_range': [WET_MAX, WET_MIN]},
+    ]
+}
+
+default_mapper = ControlMapper(DEFAULT_MAPPING_CONFIG)
+
+
+# freeze_pitch: mantiene la nota actual (la mano derecha deja de controlar el pitch)
+def integrate_audio_with_tracking(position_calculator, synthesizer, mapper=None, freeze_pitch=False):
     
-    right_y = position_calculator.get_right_hand_y()
-    left_x = position_calculator.get_left_hand_x()
-    left_y = position_calculator.get_left_hand_y()
-    
-    # Mapear posición X mano izquierda a volumen
-    mapped_left_x = None
-    if left_x is not None:
-        if left_x <= LEFT_ZONE_LIMIT:
-            mapped_left_x = left_x / LEFT_ZONE_LIMIT
-        else:
-            mapped_left_x = 1.0
-            
-    
-    right_pinch = position_calculator.get_right_hand_pinch()
-
-    # CALCULO DEL VIBRATO
-    vibrato_depth = None
-    if right_pinch is not None:
-        # Normalizar pinch y calculamos la profundidad del vibrato
-        norm_pinch = max(0.0, min(1.0, (right_pinch - PINCH_MIN) / (PINCH_MAX - PINCH_MIN)))
-        vibrato_depth = VIBRATO_MIN + (norm_pinch * (VIBRATO_MAX - VIBRATO_MIN)) 
-
-    # CALCULO DE LA REVERB
-    delay_seconds = None
-    if left_y is not None:
-        # Normalizar al rango útil
-        normalized_y = (left_y - REVERB_TOP) / (REVERB_BOTTOM - REVERB_TOP)
-        normalized_y = max(0.0, min(1.0, normalized_y))  # Clamp entre 0 y 1
-        
-        # Invertimos: Arriba = Más rev, Abajo = Menos rev
-        delay_seconds = DELAY_MAX - (normalized_y * (DELAY_MAX - DELAY_MIN))
-
-    synthesizer.update_position(right_y, mapped_left_x)
-    synthesizer.update_parameters(vibrato_depth=vibrato_depth, delay_seconds=delay_seconds)
-
-
-def draw_audio_info(frame, synthesizer, position=(50, 370)):
+    # Mapear las características de las manos a parámetros del sintetizador
+    mapper = mapper or default_mapper
+    targets = mapper.map_features(features_from_calculator(position_calculator))
+    if freeze_pitch:
+        targets['pitch_position'] = None
+    apply_targets(synthesizer, targets)
+
+
+# Envía al sintetizador los parámetros mapeados (None = sin cambios / mano no detectada)
+def apply_targets(synthesizer, targets):
+    synthesizer.update_position(targets['pitch_position'], targets['volume_position'])
+    synthesizer.update_parameters(vibrato_depth=targets['vibrato_depth'], delay_seconds=targets['delay_seconds'],
+                                  reverb_mix=targets['reverb_mix'])
+
+
+# Parámetros del frame i a partir de los arrays de ControlMapper.map_arrays (NaN -> None)
+def targets_at(target_arrays, i):
+    targets = {}
+    for name, values in target_arrays.items():
+        value = values[i]
+        targets[name] = None if value != value else float(value)
+    return targets
+
+
+def draw_audio_info(frame, synthesizer, position=(50, 370), info=None):
     
-    cv_draw.draw_audio_info(frame, synthesizer, position=position)
+    cv_draw.draw_audio_info(frame, synthesizer, position=position, info=info)
 
 
-def draw_theremin_guide(frame):
+def draw_theremin_guide(frame, translucent=True):
     
-    cv_draw.draw_theremin_guide(frame)
+    cv_draw.draw_theremin_guide(frame, translucent=translucent)
 
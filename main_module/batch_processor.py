@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Procesado por lotes (sin pantalla) de ficheros de video usando varios núcleos
+Divide el video en segmentos que procesan varios procesos, cada uno con su propia instancia de MediaPipe.
+Cada segmento empieza unos frames antes (ventana de solapamiento) para que el tracking se estabilice
+y esos frames de calentamiento se descartan. Los segmentos se unen en una pista de landmarks ordenada
+(.thlm, ver landmark_recorder) y opcionalmente se renderiza el audio resultante a un fichero WAV.
+
+Uso:
+    python main_module/batch_processor.py ensayo.mp4 --workers 4 --landmarks ensayo.thlm --audio ensayo.wav
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+import wave
+
+import cv2
+import numpy as np
+
+# Agregar paths para importar módulos
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'video_module'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'audio_module'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'utils'))
+
+from landmark_recorder import (RECORD_DTYPE, LandmarkRecorder, fill_record, mirror_arrays, results_to_arrays,
+                               track_features)
+
+
+# Divide [0, total_frames) en segmentos contiguos (inicio, fin)
+def split_segments(total_frames, num_segments):
+    num_segments = max(1, min(num_segments, total_frames))
+    bounds = np.linspace(0, total_frames, num_segments + 1).astype(int)
+    return [(int(bounds[i]), int(bounds[i + 1])) for i in range(num_segments) if bounds[i + 1] > bounds[i]]
+
+
+# Procesa un segmento en un proceso independiente. Devuelve (inicio, registros del segmento)
+def _process_segment(task):
+    import mediapipe as mp
+
+    path, start, end, overlap, fps = task
+    warmup_start = max(0, start - overlap)
+
+    cap = cv2.VideoCapture(path)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, warmup_start)
+    hands = mp.solutions.hands.Hands(
+        static_image_mode=False,
+        max_num_hands=2,
+        min_detection_confidence=0.5,
+        min_tracking_confidence=0.5
+    )
+
+    records = np.zeros(end - start, dtype=RECORD_DTYPE)
+    count = 0
+    frame_rgb = None
+    try:
+        for frame_idx in range(warmup_start, end):
+            ret, frame = cap.read()
+            if not ret:
+                break
+
+            # Conversión a RGB sobre un buffer reutilizado; el frame no se voltea
+            if frame_rgb is None or frame_rgb.shape != frame.shape:
+                frame_rgb = np.empty_like(frame)
+            results = hands.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=frame_rgb))
+
+            # Los frames de solapamiento solo sirven para calentar el tracking
+            if frame_idx < start:
+                continue
+
+            # Mismo efecto espejo que en directo (sobre los landmarks) para que lateralidad y posiciones coincidan
+            labels, scores, landmarks = results_to_arrays(results)
+            labels, landmarks = mirror_arrays(labels, landmarks)
+            fill_record(records[count], labels, scores, landmarks, frame_idx / fps)
+            count += 1
+    finally:
+        cap.release()
+        hands.close()
+
+    return start, records[:count]
+
+
+# Procesa el video completo con un pool de procesos y devuelve la pista de landmarks ordenada
+def process_video(path, workers=None, overlap=30, segments=None):
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise RuntimeError(f"No se pudo abrir la fuente de video: {path}")
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    cap.release()
+
+    workers = workers or os.cpu_count() or 1
+    # Más segmentos que procesos para repartir mejor la carga
+    segment_bounds = split_segments(total_frames, segments or workers * 2)
+    tasks = [(path, start, end, overlap, fps) for start, end in segment_bounds]
+
+    print(f"Procesando {total_frames} frames ({fps:.1f} FPS) en {len(tasks)} segmentos con {workers} procesos")
+    start_time = time.perf_counter()
+
+    # 'spawn' para que cada proceso cree su propio grafo de MediaPipe desde cero
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(processes=workers) as pool:
+        parts = pool.map(_process_segment, tasks, chunksize=1)
+
+    parts.sort(key=lambda part: part[0])
+    records = np.concatenate([part[1] for part in parts]) if parts else np.zeros(0, dtype=RECORD_DTYPE)
+
+    elapsed = time.perf_counter() - start_time
+    print(f"{len(records)} frames procesados en {elapsed:.1f}s ({len(records) / max(elapsed, 1e-9):.1f} FPS)")
+    return records, fps
+
+
+# Renderiza el audio que habría sonado en directo a partir de la pista de landmarks.
+# El mapeo se calcula de una vez para toda la pista con el mismo ControlMapper que el bucle en directo.
+# Como en directo, el callback genera bloques de buffer_size: cada bloque usa los controles del último frame
+# llegado antes de que empiece y el resto de un bloque pasa al frame siguiente
+def render_audio(records, fps, synthesizer, mapper=None):
+    from audio_video_integration import apply_targets, default_mapper, targets_at
+
+    mapper = mapper or default_mapper
+    target_arrays = mapper.map_arrays(track_features(records))
+
+    samples_per_frame = synthesizer.sample_rate / fps
+    total_samples = int(round(len(records) * samples_per_frame))
+    block_size = synthesizer.buffer_size
+    output = np.zeros(-(-total_samples // block_size) * block_size, dtype=np.float32)
+
+    position = 0
+    for i in range(len(records)):
+        apply_targets(synthesizer, targets_at(target_arrays, i))
+
+        # Bloques que empiezan antes de que llegue el frame siguiente (la parte fraccionaria se acumula para no
+        # desincronizar audio y video)
+        next_position = int(round((i + 1) * samples_per_frame))
+        while position < next_position:
+            audio_bytes, _ = synthesizer._audio_callback(None, block_size, None, 0)
+            output[position:position + block_size] = np.frombuffer(audio_bytes, dtype=np.float32)
+            position += block_size
+
+    return output[:total_samples]
+
+
+# Guarda audio float32 (-1..1) como WAV PCM de 16 bits
+def write_wav(path, samples, sample_rate):
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype('<i2')
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm.tobytes())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Procesado por lotes de video para el Theremín Virtual")
+    parser.add_argument('video', help="Fichero de video a procesar")
+    parser.add_argument('--workers', type=int, default=None, help="Número de procesos (por defecto, núcleos disponibles)")
+    parser.add_argument('--segments', type=int, default=None, help="Número de segmentos (por defecto, 2 por proceso)")
+    parser.add_argument('--overlap', type=int, default=30, help="Frames de calentamiento antes de cada segmento")
+    parser.add_argument('--landmarks', default=None, help="Fichero .thlm de salida con la pista de landmarks")
+    parser.add_argument('--audio', default=None, help="Fichero .wav de salida con el audio renderizado")
+    parser.add_argument('--wave', default='sine', choices=['sine', 'square', 'saw', 'triangle'])
+    parser.add_argument('--mapping', default=None, help="Fichero JSON de mapeo (por defecto el mapeo estándar)")
+    args = parser.parse_args(argv)
+
+    records, fps = process_video(args.video, workers=args.workers, overlap=args.overlap, segments=args.segments)
+
+    if args.landmarks:
+        recorder = LandmarkRecorder(args.landmarks)
+        recorder.write_records(records)
+        recorder.close()
+        print(f"Landmarks guardados en {args.landmarks}")
+
+    if args.audio:
+        from theremin_synthesizer import ThereminSynthesizer
+        from control_mapping import ControlMapper
+        synthesizer = ThereminSynthesizer(sample_rate=44100, min_frequency=200.0, max_frequency=2000.0,
+                                          wave_type=args.wave, buffer_size=1024)
+        mapper = ControlMapper(path=args.mapping) if args.mapping else None
+        samples = render_audio(records, fps, synthesizer, mapper)
+        write_wav(args.audio, samples, synthesizer.sample_rate)
+        print(f"Audio guardado en {args.audio} ({len(samples) / synthesizer.sample_rate:.1f}s)")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+"""
+Motor de mapeo declarativo: característica de la mano -> rango/curva/LUT -> parámetro del sintetizador
+Cada mapeo se compila a una función de numpy que acepta un escalar o un array, así el bucle en directo
+(un valor por frame) y el procesado de pistas grabadas (todos los frames a la vez) comparten el mismo código.
+La configuración se lee de un JSON y se recarga en caliente al modificar el fichero.
+
+Ejemplo de configuración (ver mappings.json):
+    {"mappings": [
+        {"source": "left_hand_y", "target": "delay_seconds",
+         "in_range": [0.30, 0.85], "out_range": [0.8, 0.1], "curve": "linear", "clamp": true}
+    ]}
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+
+# Características que proporciona HandPositionCalculator (o una pista de landmarks)
+SOURCES = ('right_hand_y', 'left_hand_x', 'left_hand_y', 'right_hand_pinch', 'left_hand_pinch')
+
+# Parámetros del sintetizador que se pueden controlar
+#   pitch_position  -> right_hand_y de update_position (0 = agudo, 1 = grave)
+#   volume_position -> left_hand_x de update_position (0 = silencio, 1 = máximo)
+#   reverb_mix      -> nivel de la señal húmeda en modo de reverb por convolución
+TARGETS = ('pitch_position', 'volume_position', 'vibrato_depth', 'delay_seconds', 'reverb_mix')
+
+CURVES = ('linear', 'power', 'exp', 'lut')
+
+
+# Compila un mapeo a una función vectorizada f(x) -> y
+def compile_mapping(spec):
+    source = spec['source']
+    target = spec['target']
+    if source not in SOURCES:
+        raise ValueError(f"Fuente desconocida: {source} (opciones: {', '.join(SOURCES)})")
+    if target not in TARGETS:
+        raise ValueError(f"Destino desconocido: {target} (opciones: {', '.join(TARGETS)})")
+
+    in_min, in_max = (float(v) for v in spec.get('in_range', (0.0, 1.0)))
+    out_min, out_max = (float(v) for v in spec.get('out_range', (0.0, 1.0)))
+    if in_max == in_min:
+        raise ValueError(f"in_range vacío en el mapeo {source} -> {target}")
+    clamp = bool(spec.get('clamp', True))
+    curve = spec.get('curve', 'linear')
+    if curve not in CURVES:
+        raise ValueError(f"Curva desconocida: {curve} (opciones: {', '.join(CURVES)})")
+
+    in_scale = 1.0 / (in_max - in_min)
+    out_scale = out_max - out_min
+
+    if curve == 'power':
+        exponent = float(spec.get('exponent', 2.0))
+        shape = lambda t: np.power(np.maximum(t, 0.0), exponent)
+    elif curve == 'exp':
+        # Curva exponencial normalizada (0 -> 0, 1 -> 1), k > 0 acelera al final
+        k = float(spec.get('k', 3.0))
+        norm = 1.0 / np.expm1(k)
+        shape = lambda t: np.expm1(k * t) * norm
+    elif curve == 'lut':
+        # Tabla de puntos (entrada normalizada, salida normalizada) con interpolación lineal
+        points = np.asarray(spec['lut'], dtype=np.float64)
+        if points.ndim != 2 or points.shape[1] != 2 or len(points) < 2:
+            raise ValueError("lut debe ser una lista de pares [entrada, salida]")
+        lut_x = points[:, 0].copy()
+        lut_y = points[:, 1].copy()
+        shape = lambda t: np.interp(t, lut_x, lut_y)
+    else:
+        shape = None
+
+    def mapping(x):
+        t = (np.asarray(x, dtype=np.float64) - in_min) * in_scale
+        if clamp:
+            t = np.clip(t, 0.0, 1.0)
+        if shape is not None:
+            t = shape(t)
+        return out_min + t * out_scale
+
+    mapping.source = source
+    mapping.target = target
+    return mapping
+
+
+def compile_config(config):
+    mappings = config.get('mappings')
+    if not isinstance(mappings, list):
+        raise ValueError("La configuración necesita una lista 'mappings'")
+    return [compile_mapping(spec) for spec in mappings]
+
+
+class ControlMapper:
+
+    def __init__(self, config=None, path=None, reload_interval=1.0):
+        # config: diccionario ya cargado; path: fichero JSON (tiene prioridad y se recarga en caliente)
+        self.path = path
+        self.reload_interval = reload_interval
+        self.last_check = time.perf_counter()
+        self.last_mtime = None
+
+        if path is not None:
+            self.mappings = self._load(path)
+        else:
+            self.mappings = compile_config(config)
+
+    def _load(self, path):
+        self.last_mtime = os.path.getmtime(path)
+        with open(path) as f:
+            return compile_config(json.load(f))
+
+    # Comprueba (como mucho una vez por reload_interval) si el fichero ha cambiado y recompila.
+    # Si la nueva configuración tiene errores se mantiene la anterior. Devuelve True si se recargó
+    def maybe_reload(self, now=None):
+        if self.path is None:
+            return False
+        if now is None:
+            now = time.perf_counter()
+        if now - self.last_check < self.reload_interval:
+            return False
+        self.last_check = now
+
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return False
+        if mtime == self.last_mtime:
+            return False
+
+        try:
+            mappings = self._load(self.path)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            # No volvemos a intentarlo hasta que el fichero cambie otra vez
+            self.last_mtime = mtime
+            print(f"Advertencia: no se pudo recargar {self.path} ({e}), se mantiene el mapeo anterior")
+            return False
+
+        # Sustitución atómica de la lista completa
+        self.mappings = mappings
+        print(f"Mapeo recargado desde {self.path}")
+        return True
+
+    # Mapea un frame. features: {fuente: valor o None}. Devuelve {destino: float o None}
+    def map_features(self, features):
+        targets = dict.fromkeys(TARGETS)
+        for mapping in self.mappings:
+            value = features.get(mapping.source)
+            if value is not None:
+                targets[mapping.target] = float(mapping(value))
+        return targets
+
+    # Mapea pistas completas. features: {fuente: array (NaN = mano no detectada)}. Devuelve {destino: array}
+    def map_arrays(self, features):
+        length = len(next(iter(features.values())))
+        targets = {target: np.full(length, np.nan) for target in TARGETS}
+        for mapping in self.mappings:
+            values = features.get(mapping.source)
+            if values is not None:
+                targets[mapping.target] = mapping(values)
+        return targets
+
+
+# Lee las características de HandPositionCalculator para un frame
+def features_from_calculator(position_calculator):
+    return {
+        'right_hand_y': position_calculator.get_right_hand_y(),
+        'left_hand_x': position_calculator.get_left_hand_x(),
+        'left_hand_y': position_calculator.get_left_hand_y(),
+        'right_hand_pinch': position_calculator.get_right_hand_pinch(),
+        'left_hand_pinch': position_calculator.get_left_hand_pinch(),
+    }
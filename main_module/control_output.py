@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Salida de control hacia sintetizadores externos: OSC y bytes MIDI por UDP
+El bucle de visión solo deja el último estado (publish no bloquea nunca); un hilo dedicado lo envía.
+Si llegan varios estados antes de que el hilo los envíe solo se manda el último.
+Los paquetes están precodificados: un bundle OSC con todos los mensajes en posiciones fijas (solo se
+sobrescriben los floats) y plantillas de los mensajes MIDI (pitch bend, CC, note on/off).
+
+Direcciones OSC (float32): <prefix>/frequency (Hz), /volume (0-1), /vibrato (profundidad), /delay (s), /reverb (mezcla)
+MIDI: nota más cercana con note on/off, desviación en pitch bend (±bend_range semitonos),
+      CC7 = volumen, CC1 = vibrato, CC91 = reverb. Solo se envían los mensajes cuyo valor cambia.
+
+Para comprobar la salida sin un sintetizador:
+    python main_module/control_output.py --listen 9000
+"""
+
+import argparse
+import math
+import socket
+import struct
+import threading
+
+OSC_FIELDS = ('frequency', 'volume', 'vibrato', 'delay', 'reverb')
+
+# Rango de vibrato_depth del sintetizador (para escalarlo a CC)
+VIBRATO_MAX = 0.025
+
+CC_VOLUME = 7
+CC_MODULATION = 1
+CC_REVERB = 91
+
+
+def _osc_string(text):
+    data = text.encode('ascii') + b'\0'
+    return data + b'\0' * (-len(data) % 4)
+
+
+# Mensaje OSC con un float; devuelve (bytes, posición del float dentro del mensaje)
+def encode_osc_message(address, value=0.0):
+    head = _osc_string(address) + _osc_string(',f')
+    return head + struct.pack('>f', value), len(head)
+
+
+# Decodifica un bundle (o mensaje) OSC de floats en [(dirección, valor)]. Para pruebas y para --listen
+def decode_osc(data):
+    if data.startswith(b'#bundle\0'):
+        messages = []
+        position = 16  # '#bundle\0' + timetag
+        while position < len(data):
+            (size,) = struct.unpack_from('>i', data, position)
+            messages.extend(decode_osc(data[position + 4:position + 4 + size]))
+            position += 4 + size
+        return messages
+
+    end = data.index(b'\0')
+    address = data[:end].decode('ascii')
+    position = end + 1 + (-(end + 1) % 4)
+    tags_end = data.index(b'\0', position)
+    tags = data[position + 1:tags_end].decode('ascii')
+    position = tags_end + 1 + (-(tags_end + 1) % 4)
+    values = struct.unpack_from('>' + 'f' * len(tags), data, position) if tags else ()
+    return [(address, value) for value in values]
+
+
+# Bundle OSC precodificado con un mensaje por campo; update() solo reescribe los floats
+class OscBundleTemplate:
+
+    def __init__(self, prefix, fields=OSC_FIELDS):
+        # Timetag 1 = "inmediatamente"
+        packet = bytearray(b'#bundle\0' + struct.pack('>Q', 1))
+        self.offsets = []
+        for field in fields:
+            message, value_offset = encode_osc_message(f"{prefix}/{field}")
+            packet += struct.pack('>i', len(message))
+            self.offsets.append(len(packet) + value_offset)
+            packet += message
+        self.packet = packet
+        self.fields = fields
+
+    def update(self, values):
+        for offset, value in zip(self.offsets, values):
+            struct.pack_into('>f', self.packet, offset, value)
+        return self.packet
+
+
+# Genera los bytes MIDI del estado: mantiene la nota mientras la desviación cabe en el pitch bend
+class MidiEncoder:
+
+    def __init__(self, channel=0, bend_range=2.0, velocity=100, gate=0.01):
+        self.bend_range = bend_range
+        self.velocity = velocity
+        self.gate = gate  # Volumen por debajo del cual la nota se apaga
+        # Plantillas (status + datos); solo se cambian los bytes de datos
+        self.note_on = bytearray((0x90 | channel, 0, velocity))
+        self.note_off = bytearray((0x80 | channel, 0, 0))
+        self.pitch_bend = bytearray((0xE0 | channel, 0, 0x40))
+        self.control_change = bytearray((0xB0 | channel, 0, 0))
+        self.note = None
+        self.last_bend = None
+        self.last_cc = {}
+
+    def _cc(self, out, number, value):
+        value = min(127, max(0, int(round(value * 127))))
+        if self.last_cc.get(number) != value:
+            self.control_change[1] = number
+            self.control_change[2] = value
+            out += self.control_change
+            self.last_cc[number] = value
+
+    def _stop_note(self, out):
+        if self.note is not None:
+            self.note_off[1] = self.note
+            out += self.note_off
+            self.note = None
+
+    # Devuelve los bytes que hay que enviar para pasar al nuevo estado (vacío si nada cambió)
+    def encode(self, frequency, volume, vibrato, reverb):
+        out = bytearray()
+        self._cc(out, CC_VOLUME, volume)
+        self._cc(out, CC_MODULATION, vibrato / VIBRATO_MAX)
+        self._cc(out, CC_REVERB, reverb)
+
+        if volume <= self.gate or frequency <= 0:
+            self._stop_note(out)
+            return out
+
+        midi = 69 + 12 * math.log2(frequency / 440.0)
+        # Nueva nota solo si la desviación ya no cabe en el rango del pitch bend
+        if self.note is None or abs(midi - self.note) > self.bend_range:
+            self._stop_note(out)
+            note = min(127, max(0, int(round(midi))))
+            self.last_bend = None
+        else:
+            note = self.note
+
+        bend = min(16383, max(0, int(round(8192 + (midi - note) / self.bend_range * 8192))))
+        # El bend va antes del note on para que la nota empiece ya afinada
+        if bend != self.last_bend:
+            self.pitch_bend[1] = bend & 0x7F
+            self.pitch_bend[2] = bend >> 7
+            out += self.pitch_bend
+            self.last_bend = bend
+
+        if self.note is None:
+            self.note_on[1] = note
+            out += self.note_on
+            self.note = note
+        return out
+
+    def all_notes_off(self):
+        out = bytearray()
+        self._stop_note(out)
+        return out
+
+
+class ControlOutput:
+
+    # osc_port / midi_port = None desactiva esa salida
+    def __init__(self, host='127.0.0.1', osc_port=9000, midi_port=None, osc_prefix='/theremin',
+                 midi_channel=0, bend_range=2.0, metrics=None):
+        self.osc_target = (host, osc_port) if osc_port is not None else None
+        self.midi_target = (host, midi_port) if midi_port is not None else None
+        self.osc = OscBundleTemplate(osc_prefix)
+        self.midi = MidiEncoder(channel=midi_channel, bend_range=bend_range)
+        self.metrics = metrics
+
+        # Socket no bloqueante: si el buffer del sistema está lleno el paquete se descarta
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+
+        self.latest = None
+        self.pending = threading.Event()
+        self.running = False
+        self.thread = None
+        self.packets_sent = 0
+        self.packets_dropped = 0
+        self.updates_coalesced = 0
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="control-output", daemon=True)
+        self.thread.start()
+
+    # Llamado desde el bucle de visión con el dict de synthesizer.get_info(). No bloquea
+    def publish(self, info):
+        if self.pending.is_set():
+            self.updates_coalesced += 1
+        # La asignación de una referencia es atómica; el hilo siempre lee el estado más reciente
+        self.latest = (float(info['frequency']), float(info['volume']) / 100.0, float(info['vibrato_depth']),
+                       float(info['delay_seconds']), float(info['reverb_mix']))
+        self.pending.set()
+
+    def _send(self, data, target):
+        try:
+            self.sock.sendto(data, target)
+            self.packets_sent += 1
+        except (BlockingIOError, OSError):
+            self.packets_dropped += 1
+
+    def _run(self):
+        while True:
+            self.pending.wait()
+            self.pending.clear()
+            if not self.running:
+                break
+            frequency, volume, vibrato, delay, reverb = self.latest
+
+            if self.osc_target is not None:
+                self._send(self.osc.update((frequency, volume, vibrato, delay, reverb)), self.osc_target)
+            if self.midi_target is not None:
+                data = self.midi.encode(frequency, volume, vibrato, reverb)
+                if data:
+                    self._send(data, self.midi_target)
+
+            if self.metrics is not None:
+                self.metrics.set_counter('control_output_sent', self.packets_sent)
+                self.metrics.set_counter('control_output_dropped', self.packets_dropped)
+
+    def close(self):
+        if self.thread is not None:
+            self.running = False
+            self.pending.set()
+            self.thread.join()
+            self.thread = None
+        # Que no quede ninguna nota sonando en el sintetizador externo
+        if self.midi_target is not None:
+            data = self.midi.all_notes_off()
+            if data:
+                self._send(data, self.midi_target)
+        self.sock.close()
+
+
+# Escucha en un puerto UDP e imprime lo recibido (OSC decodificado o bytes MIDI en hexadecimal)
+def listen(port, host='127.0.0.1', midi=False):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((host, port))
+    print(f"Escuchando en {host}:{port} ({'MIDI' if midi else 'OSC'}), Ctrl+C para salir")
+    try:
+        while True:
+            data, _ = sock.recvfrom(4096)
+            if midi:
+                print(data.hex(' '))
+            else:
+                print('  '.join(f"{address}={value:.4f}" for address, value in decode_osc(data)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sock.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monitor de la salida OSC/MIDI del Theremín Virtual")
+    parser.add_argument('--listen', type=int, required=True, metavar='PORT', help="Puerto UDP a escuchar")
+    parser.add_argument('--midi', action='store_true', help="Mostrar los bytes como MIDI en lugar de OSC")
+    args = parser.parse_args()
+    listen(args.listen, midi=args.midi)
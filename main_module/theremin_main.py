@@ -1,30 +1,29 @@
 #!/usr/bin/env python3
 
-import cv2
-import numpy as np
 import time
-import mediapipe as mp
+_PROCESS_START = time.perf_counter()  # Referencia para el informe de tiempos de arranque
+
+import numpy as np
 import sys
 import os
-import argparse  
-import tkinter as tk
 
 # Agregar paths para importar módulos
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'video_module'))
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'audio_module'))
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'utils'))
 
-from handPositionCalculator import HandPositionCalculator
-from theremin_synthesizer import ThereminSynthesizer
-from audio_video_integration import integrate_audio_with_tracking, draw_audio_info, draw_theremin_guide
-from video_processor import VideoProcessor
+from performance_metrics import PerformanceMetrics, StartupTimer
 
-from opencv_draw import cv_draw
-from opencv_dynamic import AdvancedVisualizer
+# El resto de módulos (OpenCV, video, grabadores, salida OSC/MIDI, trazas, gobernador...) se importan dentro de
+# theremin_virtual, cada uno en la rama que lo activa y medido como fase 'import.*' del StartupTimer: el audio
+# arranca antes de cargar OpenCV y lo que no se usa no se carga
+_IMPORTS_DONE = time.perf_counter()
 
 #Funcion para obtener resolucion de pantalla, usamos 1440x810 si falla
+# tkinter se importa aquí para no crear una ventana Tk solo por importar el módulo
 def get_screen_resolution():
     try:
+        import tkinter as tk
         root = tk.Tk()
         root.withdraw()  # Ocultar ventana
         width = root.winfo_screenwidth()
@@ -36,103 +35,357 @@ def get_screen_resolution():
         print("Usando resolución por defecto: 1440x810")
         return (1440, 810)
 
+
+WAVE_TYPES = ['sine', 'square', 'saw', 'triangle']
+
+
+# Acciones asociadas a gestos y teclas
+def next_wave_type(synthesizer):
+    synthesizer.wave_type = WAVE_TYPES[(WAVE_TYPES.index(synthesizer.wave_type) + 1) % len(WAVE_TYPES)]
+    print(f"Tipo de onda cambiado a: {synthesizer.wave_type.upper()}")
+
+
+def toggle_reverb(synthesizer):
+    synthesizer.reverb_enabled = not synthesizer.reverb_enabled
+    print(f"Reverb {'activada' if synthesizer.reverb_enabled else 'desactivada'}")
+
+
+def toggle_control(controls, name):
+    controls[name] = not controls[name]
+    print(f"{name}: {'on' if controls[name] else 'off'}")
+
+
+# Resolución de proceso en modo headless: no hay pantalla que consultar y un frame pequeño abarata resize y cvtColor
+HEADLESS_SIZE = (640, 360)
+
+
+# Ranuras de los buses de frames: el de cámara deja margen a consumidores lentos (grabador, otros procesos),
+# el del HUD solo necesita la que se muestra, la que se está dibujando y una de reserva
+RAW_BUS_SLOTS = 8
+HUD_BUS_SLOTS = 3
+
+
+# Compone el HUD completo sobre el frame (solo en los frames que se muestran). frame es la capa del HUD,
+# nunca el frame de la cámara. governor: QualityGovernor opcional, su nivel decide qué se dibuja
+def draw_hud(frame, video_processor, synthesizer, info, advanced_viz, fps_avg, process_time,
+             right_y, left_x, active_gestures, governor=None):
+    # Ya cargados al crear el HUD: aquí solo se buscan en sys.modules
+    from audio_video_integration import draw_audio_info, draw_theremin_guide
+    from opencv_draw import cv_draw
+    from quality_governor import QUALITY_LEVELS
+
+    settings = governor.settings if governor is not None else QUALITY_LEVELS[0]
+    if not video_processor.frames_annotated:
+        video_processor.draw_hands(frame, max_detail=settings['overlay'])
+
+    if settings['panels'] == 'simple':
+        # Paneles reducidos: guía sin transparencias y una línea de estado
+        draw_theremin_guide(frame, translucent=False)
+        cv_draw.draw_status_line(frame, fps_avg, info, synthesizer.wave_type,
+                                 quality=(governor.level, governor.name) if governor is not None else None)
+        return
+
+    draw_theremin_guide(frame)
+
+    current_frequency = info['frequency']
+    current_volume = info['volume'] / 100.0  # Convertir a 0.0-1.0
+
+    if settings['visual_effects']:
+        advanced_viz.draw_hand_trails(frame, left_hand_x=left_x, right_hand_y=right_y)
+        advanced_viz.draw_dynamic_colors(frame, current_frequency, current_volume, left_x, right_y)
+
+    cv_draw.draw_fps_info(frame, fps_avg, process_time, position=(50, 60))
+    if governor is not None:
+        cv_draw.draw_quality_level(frame, governor.level, governor.name, position=(230, 60))
+    cv_draw.draw_hand_position(frame, right_y, left_x, position=(50, 200))
+
+    draw_audio_info(frame, synthesizer, position=(50, 370), info=info)
+
+    cv_draw.draw_wave_type(frame, synthesizer.wave_type, position=(50, 580))
+
+    cv_draw.draw_gesture_indicator(frame, gesture_active='ok' in active_gestures, position=(50, 650))
+
 # Funcion principal del theremin.
-def theremin_virtual(source=0, size=get_screen_resolution(), wave_type='sine'):
+# metrics_path: fichero .json o .csv donde volcar las métricas de rendimiento cada metrics_interval segundos
+# record_landmarks: fichero .thlm donde grabar los landmarks detectados
+# replay_path: reproduce un fichero .thlm en lugar de usar la cámara (replay_realtime=False para máxima velocidad)
+# save_video: graba la sesión en segundo plano; video_options se pasa a VideoProcessor (video_path, video_codec, video_size...)
+# size=None detecta la resolución de pantalla al llamar a la función (no al importar)
+# mapping_config: fichero JSON de mapeo (ver mappings.json), se recarga en caliente al guardarlo
+# reverb_mode: 'echo' (eco simple) o 'convolution'; impulse_response: WAV de la IR (None = IR sintética)
+# audio_process: genera el audio en un proceso aparte (sin competir por el GIL con el video); misma interfaz
+# control_output: envía pitch/volumen/vibrato/reverb por OSC y MIDI sobre UDP a sintetizadores externos.
+#   Diccionario con las opciones de ControlOutput, p.ej. {'host': '127.0.0.1', 'osc_port': 9000, 'midi_port': 9001}
+# display_fps: frecuencia máxima de refresco del HUD e imshow; el tracking y el control siguen a la velocidad de la cámara
+# headless: sin ventana ni HUD; las teclas (q = salir, s = cambiar onda) se leen de la terminal
+# frame_consumers: funciones consumer(raw_bus, hud_bus, stop_event) que se lanzan en procesos aparte y leen
+#   los frames de cámara y del HUD de los FrameBus sin copias (hud_bus es None en modo headless)
+# record_audio: fichero .wav donde grabar lo que suena (sin bloquear el callback). Con save_video empieza
+#   en el instante del primer frame grabado para que audio y video queden alineados
+# trace_path: graba una traza de la línea de tiempo (frames, etapas, callbacks de audio, esperas por locks) en un
+#   anillo de trace_capacity eventos y la escribe en formato Chrome trace al salir o al pulsar t
+# effects / post_effects: efectos de audio_module/effects.py (StateVariableFilter, Chorus, SoftLimiter...) antes de la reverb
+#   y después de la ganancia de salida; el tiempo de cada uno aparece en las métricas como 'dsp.<nombre>'
+# target_frame_time: coste por frame (segundos, sin la espera a la cámara) que mantiene el gobernador de calidad.
+#   Si se supera baja de nivel (efectos visuales, paneles, resolución de la inferencia, inferir 1 de cada N frames)
+#   y vuelve a subir cuando sobra margen. None lo desactiva
+# startup_report: muestra los tiempos de cada fase del arranque cuando llega el primer frame con tracking
+def theremin_virtual(source=0, size=None, wave_type='sine', metrics_path=None, metrics_interval=5.0,
+                     record_landmarks=None, replay_path=None, replay_realtime=True, save_video=False, video_options=None,
+                     mapping_config=None, reverb_mode='echo', impulse_response=None, audio_process=False,
+                     control_output=None, display_fps=30.0, headless=False, frame_consumers=None,
+                     record_audio=None, trace_path=None, trace_capacity=65536, effects=None, post_effects=None,
+                     target_frame_time=1 / 30, startup_report=True):
     
+    startup_timer = StartupTimer(origin=_PROCESS_START)
+    startup_timer.add('imports', _PROCESS_START, _IMPORTS_DONE)
+
+    if size is None and headless:
+        size = HEADLESS_SIZE
+    elif size is None:
+        with startup_timer.phase('screen_resolution'):
+            size = get_screen_resolution()
+
+    # Métricas de rendimiento compartidas por audio, video y el bucle principal
+    metrics = PerformanceMetrics()
+    if metrics_path is not None:
+        metrics.configure_dump(metrics_path, interval=metrics_interval)
+    tracer = None
+    if trace_path is not None:
+        with startup_timer.phase('import.tracing'):
+            from tracing import Tracer
+        tracer = Tracer(capacity=trace_capacity, origin=_PROCESS_START)
+        metrics.tracer = tracer
+
     # Inicializar sintetizador de audio
-    synthesizer = ThereminSynthesizer(
-        sample_rate=44100,     #Frecuencia de muestreo, determina el numero de muestras de audio que se realizan por segundo
-        min_frequency=200.0,   
-        max_frequency=2000.0,  
-        wave_type=wave_type,
-        buffer_size=1024
-    )
+    with startup_timer.phase('import.audio'):
+        if audio_process:
+            from audio_process import ProcessSynthesizer as synthesizer_class
+        else:
+            from theremin_synthesizer import ThereminSynthesizer as synthesizer_class
+    with startup_timer.phase('synth_init'):
+        synthesizer = synthesizer_class(
+            sample_rate=44100,     #Frecuencia de muestreo, determina el numero de muestras de audio que se realizan por segundo
+            min_frequency=200.0,   
+            max_frequency=2000.0,  
+            wave_type=wave_type,
+            buffer_size=1024,
+            metrics=metrics,
+            reverb_mode=reverb_mode,
+            impulse_response=impulse_response
+        )
+        if effects or post_effects:
+            synthesizer.set_effects(effects or (), post_effects or ())
     
-    # Iniciar audio
-    synthesizer.start()
+    # Iniciar audio (antes que el video, así suena desde el primer momento)
+    with startup_timer.phase('audio_start'):
+        synthesizer.start()
     print("Synthesizer iniciado")
-    
-    wave_types = ['sine', 'square', 'saw', 'triangle']
-    current_wave_idx = wave_types.index(wave_type)
-    
+
+    # Grabación del audio; si también se graba video espera a su primer frame para empezar a la vez
+    align_audio = save_video and replay_path is None
+    audio_recorder = None
+    if record_audio is not None:
+        audio_recorder = synthesizer.start_recording(record_audio, wait_for_start=align_audio)
+
+    # Salida OSC/MIDI en su propio hilo (el bucle solo deja el último estado)
+    output = None
+    if control_output is not None:
+        with startup_timer.phase('import.control_output'):
+            from control_output import ControlOutput
+        output = ControlOutput(metrics=metrics, **control_output)
+        output.start()
+
+    keyboard = None
+    # Buses de frames en memoria compartida: frames de cámara (sin tocar) y frames con el HUD. Solo se crean si
+    # alguien los consume; sin consumidores los frames van directos del procesador al HUD
+    raw_bus = None
+    hud_bus = None
+    consumers = []
+    stop_consumers = None
+    if save_video or audio_process or frame_consumers:
+        with startup_timer.phase('import.frame_bus'):
+            import multiprocessing
+            from frame_bus import FrameBus
+        frame_shape = (size[1], size[0], 3)
+        raw_bus = FrameBus(frame_shape, slots=RAW_BUS_SLOTS)
+        if frame_consumers and not headless:
+            hud_bus = FrameBus(frame_shape, slots=HUD_BUS_SLOTS)
+        stop_consumers = multiprocessing.get_context('spawn').Event()
+    # Lienzo del HUD cuando no hay ranura del bus del HUD (se reutiliza entre frames)
+    hud_canvas = None
+    cv2 = None
     try:
-        # Inicializar el procesador de video
-        video_processor = VideoProcessor(source=source, size=size, save_video=False)
+        # OpenCV, mapeo y tracking: después de arrancar el audio
+        with startup_timer.phase('import.video'):
+            import cv2
+            from audio_video_integration import default_mapper, integrate_audio_with_tracking
+            from landmark_recorder import results_to_arrays
+            if replay_path is not None:
+                from landmark_recorder import LandmarkReplaySource
+            else:
+                from video_processor import VideoProcessor
+            if mapping_config is not None:
+                from control_mapping import ControlMapper
+
+        # Mapeo manos -> parámetros del sintetizador
+        mapper = ControlMapper(path=mapping_config) if mapping_config is not None else default_mapper
+
+        # Inicializar el procesador de video (o la reproducción de landmarks grabados)
+        if replay_path is not None:
+            video_processor = LandmarkReplaySource(replay_path, size=size, realtime=replay_realtime, metrics=metrics,
+                                                   draw_landmarks=False)
+        else:
+            # Los landmarks se dibujan en draw_hud, solo en los frames que se muestran
+            video_processor = VideoProcessor(source=source, size=size, save_video=save_video, metrics=metrics,
+                                             record_landmarks=record_landmarks, startup_timer=startup_timer,
+                                             draw_landmarks=False, frame_bus=raw_bus, **(video_options or {}))
         if video_processor.is_opened():
             print("Procesador de video iniciado")
+
+        for consumer in frame_consumers or []:
+            process = multiprocessing.get_context('spawn').Process(
+                target=consumer, args=(raw_bus, hud_bus, stop_consumers), daemon=True)
+            process.start()
+            consumers.append(process)
         
-        # Inicializar visualizador avanzado
-        advanced_viz = AdvancedVisualizer(frame_width=size[0], frame_height=size[1])
-        print("Visualizador avanzado iniciado")
+        # Inicializar visualizador avanzado (solo lo usa el HUD)
+        advanced_viz = None
+        if not headless:
+            with startup_timer.phase('import.hud'):
+                from opencv_dynamic import AdvancedVisualizer
+                import quality_governor  # noqa: F401 (lo usa draw_hud)
+            advanced_viz = AdvancedVisualizer(frame_width=size[0], frame_height=size[1])
+            print("Visualizador avanzado iniciado")
+
+        # Reconocedor de gestos con histéresis y antirrebote; cada gesto dispara su acción una vez por pulsación
+        with startup_timer.phase('import.gestures'):
+            from gesture_recognizer import GestureRecognizer
+        controls = {'freeze_pitch': False}
+        gestures = GestureRecognizer(aspect_ratio=size[0] / size[1])
+        gestures.bind('ok', lambda: next_wave_type(synthesizer))
+        gestures.bind('fist', lambda: toggle_reverb(synthesizer))
+        gestures.bind('victory', lambda: toggle_control(controls, 'freeze_pitch'))
+
+        # Gobernador de calidad (sin pantalla solo tienen sentido los niveles que cambian la inferencia)
+        governor = None
+        if target_frame_time:
+            with startup_timer.phase('import.governor'):
+                from quality_governor import QUALITY_LEVELS, QualityGovernor, inference_levels
+            governor = QualityGovernor(target_frame_time,
+                                       levels=inference_levels() if headless else QUALITY_LEVELS, metrics=metrics)
 
-        last_pinch_state = False  # Estado anterior del pinch para detectar transiciones
+        # Refresco de pantalla desacoplado del tracking (display_fps=None o 0 = cada frame)
+        display_period = 1.0 / display_fps if display_fps else 0.0
+        next_display = 0.0
+        if headless:
+            with startup_timer.phase('import.keyboard'):
+                from keyboard_input import KeyboardInput
+            keyboard = KeyboardInput()
+            keyboard.start()
+            print("Modo headless: pulsa q para salir, s para cambiar de onda"
+                  f"{', t para guardar la traza' if tracer is not None else ''}")
+
+        first_frame_shown = False
+        startup_reported = not startup_report
         while video_processor.is_opened():
+            frame_start = time.perf_counter()
             frame, position_calculator, process_time = video_processor.process_frame()
             
             if frame is None:
                 break
+
+            video_writer = getattr(video_processor, 'video_writer', None)
+            if audio_recorder is not None and audio_recorder.waiting_start and video_writer is not None \
+                    and video_writer.start_time is not None:
+                audio_recorder.align_start(video_writer.start_time)
             
-            # Integrar audio con video
-            integrate_audio_with_tracking(position_calculator, synthesizer)
+            control_start = time.perf_counter()
+
+            # Integrar audio con video (recargando el mapeo si el fichero ha cambiado)
+            mapper.maybe_reload()
+            integrate_audio_with_tracking(position_calculator, synthesizer, mapper, freeze_pitch=controls['freeze_pitch'])
             
             # Obtener posiciones
             right_y = position_calculator.get_right_hand_y()
             left_x = position_calculator.get_left_hand_x()
             
-            # Detectar gesto OK en mano izquierda para cambiar onda
-            # El gesto OK se detecta en VideoProcessor, necesitamos acceder a los landmarks
-            pinch_triggered = False
-            if hasattr(video_processor, 'last_results') and video_processor.last_results.multi_hand_landmarks:
-                for hand_idx, hand_landmarks in enumerate(video_processor.last_results.multi_hand_landmarks):
-                    hand_label = video_processor.last_results.multi_handedness[hand_idx].classification[0].label
-                    if hand_label == 'Left':
-                        pinch_triggered = position_calculator.detect_ok_gesture(hand_landmarks, hand_label)
-                        break
-            
-            # Cambiar tipo de onda si se detecta pinch
-            if pinch_triggered and last_pinch_state == False:
-                current_wave_idx = (current_wave_idx + 1) % len(wave_types)
-                synthesizer.wave_type = wave_types[current_wave_idx]
-                last_pinch_state = True
-            elif not pinch_triggered:
-                last_pinch_state = False
+            # Gestos (OK = cambiar onda, puño = reverb on/off, victoria = congelar pitch), todas las manos a la vez
+            labels, _, landmarks = results_to_arrays(video_processor.last_results)
+            gestures.update(labels, landmarks)
+            active_gestures = gestures.active_gestures()
 
+            metrics.record('control', time.perf_counter() - control_start)
             
-            # Calcular FPS para mostrarlos por pantalla
-            fps_avg = video_processor.get_average_fps(process_time)
-            
-            #Bloque de dibujo en pantalla con open-cv -------------------------------------------------------------------------------
-            draw_theremin_guide(frame)
-            
-
             info = synthesizer.get_info()
-            current_frequency = info['frequency']
-            current_volume = info['volume'] / 100.0  # Convertir a 0.0-1.0
-            
-            advanced_viz.draw_hand_trails(frame, left_hand_x=left_x, right_hand_y=right_y)
-            advanced_viz.draw_dynamic_colors(frame, current_frequency, current_volume, left_x, right_y)
-            
-            cv_draw.draw_fps_info(frame, fps_avg, process_time, position=(50, 60))
-            cv_draw.draw_hand_position(frame, right_y, left_x, position=(50, 200))
-            
-            draw_audio_info(frame, synthesizer, position=(50, 370))
-            
-            cv_draw.draw_wave_type(frame, synthesizer.wave_type, position=(50, 580))
-            
-            cv_draw.draw_gesture_indicator(frame, gesture_active=pinch_triggered, position=(50, 650))
-            #----------------------------------------------------------------------------------------------------------------------
-            
-            # Mostrar frame
-            cv2.imshow('Theremin Virtual', frame)
-            
-            # Definimos controles de teclado, q=quit, s=switch wave
-            key = cv2.waitKey(1) & 0xFF
+            if output is not None:
+                output.publish(info)
+
+            key = -1
+            if headless:
+                key = keyboard.poll()
+            elif time.perf_counter() >= next_display:
+                # Si nos retrasamos más de un periodo no se acumulan refrescos pendientes
+                next_display = max(next_display + display_period, time.perf_counter())
+
+                #Bloque de dibujo en pantalla con open-cv -----------------------------------------------------------------------
+                draw_start = time.perf_counter()
+                # El HUD se dibuja en su propia capa (una ranura del bus del HUD) partiendo del frame de cámara,
+                # que queda intacto para el resto de consumidores. Sin bus o sin ranuras libres, en un lienzo propio
+                hud_slot, canvas = (None, None) if hud_bus is None else hud_bus.begin_write()
+                if hud_slot is None:
+                    if hud_canvas is None or hud_canvas.shape != frame.shape:
+                        hud_canvas = np.empty_like(frame)
+                    canvas = hud_canvas
+                np.copyto(canvas, frame)
+                # FPS reales del bucle (tracking), no del refresco de pantalla
+                fps_avg = video_processor.get_average_fps(process_time)
+                draw_hud(canvas, video_processor, synthesizer, info, advanced_viz, fps_avg, process_time,
+                         right_y, left_x, active_gestures, governor)
+                if hud_slot is not None:
+                    hud_bus.commit(hud_slot)
+                metrics.record('draw', time.perf_counter() - draw_start)
+                #------------------------------------------------------------------------------------------------------------------
+
+                # Mostrar frame
+                display_start = time.perf_counter()
+                with metrics.span('display.imshow'):
+                    cv2.imshow('Theremin Virtual', canvas)
+
+                # Definimos controles de teclado, q=quit, s=switch wave, t=guardar traza
+                with metrics.span('display.waitKey'):
+                    key = cv2.waitKey(1) & 0xFF
+                metrics.record('display', time.perf_counter() - display_start)
+            metrics.maybe_dump()
+
+            if not first_frame_shown:
+                startup_timer.mark('first_frame_shown')
+                first_frame_shown = True
+            # El informe de arranque se muestra cuando el modelo (cargado en segundo plano) ya está listo
+            model_ready = getattr(video_processor, 'model_ready', None)
+            if not startup_reported and (model_ready is None or model_ready.is_set()):
+                startup_timer.mark('tracking_ready')
+                print(startup_timer.report())
+                startup_reported = True
+
+            frame_end = time.perf_counter()
+            if tracer is not None:
+                tracer.add_span('frame', frame_start, frame_end)
+
+            # Coste del frame sin la espera a la cámara (o al siguiente registro en la reproducción)
+            if governor is not None and governor.update(frame_end - frame_start - video_processor.wait_seconds,
+                                                        frame_end):
+                if hasattr(video_processor, 'set_inference_quality'):
+                    video_processor.set_inference_quality(governor.settings['inference_scale'],
+                                                          governor.settings['inference_interval'])
+
             if key == ord('q'):
                 break
             elif key == ord('s'):
-                current_wave_idx = (current_wave_idx + 1) % len(wave_types)
-                synthesizer.wave_type = wave_types[current_wave_idx]
-                print(f"Tipo de onda cambiado a: {synthesizer.wave_type.upper()}")
+                next_wave_type(synthesizer)
+            elif key == ord('t') and tracer is not None:
+                count = tracer.dump(trace_path)
+                print(f"Traza guardada en {trace_path} ({count} eventos)")
         
         video_processor.cleanup()
     
@@ -142,8 +395,32 @@ def theremin_virtual(source=0, size=get_screen_resolution(), wave_type='sine'):
     finally:
         # Limpieza
         print("\nLimpiando recursos...")
+        if keyboard is not None:
+            keyboard.close()  # Devuelve la terminal a su modo normal
+        if audio_recorder is not None:
+            stats = synthesizer.stop_recording()
+            print(f"Audio grabado en {record_audio}: {stats['seconds_written']:.1f} s, "
+                  f"{stats['overflows']} bloques perdidos ({stats['dropped_seconds']:.2f} s rellenados con silencio)")
         synthesizer.cleanup()
-        cv2.destroyAllWindows()
+        if output is not None:
+            output.close()
+        if raw_bus is not None:
+            metrics.set_counter('frame_bus_dropped', raw_bus.get_stats()['dropped'])
+        metrics.dump()
+        if tracer is not None:
+            print(f"Traza guardada en {trace_path} ({tracer.dump(trace_path)} eventos)")
+        if not headless and cv2 is not None:
+            cv2.destroyAllWindows()
+        if stop_consumers is not None:
+            stop_consumers.set()
+        for process in consumers:
+            process.join(timeout=2.0)
+            if process.is_alive():
+                process.terminate()
+        if raw_bus is not None:
+            raw_bus.close()
+        if hud_bus is not None:
+            hud_bus.close()
         print("Programa terminado correctamente")
         print("="*60)
 
@@ -0,0 +1,65 @@
+"""
+El audio renderizado por lotes tiene que sonar igual que en directo (mismo nivel, misma cadena de efectos)
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'main_module'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'video_module'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'audio_module'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'utils'))
+
+from audio_video_integration import apply_targets, default_mapper, targets_at
+from batch_processor import render_audio
+from landmark_recorder import RECORD_DTYPE, fill_record, track_features
+from theremin_synthesizer import ThereminSynthesizer
+
+FPS = 30
+NUM_FRAMES = 90
+
+
+# Pista con las dos manos quietas (todos los puntos en el mismo sitio: sin pinch, vibrato mínimo)
+def _still_track(right=(0.75, 0.5), left=(0.1, 0.6)):
+    records = np.zeros(NUM_FRAMES, dtype=RECORD_DTYPE)
+    landmarks = np.zeros((2, 21, 3))
+    landmarks[0, :, :2] = right
+    landmarks[1, :, :2] = left
+    for i in range(NUM_FRAMES):
+        fill_record(records[i], ['Right', 'Left'], [1.0, 1.0], landmarks, i / FPS)
+    return records
+
+
+def _synthesizer(reverb_mode):
+    return ThereminSynthesizer(sample_rate=44100, buffer_size=1024, reverb_mode=reverb_mode)
+
+
+def _peak(audio):
+    # Sin el primer medio segundo (suavizado y entrada de la reverb)
+    return float(np.abs(audio[22050:]).max())
+
+
+def _live(records, reverb_mode):
+    synthesizer = _synthesizer(reverb_mode)
+    targets = targets_at(default_mapper.map_arrays(track_features(records)), 0)
+    blocks = []
+    for _ in range(int(NUM_FRAMES / FPS * 44100) // 1024):
+        apply_targets(synthesizer, targets)
+        data, _ = synthesizer._audio_callback(None, 1024, None, 0)
+        blocks.append(np.frombuffer(data, dtype=np.float32))
+    return np.concatenate(blocks)
+
+
+def test_batch_peak_matches_live():
+    records = _still_track()
+    for reverb_mode in ('echo', 'convolution'):
+        synthesizer = _synthesizer(reverb_mode)
+        batch = render_audio(records, FPS, synthesizer)
+        assert len(batch) == NUM_FRAMES * 44100 // FPS
+        live = _live(records, reverb_mode)
+        assert _peak(live) > 0.01
+        assert abs(_peak(batch) - _peak(live)) <= 0.05 * _peak(live)
+        # El callback nunca recibe más de lo preparado: la cadena no tiene que trocear ningún bloque
+        assert synthesizer.effects_chain.oversized_blocks == 0
@@ -0,0 +1,78 @@
+"""
+Salida OSC/MIDI contra un receptor UDP local
+"""
+
+import os
+import socket
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'main_module'))
+
+from control_output import ControlOutput, decode_osc
+
+
+def _info(frequency, volume, vibrato=0.0, delay=0.2, reverb=0.3):
+    return {'frequency': frequency, 'volume': volume * 100.0, 'vibrato_depth': vibrato,
+            'delay_seconds': delay, 'reverb_mix': reverb}
+
+
+def _listener():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.settimeout(2.0)
+    return sock
+
+
+@pytest.fixture
+def listeners():
+    osc, midi = _listener(), _listener()
+    yield osc, midi
+    osc.close()
+    midi.close()
+
+
+def test_osc_and_midi_reach_a_local_listener(listeners):
+    osc, midi = listeners
+    output = ControlOutput(osc_port=osc.getsockname()[1], midi_port=midi.getsockname()[1])
+    output.start()
+    try:
+        output.publish(_info(440.0, 0.8))
+        bundle, _ = osc.recvfrom(4096)
+        data, _ = midi.recvfrom(4096)
+    finally:
+        output.close()
+
+    values = dict(decode_osc(bundle))
+    assert list(values) == ['/theremin/frequency', '/theremin/volume', '/theremin/vibrato', '/theremin/delay',
+                            '/theremin/reverb']
+    assert values['/theremin/frequency'] == pytest.approx(440.0)
+    assert values['/theremin/volume'] == pytest.approx(0.8)
+    assert values['/theremin/vibrato'] == pytest.approx(0.0)
+    assert values['/theremin/delay'] == pytest.approx(0.2)
+    assert values['/theremin/reverb'] == pytest.approx(0.3)
+
+    # CC7 volumen, CC1 vibrato, CC91 reverb, pitch bend centrado y note on del La 440 (nota 69)
+    messages = [tuple(data[i:i + 3]) for i in range(0, len(data), 3)]
+    assert messages == [(0xB0, 7, 102), (0xB0, 1, 0), (0xB0, 91, 38), (0xE0, 0, 0x40), (0x90, 69, 100)]
+
+
+def test_coalescing_sends_only_the_latest_state(listeners):
+    osc, _ = listeners
+    output = ControlOutput(osc_port=osc.getsockname()[1])
+    # Varios estados antes de que el hilo de envío arranque: solo el último sale por la red
+    for frequency in (300.0, 400.0, 500.0):
+        output.publish(_info(frequency, 0.5))
+    output.start()
+    try:
+        bundle, _ = osc.recvfrom(4096)
+        osc.settimeout(0.2)
+        with pytest.raises(socket.timeout):
+            osc.recvfrom(4096)
+    finally:
+        output.close()
+
+    assert dict(decode_osc(bundle))['/theremin/frequency'] == pytest.approx(500.0)
+    assert output.updates_coalesced == 2
+    assert output.packets_sent == 1
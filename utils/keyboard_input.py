@@ -0,0 +1,94 @@
+"""
+Lectura de teclado desde la terminal para el modo sin pantalla (headless)
+Sin ventana de OpenCV no hay cv2.waitKey, así que las teclas se leen de stdin en un hilo aparte
+(modo cbreak en Linux/macOS, msvcrt en Windows) y el bucle principal las recoge sin bloquear con poll().
+"""
+
+import os
+import queue
+import sys
+import threading
+
+NO_KEY = -1
+
+
+class KeyboardInput:
+
+    def __init__(self, stream=None):
+        self.stream = stream if stream is not None else sys.stdin
+        self.keys = queue.SimpleQueue()
+        self.running = False
+        self.thread = None
+        self.blocking = False  # El lector de líneas se queda bloqueado en stdin y no se puede esperar
+        self.saved_attributes = None
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        if os.name == 'nt':
+            target = self._run_windows
+        elif self.stream.isatty():
+            target = self._run_terminal
+        else:
+            # stdin redirigido (pipe, fichero): cada línea se trata como una secuencia de teclas
+            target = self._run_lines
+            self.blocking = True
+        self.thread = threading.Thread(target=target, name="keyboard-input", daemon=True)
+        self.thread.start()
+
+    # Devuelve el código de la siguiente tecla pulsada (como cv2.waitKey(1) & 0xFF) o NO_KEY
+    def poll(self):
+        try:
+            return self.keys.get_nowait()
+        except queue.Empty:
+            return NO_KEY
+
+    def _push(self, text):
+        for char in text:
+            self.keys.put(ord(char) & 0xFF)
+
+    def _run_terminal(self):
+        import select
+        import termios
+        import tty
+
+        fd = self.stream.fileno()
+        # cbreak: cada tecla llega al momento, sin esperar a Enter, y Ctrl+C sigue funcionando
+        self.saved_attributes = termios.tcgetattr(fd)
+        tty.setcbreak(fd)
+        try:
+            while self.running:
+                readable, _, _ = select.select([fd], [], [], 0.1)
+                if readable:
+                    self._push(os.read(fd, 32).decode(errors='ignore'))
+        finally:
+            self._restore_terminal()
+
+    def _run_windows(self):
+        import msvcrt
+        import time
+
+        while self.running:
+            if msvcrt.kbhit():
+                self._push(msvcrt.getwch())
+            else:
+                time.sleep(0.02)
+
+    def _run_lines(self):
+        for line in self.stream:
+            if not self.running:
+                break
+            self._push(line.strip())
+
+    def _restore_terminal(self):
+        if self.saved_attributes is not None:
+            import termios
+            termios.tcsetattr(self.stream.fileno(), termios.TCSADRAIN, self.saved_attributes)
+            self.saved_attributes = None
+
+    def close(self):
+        self.running = False
+        if self.thread is not None and not self.blocking:
+            self.thread.join(timeout=0.5)
+        self._restore_terminal()
@@ -93,9 +93,11 @@ class cv_draw:
 
     @staticmethod
     #Dibuja información del audio (frecuencia, nota, volumen)
-    def draw_audio_info(frame, synthesizer, position=(20, 20)):
+    # info: resultado de synthesizer.get_info() si ya se ha obtenido en este frame (evita calcularlo dos veces)
+    def draw_audio_info(frame, synthesizer, position=(20, 20), info=None):
         #posición (x, y) donde comenzar a dibujar
-        info = synthesizer.get_info()
+        if info is None:
+            info = synthesizer.get_info()
         x, y = position
         
         # Panel de fondo semitransparente para toda la info
@@ -144,7 +146,8 @@ class cv_draw:
     
     @staticmethod
     # Dubuja una guía visual del theremín en el frame para que sea mas intuitivo para el usuario
-    def draw_theremin_guide(frame):
+    # translucent=False omite las áreas semitransparentes (cada una copia y mezcla el frame entero)
+    def draw_theremin_guide(frame, translucent=True):
     
         altura, ancho, _ = frame.shape
         
@@ -154,9 +157,10 @@ class cv_draw:
         
         # --- ZONA DERECHA (PITCH) ---
         # Dibujar área semitransparente para la zona derecha
-        overlay = frame.copy()
-        cv2.rectangle(overlay, (right_zone_start, 0), (ancho, altura), (50, 0, 50), -1)
-        cv2.addWeighted(overlay, 0.1, frame, 0.9, 0, frame)
+        if translucent:
+            overlay = frame.copy()
+            cv2.rectangle(overlay, (right_zone_start, 0), (ancho, altura), (50, 0, 50), -1)
+            cv2.addWeighted(overlay, 0.1, frame, 0.9, 0, frame)
         
         # Línea vertical guía (centrada en la zona derecha)
         pitch_guide_x = right_zone_start + (ancho - right_zone_start) // 2
@@ -169,9 +173,10 @@ class cv_draw:
         
         # --- ZONA IZQUIERDA (VOLUMEN / REVERB) ---
         # Dibujar área semitransparente para la zona izquierda
-        overlay = frame.copy()
-        cv2.rectangle(overlay, (0, 0), (left_zone_limit, altura), (50, 50, 0), -1)
-        cv2.addWeighted(overlay, 0.1, frame, 0.9, 0, frame)
+        if translucent:
+            overlay = frame.copy()
+            cv2.rectangle(overlay, (0, 0), (left_zone_limit, altura), (50, 50, 0), -1)
+            cv2.addWeighted(overlay, 0.1, frame, 0.9, 0, frame)
         
         # Línea límite vertical
         cv2.line(frame, (left_zone_limit, 0), (left_zone_limit, altura), (100, 100, 100), 1, cv2.LINE_AA)
@@ -198,6 +203,25 @@ class cv_draw:
         cv_draw.draw_text_with_bg(frame, f'FPS: {int(fps)}', (x, y), bg_color=(0, 200, 100), font_scale=1.0)
         cv_draw.draw_text_with_bg(frame, f'Time: {process_time * 1000:.1f}ms', (x, y + 70), bg_color=(0, 200, 100), font_scale=1.0)
     
+    @staticmethod
+    # Dibuja el nivel de calidad del gobernador (0 = calidad completa)
+    def draw_quality_level(frame, level, name, position=(230, 60)):
+        bg_color = (0, 200, 100) if level == 0 else (0, 140, 255)
+        cv_draw.draw_text_with_bg(frame, f'Q{level}: {name}', position, bg_color=bg_color, font_scale=0.6)
+
+    @staticmethod
+    # Versión simplificada de los paneles en una sola línea: rectángulo opaco y texto, sin copias del frame
+    # para las transparencias (la usa el gobernador de calidad cuando falta tiempo)
+    def draw_status_line(frame, fps, info, wave_type, quality=None, position=(50, 90)):
+        x, y = position
+        text = (f"FPS {int(fps)} | {info['note']} {info['frequency']:.1f} Hz | VOL {info['volume']:.0f}% | "
+                f"{wave_type.upper()}")
+        if quality is not None:
+            text += f" | Q{quality[0]}: {quality[1]}"
+        (text_width, text_height), baseline = cv2.getTextSize(text, cv_draw.FONT, 0.6, 1)
+        cv2.rectangle(frame, (x - 8, y - text_height - 8), (x + text_width + 8, y + baseline + 8), (30, 30, 30), -1)
+        cv2.putText(frame, text, (x, y), cv_draw.FONT, 0.6, cv_draw.COLOR_WHITE, 1, cv2.LINE_AA)
+
     @staticmethod
     # Dibuja las posiciones de las manos
     def draw_hand_position(frame, right_y, left_x, position=(50, 200)):
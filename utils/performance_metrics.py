@@ -0,0 +1,448 @@
+"""
+Módulo de métricas de rendimiento para el Theremín Virtual
+Ventanas deslizantes de memoria fija y estimadores de percentiles en streaming (P²)
+para medir cada etapa del pipeline sin crecer en memoria durante sesiones largas.
+Los percentiles pXX_ms son de la ventana reciente; los session_pXX_ms (P²) acumulan toda la sesión
+"""
+
+import contextlib
+import csv
+from collections import deque
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+
+# Etapas del pipeline que se miden por defecto
+DEFAULT_STAGES = ('capture', 'inference', 'control', 'draw', 'display', 'audio_callback')
+
+# Percentiles que se estiman para cada etapa
+DEFAULT_PERCENTILES = (0.50, 0.95, 0.99)
+
+# Contexto vacío reutilizable para span() cuando no hay tracer
+_NO_SPAN = contextlib.nullcontext()
+
+# Muestras pendientes de incorporar (las de todos los hilos, sin lock). El bucle principal las incorpora en cada
+# frame; si nadie las lee durante mucho tiempo se descartan las más antiguas
+PENDING_SIZE = 8192
+_UNDERFLOW = None
+
+
+# Ventana deslizante de tamaño fijo sobre un array de numpy preasignado.
+# Mantiene la suma acumulada para que la media sea O(1) en lugar de recorrer todo el historial.
+class RollingWindow:
+
+    def __init__(self, size=120):
+        self.size = size
+        self.values = np.zeros(size, dtype=np.float64)
+        self.index = 0
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value):
+        # Restamos el valor que sale de la ventana y sumamos el nuevo
+        self.total += value - self.values[self.index]
+        self.values[self.index] = value
+        self.index = (self.index + 1) % self.size
+        if self.count < self.size:
+            self.count += 1
+
+        # Al dar la vuelta recalculamos la suma para evitar la deriva numérica
+        if self.index == 0:
+            self.total = float(self.values.sum())
+
+    def mean(self):
+        if self.count == 0:
+            return 0.0
+        return float(self.total / self.count)
+
+    def max(self):
+        if self.count == 0:
+            return 0.0
+        return float(self.values[:self.count].max())
+
+    def last(self):
+        if self.count == 0:
+            return 0.0
+        return float(self.values[(self.index - 1) % self.size])
+
+    # Percentiles (fracciones 0-1) de los valores que hay ahora en la ventana
+    def percentiles(self, fractions):
+        if self.count == 0:
+            return [0.0] * len(fractions)
+        return [float(v) for v in np.percentile(self.values[:self.count], [100 * f for f in fractions])]
+
+    def reset(self):
+        self.values[:] = 0.0
+        self.index = 0
+        self.count = 0
+        self.total = 0.0
+
+
+# Estimador de percentiles P² (Jain & Chlamtac). Usa 5 marcadores, memoria constante
+# y coste O(1) por muestra, sin guardar las observaciones.
+class P2Quantile:
+
+    def __init__(self, p):
+        self.p = p
+        self.count = 0
+        self.heights = [0.0] * 5
+        self.positions = [0, 1, 2, 3, 4]
+        self.desired = [0.0, 2 * p, 4 * p, 2 + 2 * p, 4.0]
+        self.increments = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+
+    def add(self, value):
+        q = self.heights
+        n = self.positions
+
+        # Las 5 primeras muestras inicializan los marcadores
+        if self.count < 5:
+            q[self.count] = value
+            self.count += 1
+            if self.count == 5:
+                q.sort()
+            return
+        self.count += 1
+
+        # Localizar la celda en la que cae la muestra
+        if value < q[0]:
+            q[0] = value
+            k = 0
+        elif value >= q[4]:
+            q[4] = value
+            k = 3
+        else:
+            k = 0
+            while value >= q[k + 1]:
+                k += 1
+
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        # Ajustar los marcadores centrales si se han desplazado de su posición deseada
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                candidate = self._parabolic(i, d)
+                if q[i - 1] < candidate < q[i + 1]:
+                    q[i] = candidate
+                else:
+                    q[i] = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                n[i] += d
+
+    def _parabolic(self, i, d):
+        q = self.heights
+        n = self.positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def value(self):
+        if self.count == 0:
+            return 0.0
+        if self.count < 5:
+            # Con pocas muestras devolvemos el percentil exacto
+            ordered = sorted(self.heights[:self.count])
+            return ordered[int(round(self.p * (self.count - 1)))]
+        return self.heights[2]
+
+
+# Estadísticas de una etapa: ventana deslizante (media, máximo y percentiles recientes) más percentiles de toda
+# la sesión en streaming, para que un arranque lento no distorsione indefinidamente los valores recientes
+class StageStats:
+
+    def __init__(self, window_size=120, percentiles=DEFAULT_PERCENTILES):
+        self.window = RollingWindow(window_size)
+        self.percentiles = {p: P2Quantile(p) for p in percentiles}
+        self.count = 0
+
+    def add(self, seconds):
+        self.window.add(seconds)
+        for estimator in self.percentiles.values():
+            estimator.add(seconds)
+        self.count += 1
+
+    def summary(self):
+        # Todos los valores en milisegundos para que sean legibles en los volcados
+        result = {
+            'count': self.count,
+            'last_ms': self.window.last() * 1000,
+            'mean_ms': self.window.mean() * 1000,
+            'max_ms': self.window.max() * 1000,
+        }
+        recent = self.window.percentiles(list(self.percentiles))
+        for p, value in zip(self.percentiles, recent):
+            result[f'p{int(round(p * 100))}_ms'] = value * 1000
+        for p, estimator in self.percentiles.items():
+            result[f'session_p{int(round(p * 100))}_ms'] = estimator.value() * 1000
+        return result
+
+
+# Cronómetro de una etapa para usar con "with metrics.measure('draw'):"
+class _StageTimer:
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.record(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+# Clase principal de métricas. Se puede consultar desde el propio proceso con snapshot()
+# y volcar periódicamente a un fichero JSON o CSV con maybe_dump().
+class PerformanceMetrics:
+
+    def __init__(self, stages=DEFAULT_STAGES, window_size=120, percentiles=DEFAULT_PERCENTILES):
+        self.window_size = window_size
+        self.percentiles = percentiles
+        self.stages = {name: StageStats(window_size, percentiles) for name in stages}
+
+        # Intervalos entre frames consecutivos para calcular los FPS reales del bucle
+        self.frame_intervals = RollingWindow(window_size)
+        self.last_frame_time = None
+        self.frame_count = 0
+        self.expected_frame_interval = None
+        self.dropped_frames = 0
+        self.audio_underflows = 0
+
+        # Valores instantáneos de otros subsistemas (profundidad de colas, frames descartados...)
+        self.counters = {}
+
+        # Volcado periódico a fichero
+        self.dump_path = None
+        self.dump_format = 'json'
+        self.dump_interval = 5.0
+        self.last_dump_time = time.perf_counter()
+
+        # El callback de audio registra desde otro hilo: record y record_audio_underflow solo añaden
+        # a esta cola (deque.append es atómico, sin lock que el hilo de la interfaz pueda retener) y quien lee
+        # las métricas la vacía bajo el lock en _merge_pending
+        self.pending = deque(maxlen=PENDING_SIZE)
+        self.lock = threading.Lock()
+
+        # Tracer opcional (utils/tracing.py): cada etapa registrada también se guarda como tramo de la línea de tiempo
+        self.tracer = None
+
+    # Registra la duración (en segundos) de una etapa que acaba de terminar.
+    # traced=False cuando el tramo se traza aparte (p.ej. tiempos que llegan de otro proceso)
+    def record(self, stage, seconds, traced=True):
+        tracer = self.tracer
+        if tracer is not None and traced:
+            end = time.perf_counter()
+            tracer.add_span(stage, end - seconds, end)
+        self.pending.append((stage, seconds))
+
+    # Incorpora las muestras pendientes a las estadísticas. Se llama con self.lock tomado
+    def _merge_pending(self):
+        pending = self.pending
+        while pending:
+            stage, seconds = pending.popleft()
+            if stage is _UNDERFLOW:
+                self.audio_underflows += 1
+                continue
+            stats = self.stages.get(stage)
+            if stats is None:
+                stats = StageStats(self.window_size, self.percentiles)
+                self.stages[stage] = stats
+            stats.add(seconds)
+
+    def measure(self, stage):
+        return _StageTimer(self, stage)
+
+    # Tramo solo para la traza (sin estadísticas), p.ej. partes de una etapa. Sin tracer no hace nada
+    def span(self, name):
+        if self.tracer is None:
+            return _NO_SPAN
+        return self.tracer.span(name)
+
+    # Define los FPS esperados de la fuente para poder detectar frames perdidos
+    def set_expected_fps(self, fps):
+        if fps and fps > 0:
+            self.expected_frame_interval = 1.0 / fps
+        else:
+            self.expected_frame_interval = None
+
+    # Marca el inicio de un nuevo frame del bucle principal
+    def tick_frame(self, now=None):
+        if now is None:
+            now = time.perf_counter()
+        with self.lock:
+            self._merge_pending()
+            if self.last_frame_time is not None:
+                interval = now - self.last_frame_time
+                self.frame_intervals.add(interval)
+                # Si el intervalo supera 1.5 veces el esperado contamos los frames que se han saltado
+                if self.expected_frame_interval and interval > 1.5 * self.expected_frame_interval:
+                    self.dropped_frames += int(round(interval / self.expected_frame_interval)) - 1
+            self.last_frame_time = now
+            self.frame_count += 1
+
+    def record_audio_underflow(self, traced=True):
+        if self.tracer is not None and traced:
+            self.tracer.instant('audio_underflow')
+        self.pending.append((_UNDERFLOW, 0.0))
+
+    # Actualiza un contador/indicador con nombre, se incluye tal cual en los snapshots
+    def set_counter(self, name, value):
+        with self.lock:
+            self.counters[name] = value
+
+    # FPS reales del bucle (media sobre la ventana deslizante)
+    def get_loop_fps(self):
+        with self.lock:
+            return self._loop_fps()
+
+    def _loop_fps(self):
+        mean_interval = self.frame_intervals.mean()
+        if mean_interval > 0:
+            return 1.0 / mean_interval
+        return 0.0
+
+    # Media reciente de una etapa, en segundos
+    def get_stage_mean(self, stage):
+        with self.lock:
+            self._merge_pending()
+            stats = self.stages.get(stage)
+            if stats is None:
+                return 0.0
+            return stats.window.mean()
+
+    # Copia del estado actual de todas las métricas
+    def snapshot(self):
+        with self.lock:
+            self._merge_pending()
+            return {
+                'timestamp': time.time(),
+                'frames': self.frame_count,
+                'loop_fps': self._loop_fps(),
+                'dropped_frames': self.dropped_frames,
+                'audio_underflows': self.audio_underflows,
+                'counters': dict(self.counters),
+                'stages': {name: stats.summary() for name, stats in self.stages.items()},
+            }
+
+    # Configura el volcado periódico; el formato se deduce de la extensión si no se indica
+    def configure_dump(self, path, interval=5.0, fmt=None):
+        self.dump_path = path
+        self.dump_interval = interval
+        if fmt is None:
+            fmt = 'csv' if path.lower().endswith('.csv') else 'json'
+        self.dump_format = fmt
+        self.last_dump_time = time.perf_counter()
+
+    # Vuelca las métricas si ha pasado el intervalo configurado. Pensado para llamarse en cada frame.
+    def maybe_dump(self, now=None):
+        if self.dump_path is None:
+            return False
+        if now is None:
+            now = time.perf_counter()
+        if now - self.last_dump_time < self.dump_interval:
+            return False
+        self.last_dump_time = now
+        self.dump()
+        return True
+
+    def dump(self, path=None, fmt=None):
+        path = path or self.dump_path
+        fmt = fmt or self.dump_format
+        if path is None:
+            return
+        if fmt == 'csv':
+            self.dump_csv(path)
+        else:
+            self.dump_json(path)
+
+    # Sobrescribe el fichero JSON con el último snapshot (escritura atómica)
+    def dump_json(self, path):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp_path, path)
+
+    # Añade una fila por etapa al CSV, para poder seguir la evolución en el tiempo
+    def dump_csv(self, path):
+        snapshot = self.snapshot()
+        write_header = not os.path.exists(path)
+        stat_keys = list(StageStats(1, self.percentiles).summary().keys())
+        with open(path, 'a', newline='') as f:
+            writer = csv.writer(f)
+            if write_header:
+                writer.writerow(['timestamp', 'loop_fps', 'dropped_frames', 'audio_underflows', 'stage'] + stat_keys)
+            for name, summary in snapshot['stages'].items():
+                writer.writerow(
+                    [f"{snapshot['timestamp']:.3f}", f"{snapshot['loop_fps']:.2f}",
+                     snapshot['dropped_frames'], snapshot['audio_underflows'], name]
+                    + [f"{summary[key]:.4f}" if isinstance(summary[key], float) else summary[key] for key in stat_keys]
+                )
+
+    def reset(self):
+        with self.lock:
+            self.pending.clear()
+            for name in list(self.stages):
+                self.stages[name] = StageStats(self.window_size, self.percentiles)
+            self.frame_intervals.reset()
+            self.last_frame_time = None
+            self.frame_count = 0
+            self.dropped_frames = 0
+            self.audio_underflows = 0
+
+
+# Registro de las fases del arranque (incluidas las que corren en hilos de fondo) para ver dónde se va el tiempo
+class StartupTimer:
+
+    def __init__(self, origin=None):
+        # origin: instante de referencia (p.ej. time.perf_counter() al inicio del proceso)
+        self.origin = origin if origin is not None else time.perf_counter()
+        self.phases = []  # (nombre, inicio, fin, hilo)
+        self.lock = threading.Lock()
+
+    # Añade una fase ya medida
+    def add(self, name, start, end):
+        with self.lock:
+            self.phases.append((name, start, end, threading.current_thread().name))
+
+    def phase(self, name):
+        return _StartupPhase(self, name)
+
+    # Marca un instante (fase de duración cero), p.ej. el primer frame mostrado
+    def mark(self, name):
+        now = time.perf_counter()
+        self.add(name, now, now)
+
+    def report(self):
+        with self.lock:
+            phases = sorted(self.phases, key=lambda phase: phase[1])
+        lines = ["Tiempos de arranque:", f"  {'fase':<24} {'inicio':>10} {'duración':>10}  hilo"]
+        for name, start, end, thread_name in phases:
+            lines.append(f"  {name:<24} {(start - self.origin) * 1000:8.1f}ms {(end - start) * 1000:8.1f}ms  {thread_name}")
+        return "\n".join(lines)
+
+
+class _StartupPhase:
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.timer.add(self.name, self.start, time.perf_counter())
+        return False
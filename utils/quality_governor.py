@@ -0,0 +1,130 @@
+"""
+Gobernador de calidad adaptativa para mantener un tiempo de frame objetivo
+Compara el coste medio de los últimos frames (sin contar la espera a la cámara) con el objetivo. Si se pasa,
+baja un nivel de calidad; si sobra margen durante un rato, sube uno. Los niveles están ordenados de más a
+menos caro: primero se quitan los efectos visuales, luego se simplifican los paneles y el dibujo de las manos,
+después se reduce la resolución de la inferencia y por último se infiere solo en uno de cada N frames.
+"""
+
+import time
+
+from performance_metrics import RollingWindow
+
+# Niveles de calidad, de mejor a peor. Cada uno fija todos los ajustes:
+#   visual_effects: rastros y colores dinámicos de AdvancedVisualizer
+#   panels: 'full' (paneles semitransparentes de cv_draw) o 'simple' (una línea de estado sin transparencias)
+#   overlay: detalle máximo del dibujo de las manos ('full', 'skeleton' o 'fingertips', ver skeleton_renderer.py)
+#   inference_scale: escala del frame que recibe MediaPipe (los landmarks son normalizados, no cambian)
+#   inference_interval: se infiere en uno de cada N frames; en el resto se reutilizan los últimos landmarks
+QUALITY_LEVELS = (
+    {'name': 'full', 'visual_effects': True, 'panels': 'full', 'overlay': 'full', 'inference_scale': 1.0,
+     'inference_interval': 1},
+    {'name': 'no_effects', 'visual_effects': False, 'panels': 'full', 'overlay': 'full', 'inference_scale': 1.0,
+     'inference_interval': 1},
+    {'name': 'simple_panels', 'visual_effects': False, 'panels': 'simple', 'overlay': 'skeleton',
+     'inference_scale': 1.0, 'inference_interval': 1},
+    {'name': 'low_res_inference', 'visual_effects': False, 'panels': 'simple', 'overlay': 'fingertips',
+     'inference_scale': 0.5, 'inference_interval': 1},
+    {'name': 'half_rate_inference', 'visual_effects': False, 'panels': 'simple', 'overlay': 'fingertips',
+     'inference_scale': 0.5, 'inference_interval': 2},
+    {'name': 'third_rate_inference', 'visual_effects': False, 'panels': 'simple', 'overlay': 'fingertips',
+     'inference_scale': 0.5, 'inference_interval': 3},
+)
+
+# Ajustes que afectan a la inferencia (los únicos que importan sin pantalla)
+_INFERENCE_SETTINGS = ('inference_scale', 'inference_interval')
+
+
+# Niveles sin los que solo cambian el dibujo, para el modo headless (no hay HUD que abaratar)
+def inference_levels(levels=QUALITY_LEVELS):
+    kept = [levels[0]]
+    for level in levels[1:]:
+        if any(level[key] != kept[-1][key] for key in _INFERENCE_SETTINGS):
+            kept.append(level)
+    return tuple(kept)
+
+
+class QualityGovernor:
+
+    # target_frame_time: coste por frame que se quiere mantener (segundos), p.ej. 1/30 o 1/60
+    # window: frames que se promedian antes de cada decisión (la ventana se vacía al cambiar de nivel)
+    # headroom: se sube de nivel cuando el coste medio baja de headroom * target_frame_time...
+    # up_delay: ...de forma continuada durante estos segundos. Si al subir se vuelve a bajar enseguida, la
+    #   espera se duplica (hasta max_up_delay) para no oscilar entre dos niveles
+    def __init__(self, target_frame_time=1 / 30, levels=QUALITY_LEVELS, window=30, headroom=0.7, up_delay=2.0,
+                 max_up_delay=30.0, metrics=None):
+        self.target_frame_time = target_frame_time
+        self.levels = tuple(levels)
+        self.window = RollingWindow(window)
+        self.headroom = headroom
+        self.base_up_delay = up_delay
+        self.up_delay = up_delay
+        self.max_up_delay = max_up_delay
+        self.metrics = metrics
+
+        self.level = 0
+        self.changes = 0
+        self.last_change_time = None
+        self.last_change_up = False
+        self.headroom_since = None  # Desde cuándo hay margen de forma continuada
+        self._publish()
+
+    @property
+    def settings(self):
+        return self.levels[self.level]
+
+    @property
+    def name(self):
+        return self.settings['name']
+
+    # Registra el coste de un frame. Devuelve True si ha cambiado el nivel (hay que aplicar settings)
+    def update(self, frame_seconds, now=None):
+        now = time.perf_counter() if now is None else now
+        window = self.window
+        window.add(frame_seconds)
+        if window.count < window.size:
+            return False
+        mean = window.mean()
+
+        if mean > self.target_frame_time:
+            self.headroom_since = None
+            if self.level < len(self.levels) - 1:
+                return self._change(self.level + 1, now, mean)
+            return False
+
+        if mean < self.headroom * self.target_frame_time and self.level > 0:
+            if self.headroom_since is None:
+                self.headroom_since = now
+            elif now - self.headroom_since >= self.up_delay:
+                return self._change(self.level - 1, now, mean)
+        else:
+            self.headroom_since = None
+        return False
+
+    def _change(self, level, now, mean):
+        up = level < self.level
+        if not up:
+            # Subir no funcionó (se vuelve a bajar antes de que pase up_delay): la próxima vez se espera más
+            if self.last_change_up and now - self.last_change_time < self.up_delay:
+                self.up_delay = min(self.up_delay * 2, self.max_up_delay)
+            else:
+                self.up_delay = self.base_up_delay
+        self.level = level
+        self.changes += 1
+        self.last_change_time = now
+        self.last_change_up = up
+        self.headroom_since = None
+        self.window.reset()
+        print(f"Calidad: nivel {level} ({self.name}), coste medio {mean * 1000:.1f} ms "
+              f"(objetivo {self.target_frame_time * 1000:.1f} ms)")
+        self._publish()
+        return True
+
+    def _publish(self):
+        if self.metrics is None:
+            return
+        self.metrics.set_counter('quality_level', self.level)
+        self.metrics.set_counter('quality_level_name', self.name)
+        self.metrics.set_counter('quality_changes', self.changes)
+        if self.metrics.tracer is not None:
+            self.metrics.tracer.instant(f'quality.{self.name}')
@@ -0,0 +1,166 @@
+"""
+Trazas de la línea de tiempo (frames, etapas del pipeline y bloques de audio) en formato Chrome trace
+Cada tramo (inicio, fin, hilo) se guarda en un anillo de tamaño fijo preasignado, así se puede dejar activado
+en sesiones largas: se conservan los últimos eventos. dump() escribe el JSON que abren chrome://tracing
+y https://ui.perfetto.dev, con el video y el audio uno junto al otro.
+
+Desactivado (tracer = None) no cuesta nada más que comprobar el atributo.
+"""
+
+import itertools
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+SPAN = 1
+INSTANT = 2
+
+EVENT_DTYPE = np.dtype([
+    ('kind', 'u1'),     # 0 = hueco vacío, SPAN o INSTANT
+    ('name', 'i4'),     # índice en Tracer.names
+    ('pid', 'i4'),
+    ('tid', 'i8'),
+    ('start', 'f8'),    # time.perf_counter()
+    ('end', 'f8'),
+])
+
+
+# Tramo medido con "with tracer.span('nombre'):"
+class _Span:
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.tracer.add_span(self.name, self.start, time.perf_counter())
+        return False
+
+
+# Adquisición de un lock midiendo la espera (contención); se usa como el propio lock en un with
+class _TracedLock:
+
+    def __init__(self, lock, tracer, name):
+        self.lock = lock
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        start = time.perf_counter()
+        self.lock.acquire()
+        self.tracer.add_span(self.name, start, time.perf_counter())
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.lock.release()
+        return False
+
+
+# Devuelve el lock tal cual si no hay tracer (sin coste) o un envoltorio que traza la espera
+def traced_lock(lock, tracer, name):
+    if tracer is None:
+        return lock
+    return _TracedLock(lock, tracer, name)
+
+
+class Tracer:
+
+    def __init__(self, capacity=65536, origin=None):
+        self.capacity = capacity
+        self.events = np.zeros(capacity, dtype=EVENT_DTYPE)
+        # Índice de escritura sin lock: next() sobre itertools.count es atómico con el GIL
+        self.counter = itertools.count()
+        self.origin = origin if origin is not None else time.perf_counter()
+        self.pid = os.getpid()
+
+        self.names = []
+        self.name_ids = {}
+        self.thread_names = {}            # (pid, tid) -> nombre
+        self.process_names = {self.pid: 'theremin'}
+        self.lock = threading.Lock()      # Solo para registrar nombres nuevos
+
+    def _name_id(self, name):
+        name_id = self.name_ids.get(name)
+        if name_id is None:
+            with self.lock:
+                name_id = self.name_ids.get(name)
+                if name_id is None:
+                    name_id = len(self.names)
+                    self.names.append(name)
+                    self.name_ids[name] = name_id
+        return name_id
+
+    def _write(self, kind, name, start, end, pid, tid):
+        if tid is None:
+            tid = threading.get_ident()
+            if (self.pid, tid) not in self.thread_names:
+                self.thread_names[(self.pid, tid)] = threading.current_thread().name
+        # Una sola asignación de tupla: el evento se escribe entero sin soltar el GIL
+        self.events[next(self.counter) % self.capacity] = (kind, self._name_id(name),
+                                                           self.pid if pid is None else pid, tid, start, end)
+
+    # Tramo ya medido (instantes de time.perf_counter()). pid/tid para eventos de otros procesos
+    def add_span(self, name, start, end, pid=None, tid=None):
+        self._write(SPAN, name, start, end, pid, tid)
+
+    # Evento puntual (p.ej. un underflow de audio)
+    def instant(self, name, when=None, pid=None, tid=None):
+        when = time.perf_counter() if when is None else when
+        self._write(INSTANT, name, when, when, pid, tid)
+
+    def span(self, name):
+        return _Span(self, name)
+
+    # Nombres para los hilos y procesos que no son del proceso actual (p.ej. el motor de audio)
+    def name_thread(self, pid, tid, name):
+        self.thread_names[(pid, tid)] = name
+
+    def name_process(self, pid, name):
+        self.process_names[pid] = name
+
+    # Eventos válidos del anillo ordenados por inicio
+    def snapshot(self):
+        events = self.events.copy()
+        events = events[events['kind'] != 0]
+        return events[np.argsort(events['start'], kind='stable')]
+
+    # Eventos en formato Chrome trace (microsegundos desde origin)
+    def to_chrome_trace(self):
+        events = self.snapshot()
+        trace = []
+        for pid, name in self.process_names.items():
+            trace.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0, 'args': {'name': name}})
+        for (pid, tid), name in list(self.thread_names.items()):
+            trace.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}})
+
+        starts = (events['start'] - self.origin) * 1e6
+        durations = (events['end'] - events['start']) * 1e6
+        for event, ts, dur in zip(events.tolist(), starts.tolist(), durations.tolist()):
+            kind, name_id, pid, tid = event[0], event[1], event[2], event[3]
+            name = self.names[name_id]
+            item = {'name': name, 'cat': name.split('.')[0], 'pid': pid, 'tid': tid, 'ts': round(ts, 3)}
+            if kind == SPAN:
+                item['ph'] = 'X'
+                item['dur'] = round(dur, 3)
+            else:
+                item['ph'] = 'i'
+                item['s'] = 't'
+            trace.append(item)
+        return {'traceEvents': trace, 'displayTimeUnit': 'ms'}
+
+    # Escribe el fichero .json (escritura atómica). Devuelve el número de eventos
+    def dump(self, path):
+        trace = self.to_chrome_trace()
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(trace, f)
+        os.replace(tmp_path, path)
+        return sum(1 for event in trace['traceEvents'] if event['ph'] != 'M')
@@ -0,0 +1,104 @@
+"""
+Negociación del modo de la cámara
+OpenCV no permite listar los modos de una cámara, así que se prueban resoluciones habituales ordenadas por
+cercanía a la que se necesita y se comprueba cuál acepta el driver. Pedir a la cámara directamente el tamaño
+de proceso evita el cv2.resize de cada frame; MJPG permite resoluciones altas a 30 fps por USB y un buffer
+de 1 frame evita que el driver acumule frames viejos (menos latencia).
+"""
+
+import cv2
+
+# Formatos preferidos, en orden. MJPG: comprimido, más resolución y fps por USB; YUYV: sin compresión
+DEFAULT_FOURCCS = ('MJPG', 'YUYV')
+
+# Resoluciones habituales de webcams (ancho, alto)
+COMMON_MODES = [
+    (3840, 2160), (2560, 1440), (1920, 1080), (1600, 900), (1440, 810), (1280, 960), (1280, 720),
+    (1024, 768), (1024, 576), (960, 540), (848, 480), (800, 600), (800, 448), (640, 480), (640, 360),
+    (424, 240), (320, 240),
+]
+
+
+def fourcc_to_str(code):
+    code = int(code)
+    return ''.join(chr((code >> (8 * i)) & 0xFF) for i in range(4)).strip('\0')
+
+
+# Modos candidatos ordenados de más a menos adecuado para size: primero el exacto, después los que lo cubren
+# (de menor a mayor área, con la misma relación de aspecto antes) y por último los menores (de mayor a menor)
+def candidate_modes(size, modes=COMMON_MODES):
+    return [tuple(size)] + sorted((m for m in modes if tuple(m) != tuple(size)), key=lambda m: mode_score(m, size))
+
+
+# Clave de orden de un modo para size (menor = mejor): cubre size, misma relación de aspecto, área más ajustada
+def mode_score(mode, size):
+    w, h = mode
+    width, height = size
+    if (w, h) == tuple(size):
+        return (False, False, 0)
+    covers = w >= width and h >= height
+    same_aspect = abs(w / h - width / height) < 0.02
+    return (not covers, not same_aspect, w * h if covers else -w * h)
+
+
+def _frame_size(cap):
+    return int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+
+# Modo que está entregando la cámara ahora mismo
+def read_mode(cap):
+    return {
+        'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        'fps': float(cap.get(cv2.CAP_PROP_FPS)),
+        'fourcc': fourcc_to_str(cap.get(cv2.CAP_PROP_FOURCC)),
+        'buffer_size': int(cap.get(cv2.CAP_PROP_BUFFERSIZE)),
+    }
+
+
+# Pide a la cámara el formato, la resolución más cercana a size, los fps y el tamaño de buffer.
+# Devuelve el modo negociado (lo que el driver acepta realmente, que puede no coincidir con lo pedido)
+def negotiate_mode(cap, size, fps=30, fourccs=DEFAULT_FOURCCS, buffer_size=1, modes=COMMON_MODES):
+    if buffer_size is not None:
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, buffer_size)
+
+    # El formato va antes que la resolución: en V4L2 cada formato tiene su propia lista de tamaños.
+    # Si el driver no acepta ninguno de los preferidos se vuelve al que tenía
+    original_fourcc = cap.get(cv2.CAP_PROP_FOURCC)
+    if fourccs:
+        for fourcc in fourccs:
+            cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fourcc))
+            if fourcc_to_str(cap.get(cv2.CAP_PROP_FOURCC)) == fourcc:
+                break
+        else:
+            cap.set(cv2.CAP_PROP_FOURCC, original_fourcc)
+
+    # El driver ajusta lo pedido al modo soportado más cercano; nos quedamos con el primero que acepta tal cual.
+    # Si no acepta ninguno exacto, se vuelve a fijar el mejor de los que sí entregó (el modo por defecto incluido),
+    # no el último probado (el más pequeño)
+    accepted = {_frame_size(cap)}
+    for width, height in candidate_modes(size, modes):
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        delivered = _frame_size(cap)
+        if delivered == (width, height):
+            break
+        accepted.add(delivered)
+    else:
+        accepted = [mode for mode in accepted if mode[0] > 0 and mode[1] > 0]
+        if accepted:
+            width, height = min(accepted, key=lambda mode: mode_score(mode, size))
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+
+    if fps:
+        cap.set(cv2.CAP_PROP_FPS, fps)
+    return read_mode(cap)
+
+
+def format_mode(mode):
+    text = f"{mode['width']}x{mode['height']} @ {mode['fps']:.0f} fps, {mode['fourcc'] or '?'}"
+    # Los ficheros y algunos backends no informan del buffer (<= 0)
+    if mode['buffer_size'] > 0:
+        text += f", buffer {mode['buffer_size']}"
+    return text
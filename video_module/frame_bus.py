@@ -0,0 +1,193 @@
+"""
+Bus de frames en memoria compartida sin copias
+Un productor escribe cada frame directamente en una ranura preasignada de un anillo en memoria compartida
+(p.ej. cv2.flip(..., dst=ranura)) y la publica. Los consumidores (grabador, segunda ventana, otro análisis,
+incluso en otros procesos) toman una referencia al último frame publicado y leen la ranura sin copiarla.
+Cada ranura tiene un contador de referencias: el productor nunca sobrescribe una ranura que alguien está
+leyendo ni la última publicada; si no queda ninguna libre, el frame se descarta del bus (no se bloquea).
+
+Para usar el bus desde otro proceso basta con pasar el objeto FrameBus como argumento del Process
+(se vuelve a conectar a la memoria compartida por nombre y comparte el mismo lock).
+"""
+
+import multiprocessing
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Alineación del inicio de los frames dentro del bloque compartido
+_ALIGNMENT = 64
+
+
+def _header_dtype(slots):
+    return np.dtype([
+        ('latest_slot', 'i4'),          # -1 = todavía no se ha publicado nada
+        ('latest_sequence', 'i8'),
+        ('published', 'u8'),
+        ('dropped', 'u8'),              # frames que no se pudieron publicar por no haber ranuras libres
+        ('refcount', 'i4', (slots,)),
+        ('sequence', 'i8', (slots,)),   # número de frame de cada ranura (-1 = escribiéndose)
+        ('timestamp', 'f8', (slots,)),
+    ])
+
+
+# Referencia a un frame publicado. array es una vista de solo lectura de la ranura; release() la libera
+class FrameRef:
+
+    def __init__(self, bus, slot, sequence, timestamp):
+        self.bus = bus
+        self.slot = slot
+        self.sequence = sequence
+        self.timestamp = timestamp
+        self.array = bus.frames[slot].view()
+        self.array.flags.writeable = False
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.bus._release(self.slot)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class FrameBus:
+
+    # shape: forma de cada frame (alto, ancho, 3). name=None genera un nombre único
+    def __init__(self, shape, slots=4, dtype=np.uint8, name=None, lock=None, _create=True):
+        if slots < 2:
+            raise ValueError("El bus necesita al menos 2 ranuras")
+        self.shape = tuple(shape)
+        self.slots = slots
+        self.dtype = np.dtype(dtype)
+        self.owner = _create
+        # Lock entre procesos (contexto spawn, el mismo que usan el resto de procesos del proyecto)
+        self.lock = lock if lock is not None else multiprocessing.get_context('spawn').Lock()
+
+        header_dtype = _header_dtype(slots)
+        self.frame_offset = -(-header_dtype.itemsize // _ALIGNMENT) * _ALIGNMENT
+        frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        size = self.frame_offset + slots * frame_bytes
+
+        if _create:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.header = np.ndarray((), dtype=header_dtype, buffer=self.shm.buf)
+        self.frames = np.ndarray((slots,) + self.shape, dtype=self.dtype, buffer=self.shm.buf,
+                                 offset=self.frame_offset)
+        if _create:
+            self.header[()] = np.zeros((), dtype=header_dtype)
+            self.header['latest_slot'] = -1
+            self.header['latest_sequence'] = -1
+            self.header['sequence'] = -1
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    # Al pasar el bus a otro proceso solo viajan el nombre, la forma y el lock
+    def __getstate__(self):
+        return {'shape': self.shape, 'slots': self.slots, 'dtype': self.dtype.str, 'name': self.shm.name,
+                'lock': self.lock}
+
+    def __setstate__(self, state):
+        self.__init__(state['shape'], slots=state['slots'], dtype=state['dtype'], name=state['name'],
+                      lock=state['lock'], _create=False)
+
+    # --- Productor ---
+
+    # Reserva una ranura libre para escribir el siguiente frame. Devuelve (ranura, array escribible)
+    # o (None, None) si todas están en uso (el frame se cuenta como descartado)
+    def begin_write(self):
+        header = self.header
+        with self.lock:
+            latest = int(header['latest_slot'])
+            refcount = header['refcount']
+            for offset in range(1, self.slots + 1):
+                # Empezamos por la siguiente a la última publicada para repartir el uso del anillo
+                slot = (latest + offset) % self.slots
+                if slot != latest and refcount[slot] == 0:
+                    header['sequence'][slot] = -1
+                    return slot, self.frames[slot]
+            header['dropped'] += 1
+        return None, None
+
+    # Publica la ranura escrita como el frame más reciente
+    def commit(self, slot, timestamp=None):
+        header = self.header
+        with self.lock:
+            sequence = int(header['latest_sequence']) + 1
+            header['sequence'][slot] = sequence
+            header['timestamp'][slot] = time.perf_counter() if timestamp is None else timestamp
+            header['latest_sequence'] = sequence
+            header['latest_slot'] = slot
+            header['published'] += 1
+        return sequence
+
+    # Para productores que no pueden escribir en la ranura directamente (una copia)
+    def publish(self, frame, timestamp=None):
+        slot, target = self.begin_write()
+        if slot is None:
+            return None
+        np.copyto(target, frame)
+        return self.commit(slot, timestamp)
+
+    # --- Consumidores ---
+
+    # Referencia al último frame (None si no hay ninguno más nuevo que newer_than). Hay que liberarla
+    def acquire_latest(self, newer_than=-1):
+        header = self.header
+        with self.lock:
+            slot = int(header['latest_slot'])
+            if slot < 0:
+                return None
+            sequence = int(header['sequence'][slot])
+            if sequence <= newer_than:
+                return None
+            header['refcount'][slot] += 1
+            timestamp = float(header['timestamp'][slot])
+        return FrameRef(self, slot, sequence, timestamp)
+
+    # Espera (sondeando) a que haya un frame más nuevo que newer_than. None si se agota el timeout
+    def wait_latest(self, newer_than=-1, timeout=None, poll_interval=0.001):
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while True:
+            ref = self.acquire_latest(newer_than)
+            if ref is not None:
+                return ref
+            if deadline is not None and time.perf_counter() >= deadline:
+                return None
+            time.sleep(poll_interval)
+
+    def _release(self, slot):
+        with self.lock:
+            self.header['refcount'][slot] -= 1
+
+    def get_stats(self):
+        header = self.header
+        return {
+            'published': int(header['published']),
+            'dropped': int(header['dropped']),
+            'in_use': int(np.count_nonzero(header['refcount'])),
+        }
+
+    # Cierra la conexión; el creador además libera la memoria compartida
+    def close(self):
+        if self.shm is None:
+            return
+        self.header = None
+        self.frames = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # Aún quedan vistas de frames vivas (p.ej. el último frame del bucle); se liberan al salir
+            pass
+        if self.owner:
+            self.shm.unlink()
+        self.shm = None
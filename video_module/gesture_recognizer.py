@@ -0,0 +1,162 @@
+"""
+Reconocimiento de varios gestos a la vez con histéresis y antirrebote temporal
+Las características se calculan sobre el array completo de landmarks (manos, 21, 3) y se normalizan por el
+tamaño de la palma (muñeca -> base del dedo medio), así no dependen de la distancia a la cámara.
+Cada gesto es una plantilla de intervalos [mínimo, máximo] por característica; todas las manos se comparan
+con todas las plantillas en una sola operación de numpy. Un gesto se dispara una vez cuando se mantiene
+hold_time segundos, y no vuelve a dispararse hasta soltarlo y pasado su cooldown.
+"""
+
+import time
+
+import numpy as np
+
+# Puntas de los dedos: pulgar, índice, medio, anular, meñique
+FINGER_TIPS = [4, 8, 12, 16, 20]
+WRIST = 0
+MIDDLE_MCP = 9
+
+# Características (todas en unidades de palma)
+#   thumb_<dedo>: distancia de la punta del pulgar a la punta de cada dedo
+#   ext_<dedo>:   distancia de la punta del dedo a la muñeca (extendido ~1.6-2.0, doblado < 1.2)
+FEATURE_NAMES = (
+    'thumb_index', 'thumb_middle', 'thumb_ring', 'thumb_pinky',
+    'ext_thumb', 'ext_index', 'ext_middle', 'ext_ring', 'ext_pinky',
+)
+
+# Gestos por defecto: plantilla {característica: (mínimo, máximo)}, mano ('Left', 'Right' o None = cualquiera)
+DEFAULT_GESTURES = {
+    # OK: pulgar e índice juntos y el resto de dedos abiertos (el gesto que antes detectaba detect_ok_gesture)
+    'ok': {'hand': 'Left', 'template': {'thumb_index': (0.0, 0.35), 'thumb_middle': (0.3, np.inf),
+                                        'thumb_ring': (0.3, np.inf), 'thumb_pinky': (0.3, np.inf),
+                                        'ext_middle': (1.3, np.inf), 'ext_ring': (1.2, np.inf),
+                                        'ext_pinky': (1.0, np.inf)}},
+    # Puño: los cuatro dedos doblados
+    'fist': {'hand': 'Left', 'template': {'ext_index': (0.0, 1.1), 'ext_middle': (0.0, 1.1),
+                                          'ext_ring': (0.0, 1.1), 'ext_pinky': (0.0, 1.0)}},
+    # Victoria: índice y medio extendidos, anular y meñique doblados
+    'victory': {'hand': 'Right', 'template': {'ext_index': (1.5, np.inf), 'ext_middle': (1.5, np.inf),
+                                              'ext_ring': (0.0, 1.1), 'ext_pinky': (0.0, 1.0),
+                                              'thumb_index': (0.5, np.inf)}},
+}
+
+
+# Pares de landmarks cuya distancia da cada característica (en el orden de FEATURE_NAMES) y, al final, la palma
+_PAIRS_FROM = np.array([FINGER_TIPS[0]] * 4 + FINGER_TIPS + [MIDDLE_MCP])
+_PAIRS_TO = np.array(FINGER_TIPS[1:] + [WRIST] * 5 + [WRIST])
+
+
+# Características normalizadas de n manos a la vez. landmarks: (n, 21, 3) -> (n, len(FEATURE_NAMES))
+# aspect_ratio (ancho / alto del frame) corrige que x e y estén normalizadas con escalas distintas
+def hand_features(landmarks, aspect_ratio=1.0):
+    points = np.asarray(landmarks, dtype=np.float64)[:, :, :2]
+    diff = points[:, _PAIRS_FROM] - points[:, _PAIRS_TO]
+    diff[..., 0] *= aspect_ratio
+    distances = np.sqrt(np.einsum('npc,npc->np', diff, diff))
+    palm = np.maximum(distances[:, -1:], 1e-6)
+    return distances[:, :-1] / palm
+
+
+class GestureRecognizer:
+
+    # gestures: {nombre: {'hand': 'Left'/'Right'/None, 'template': {característica: (mín, máx)},
+    #                     'hold_time': s, 'cooldown': s}} (por defecto DEFAULT_GESTURES)
+    # hysteresis: margen (en unidades de palma) que hay que salirse de la plantilla para soltar un gesto activo
+    def __init__(self, gestures=None, aspect_ratio=1.0, hold_time=0.12, cooldown=0.5, hysteresis=0.15):
+        gestures = DEFAULT_GESTURES if gestures is None else gestures
+        self.aspect_ratio = aspect_ratio
+        self.hysteresis = hysteresis
+        self.names = list(gestures)
+        num_gestures = len(self.names)
+        num_features = len(FEATURE_NAMES)
+
+        # Plantillas precalculadas (gestos, características); sin restricción = (-inf, inf)
+        self.low = np.full((num_gestures, num_features), -np.inf)
+        self.high = np.full((num_gestures, num_features), np.inf)
+        self.hands = []
+        self.hold_time = np.empty(num_gestures)
+        self.cooldown = np.empty(num_gestures)
+        for g, name in enumerate(self.names):
+            spec = gestures[name]
+            for feature, (low, high) in spec['template'].items():
+                if feature not in FEATURE_NAMES:
+                    raise ValueError(f"Característica desconocida en el gesto {name}: {feature} "
+                                     f"(opciones: {', '.join(FEATURE_NAMES)})")
+                f = FEATURE_NAMES.index(feature)
+                self.low[g, f] = low
+                self.high[g, f] = high
+            self.hands.append(spec.get('hand'))
+            self.hold_time[g] = spec.get('hold_time', hold_time)
+            self.cooldown[g] = spec.get('cooldown', cooldown)
+
+        # Qué plantillas se comparan con cada lateralidad
+        self.hand_masks = {label: np.array([hand is None or hand == label for hand in self.hands])
+                           for label in ('Left', 'Right')}
+        # Una lateralidad desconocida (p.ej. 'Unknown' en una grabación) no coincide con ninguna plantilla
+        self.unknown_hand_mask = np.zeros(num_gestures, dtype=bool)
+
+        # Estado por gesto
+        self.active = np.zeros(num_gestures, dtype=bool)       # coincide (con histéresis)
+        self.since = np.full(num_gestures, np.nan)             # desde cuándo coincide
+        self.latched = np.zeros(num_gestures, dtype=bool)      # ya se disparó mientras se mantiene
+        self.last_fired = np.full(num_gestures, -np.inf)
+
+        self.actions = {}
+
+    # Asocia una acción (función sin argumentos) a un gesto
+    def bind(self, name, action):
+        if name not in self.names:
+            raise ValueError(f"Gesto desconocido: {name} (opciones: {', '.join(self.names)})")
+        self.actions[name] = action
+
+    # Distancia de cada mano a cada plantilla: 0 si está dentro de todos los intervalos,
+    # si no, lo que más se sale alguna característica. (manos, gestos)
+    def template_distances(self, features):
+        features = features[:, None, :]
+        outside = np.maximum(self.low - features, features - self.high)
+        return np.maximum(outside.max(axis=2), 0.0)
+
+    # Procesa un frame. labels: lateralidad de cada mano; landmarks: (n, 21, 3) como results_to_arrays.
+    # Ejecuta las acciones de los gestos que se disparan y devuelve sus nombres
+    def update(self, labels, landmarks, now=None):
+        if now is None:
+            now = time.perf_counter()
+
+        distances = np.full(len(self.names), np.inf)
+        if len(labels):
+            per_hand = self.template_distances(hand_features(landmarks, self.aspect_ratio))
+            # Las manos que no corresponden a la plantilla no cuentan
+            valid = np.array([self.hand_masks.get(label, self.unknown_hand_mask) for label in labels])
+            distances = np.where(valid, per_hand, np.inf).min(axis=0)
+
+        # Caso habitual: ningún gesto activo ni coincidiendo, no hay estado que actualizar
+        if not self.active.any() and not (distances <= 0.0).any():
+            return []
+
+        # Histéresis: para entrar hay que cumplir la plantilla, para salir hay que alejarse más de hysteresis
+        self.active = np.where(self.active, distances <= self.hysteresis, distances <= 0.0)
+
+        # Antirrebote: mantener hold_time seguidos, una sola vez por pulsación y respetando el cooldown
+        # (fmin ignora NaN: si no había marca de tiempo toma now; NaN >= x es False)
+        self.since = np.where(self.active, np.fmin(self.since, now), np.nan)
+        held = now - self.since >= self.hold_time
+        fire = held & ~self.latched & (now - self.last_fired >= self.cooldown)
+        self.latched = (self.latched | fire) & self.active
+        self.last_fired = np.where(fire, now, self.last_fired)
+
+        fired = [self.names[g] for g in np.flatnonzero(fire)]
+        for name in fired:
+            action = self.actions.get(name)
+            if action is not None:
+                action()
+        return fired
+
+    # Gestos activos ahora mismo (tras la histéresis, aunque todavía no se hayan disparado)
+    def active_gestures(self):
+        return [self.names[g] for g in np.flatnonzero(self.active)]
+
+    def reset(self):
+        self.active[:] = False
+        self.since[:] = np.nan
+        self.latched[:] = False
+        self.last_fired[:] = -np.inf
@@ -1,4 +1,13 @@
 
+# Índices de los puntos de referencia clave que se promedian para la posición de la mano
+KEY_POINTS = [
+    0,   # muñeca
+    4,   # punta del pulgar
+    8,   # punta del índice
+    12,  # punta del dedo medio
+    16,  # punta del anular
+    20   # punta del meñique
+]
 
 
 class HandPositionCalculator:
@@ -23,15 +32,7 @@ class HandPositionCalculator:
     
     def update_hand_position(self, hand_landmarks, hand_label):
         
-        # Índices de los puntos de referencia clave
-        key_points = [
-            0,   # muñeca
-            4,   # punta del pulgar
-            8,   # punta del índice
-            12,  # punta del dedo medio
-            16,  # punta del anular
-            20   # punta del meñique
-        ]
+        key_points = KEY_POINTS
         
         # Calcular la posición media de todos los puntos clave, tomamos las puntas de los dedos y la muñeca
         avg_x = sum(hand_landmarks.landmark[i].x for i in key_points) / len(key_points)
@@ -0,0 +1,135 @@
+"""
+Inferencia asíncrona con el HandLandmarker de MediaPipe Tasks en modo LIVE_STREAM
+El bucle entrega cada frame con su marca temporal y sigue capturando y dibujando mientras MediaPipe infiere
+en su propio hilo; el resultado llega por callback. Solo hay una inferencia en curso: los frames que llegan
+mientras el modelo está ocupado se descartan (no se acumula latencia). Cada resultado se guarda con el
+instante de captura del frame del que sale.
+
+Los resultados se convierten a la forma de mp.solutions.hands (multi_hand_landmarks, multi_handedness...),
+así el resto del pipeline (espejo, posiciones, gestos, grabación, dibujo) no cambia.
+"""
+
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+from landmark_recorder import mirror_results
+
+# Modelo .task del HandLandmarker (no se distribuye con el repositorio, ver docs/VIDEO.md)
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(__file__), '..', 'models', 'hand_landmarker.task')
+MODEL_URL = ('https://storage.googleapis.com/mediapipe-models/hand_landmarker/hand_landmarker/float16/latest/'
+             'hand_landmarker.task')
+
+
+# Convierte un HandLandmarkerResult en protos como los de mp.solutions.hands (draw_landmarks los necesita)
+def landmarker_to_results(result):
+    from mediapipe.framework.formats import classification_pb2, landmark_pb2
+
+    multi_hand_landmarks = []
+    multi_handedness = []
+    multi_hand_world_landmarks = []
+    for hand_idx, landmarks in enumerate(result.hand_landmarks):
+        multi_hand_landmarks.append(landmark_pb2.NormalizedLandmarkList(
+            landmark=[landmark_pb2.NormalizedLandmark(x=lm.x, y=lm.y, z=lm.z) for lm in landmarks]))
+        category = result.handedness[hand_idx][0]
+        multi_handedness.append(classification_pb2.ClassificationList(
+            classification=[classification_pb2.Classification(index=category.index, score=category.score,
+                                                               label=category.category_name)]))
+        if hand_idx < len(result.hand_world_landmarks):
+            multi_hand_world_landmarks.append(landmark_pb2.LandmarkList(
+                landmark=[landmark_pb2.Landmark(x=lm.x, y=lm.y, z=lm.z)
+                          for lm in result.hand_world_landmarks[hand_idx]]))
+    return SimpleNamespace(
+        multi_hand_landmarks=multi_hand_landmarks or None,
+        multi_handedness=multi_handedness or None,
+        multi_hand_world_landmarks=multi_hand_world_landmarks or None,
+    )
+
+
+class LiveStreamHandTracker:
+
+    # metrics: registra la latencia de cada inferencia (entrega -> callback) como etapa 'inference'
+    # stall_timeout: si el callback no llega en este tiempo el frame se da por perdido y se acepta otro
+    def __init__(self, model_path=DEFAULT_MODEL_PATH, num_hands=2, min_detection_confidence=0.5,
+                 min_tracking_confidence=0.5, metrics=None, stall_timeout=1.0):
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"No se encuentra el modelo del HandLandmarker en {model_path} "
+                                    f"(descárgalo de {MODEL_URL})")
+        import mediapipe as mp
+        from mediapipe.tasks.python import BaseOptions
+        from mediapipe.tasks.python.vision import HandLandmarker, HandLandmarkerOptions, RunningMode
+
+        self.mp = mp
+        self.metrics = metrics
+        self.stall_timeout = stall_timeout
+        self.latest = None              # (resultados, instante de captura), se sustituye entero en el callback
+        self.pending = None             # (timestamp_ms, instante de captura, instante de entrega) en curso
+        self.idle = threading.Event()   # Sin inferencia en curso
+        self.idle.set()
+        self.last_timestamp_ms = -1
+        self.submitted = 0
+        self.dropped = 0
+        self.completed = 0
+
+        options = HandLandmarkerOptions(
+            base_options=BaseOptions(model_asset_path=model_path),
+            running_mode=RunningMode.LIVE_STREAM,
+            num_hands=num_hands,
+            min_hand_detection_confidence=min_detection_confidence,
+            min_hand_presence_confidence=min_tracking_confidence,
+            min_tracking_confidence=min_tracking_confidence,
+            result_callback=self._on_result,
+        )
+        self.landmarker = HandLandmarker.create_from_options(options)
+
+    @property
+    def busy(self):
+        return not self.idle.is_set()
+
+    # Indica si se puede entregar un frame. Si hay una inferencia en curso el frame cuenta como descartado
+    # (salvo que lleve más de stall_timeout sin respuesta: entonces se da por perdida)
+    def accepting(self):
+        if not self.idle.is_set() and time.perf_counter() - self.pending[2] < self.stall_timeout:
+            self.dropped += 1
+            return False
+        return True
+
+    # Entrega un frame RGB capturado en capture_time (perf_counter). Si hay una inferencia en curso se descarta
+    # y devuelve False. El buffer no se debe modificar hasta que termine (busy == False)
+    def submit(self, frame_rgb, capture_time):
+        if not self.accepting():
+            return False
+        # MediaPipe exige marcas temporales (ms) estrictamente crecientes
+        timestamp_ms = max(int(capture_time * 1000), self.last_timestamp_ms + 1)
+        self.last_timestamp_ms = timestamp_ms
+        self.pending = (timestamp_ms, capture_time, time.perf_counter())
+        self.idle.clear()
+        image = self.mp.Image(image_format=self.mp.ImageFormat.SRGB, data=frame_rgb)
+        self.landmarker.detect_async(image, timestamp_ms)
+        self.submitted += 1
+        return True
+
+    # Hilo de MediaPipe: convierte, aplica el espejo y publica el resultado con el instante de su frame
+    def _on_result(self, result, output_image, timestamp_ms):
+        try:
+            pending_ms, capture_time, submit_time = self.pending
+            if timestamp_ms != pending_ms:
+                capture_time = timestamp_ms / 1000.0
+            self.latest = (mirror_results(landmarker_to_results(result)), capture_time)
+            self.completed += 1
+            if self.metrics is not None:
+                self.metrics.record('inference', time.perf_counter() - submit_time)
+        finally:
+            # Aunque falle la conversión, el siguiente frame se puede entregar
+            self.idle.set()
+
+    # Espera a que termine la inferencia en curso. Devuelve False si se agota el timeout
+    def wait_idle(self, timeout=None):
+        return self.idle.wait(timeout)
+
+    def get_stats(self):
+        return {'submitted': self.submitted, 'completed': self.completed, 'dropped': self.dropped}
+
+    def close(self):
+        self.landmarker.close()
@@ -0,0 +1,295 @@
+"""
+Grabación y reproducción del stream de landmarks de MediaPipe
+Permite depurar el mapeo y el audio sin volver a decodificar video ni ejecutar la inferencia
+
+Formato del fichero (.thlm), append-only:
+    cabecera de 16 bytes: b'THLMK001' + tamaño de registro (uint32) + 4 bytes de relleno
+    registros de tamaño fijo (RECORD_DTYPE), uno por frame, escritos por bloques (chunks)
+
+Al ser registros de tamaño fijo el fichero se puede leer directamente con np.memmap
+y un fichero cortado por un cierre inesperado sigue siendo legible hasta el último registro completo.
+"""
+
+import os
+import struct
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+import handPositionCalculator
+from skeleton_renderer import SkeletonRenderer, coarser_detail
+
+MAGIC = b'THLMK001'
+HEADER_SIZE = 16
+MAX_HANDS = 2
+NUM_LANDMARKS = 21
+
+# Códigos de lateralidad guardados en el fichero
+HANDEDNESS_CODES = {'Left': 1, 'Right': 2}
+HANDEDNESS_LABELS = {code: label for label, code in HANDEDNESS_CODES.items()}
+
+RECORD_DTYPE = np.dtype([
+    ('timestamp', '<f8'),                                         # segundos desde el inicio de la grabación
+    ('num_hands', 'u1'),
+    ('handedness', 'u1', (MAX_HANDS,)),                           # 0 = sin mano, 1 = Left, 2 = Right
+    ('score', '<f4', (MAX_HANDS,)),                               # confianza de la lateralidad
+    ('landmarks', '<f4', (MAX_HANDS, NUM_LANDMARKS, 3)),          # x, y, z normalizados
+])
+
+
+# Convierte los resultados de MediaPipe Hands en arrays (etiquetas, scores, landmarks (n, 21, 3))
+def results_to_arrays(results):
+    labels = []
+    scores = []
+    landmarks = []
+    if results is not None and results.multi_hand_landmarks:
+        for hand_idx, hand_landmarks in enumerate(results.multi_hand_landmarks[:MAX_HANDS]):
+            classification = results.multi_handedness[hand_idx].classification[0]
+            labels.append(classification.label)
+            scores.append(classification.score)
+            landmarks.append([(lm.x, lm.y, lm.z) for lm in hand_landmarks.landmark])
+    return labels, scores, np.array(landmarks, dtype=np.float32).reshape(-1, NUM_LANDMARKS, 3)
+
+
+# Lateralidad de la mano vista en espejo
+MIRRORED_LABELS = {'Left': 'Right', 'Right': 'Left'}
+
+
+# Espejo horizontal de los resultados de MediaPipe, in-place: x -> 1 - x y se intercambia la lateralidad
+# (MediaPipe da la lateralidad suponiendo imagen en espejo). Equivale a cv2.flip(frame, 1) antes de la
+# inferencia sin recorrer la imagen
+def mirror_results(results):
+    if results is None or not results.multi_hand_landmarks:
+        return results
+    for hand_landmarks in results.multi_hand_landmarks:
+        for landmark in hand_landmarks.landmark:
+            landmark.x = 1.0 - landmark.x
+    # Las coordenadas del mundo están centradas en la mano: el espejo solo cambia el signo de x
+    for world_landmarks in getattr(results, 'multi_hand_world_landmarks', None) or ():
+        for landmark in world_landmarks.landmark:
+            landmark.x = -landmark.x
+    for handedness in results.multi_handedness:
+        classification = handedness.classification[0]
+        classification.label = MIRRORED_LABELS.get(classification.label, classification.label)
+    return results
+
+
+# Lo mismo sobre la salida de results_to_arrays. Devuelve (etiquetas, landmarks) nuevos
+def mirror_arrays(labels, landmarks):
+    landmarks = landmarks.copy()
+    landmarks[..., 0] = 1.0 - landmarks[..., 0]
+    return [MIRRORED_LABELS.get(label, label) for label in labels], landmarks
+
+
+# Rellena un registro (in-place) a partir de las etiquetas, scores y landmarks de las manos
+def fill_record(record, labels, scores, landmarks, timestamp):
+    record['timestamp'] = timestamp
+    record['num_hands'] = min(len(labels), MAX_HANDS)
+    record['handedness'] = 0
+    record['score'] = 0.0
+    for i, label in enumerate(labels[:MAX_HANDS]):
+        record['handedness'][i] = HANDEDNESS_CODES.get(label, 0)
+        record['score'][i] = scores[i]
+        record['landmarks'][i] = landmarks[i]
+
+
+# Escritor append-only. Acumula los registros en un chunk preasignado y lo escribe de una vez
+class LandmarkRecorder:
+
+    def __init__(self, path, chunk_frames=256):
+        self.path = path
+        self.chunk = np.zeros(chunk_frames, dtype=RECORD_DTYPE)
+        self.chunk_count = 0
+        self.frames_written = 0
+        self.start_time = time.perf_counter()
+
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC + struct.pack('<I', RECORD_DTYPE.itemsize) + b'\0' * 4)
+
+    # Guarda directamente un resultado de MediaPipe
+    def write(self, results, timestamp=None):
+        labels, scores, landmarks = results_to_arrays(results)
+        self.write_arrays(labels, scores, landmarks, timestamp)
+
+    def write_arrays(self, labels, scores, landmarks, timestamp=None):
+        if timestamp is None:
+            timestamp = time.perf_counter() - self.start_time
+
+        fill_record(self.chunk[self.chunk_count], labels, scores, landmarks, timestamp)
+
+        self.chunk_count += 1
+        if self.chunk_count == len(self.chunk):
+            self.flush()
+
+    # Añade de golpe un array de registros ya construido (p.ej. el resultado del procesado por lotes)
+    def write_records(self, records):
+        self.flush()
+        self.file.write(np.ascontiguousarray(records, dtype=RECORD_DTYPE).tobytes())
+        self.file.flush()
+        self.frames_written += len(records)
+
+    def flush(self):
+        if self.chunk_count > 0:
+            self.file.write(self.chunk[:self.chunk_count].tobytes())
+            self.file.flush()
+            self.frames_written += self.chunk_count
+            self.chunk_count = 0
+
+    def close(self):
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+
+# Abre un fichero de landmarks como array estructurado mapeado en memoria (sin copiarlo)
+def open_landmark_file(path):
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE or header[:8] != MAGIC:
+        raise ValueError(f"{path} no es un fichero de landmarks válido")
+    itemsize = struct.unpack('<I', header[8:12])[0]
+    if itemsize != RECORD_DTYPE.itemsize:
+        raise ValueError(f"Tamaño de registro no soportado en {path}: {itemsize}")
+
+    num_records = (os.path.getsize(path) - HEADER_SIZE) // itemsize
+    if num_records == 0:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    return np.memmap(path, dtype=RECORD_DTYPE, mode='r', offset=HEADER_SIZE, shape=(num_records,))
+
+
+# Calcula de golpe, para toda una pista, las mismas características que HandPositionCalculator
+# (posición media de los puntos clave y distancia de pinch). NaN en los frames sin esa mano
+def track_features(records):
+    landmarks = np.asarray(records['landmarks'], dtype=np.float64)       # (N, manos, 21, 3)
+    handedness = np.asarray(records['handedness'])                       # (N, manos)
+    centers = landmarks[:, :, handPositionCalculator.KEY_POINTS, :2].mean(axis=2)
+    pinch = np.linalg.norm(landmarks[:, :, 4, :2] - landmarks[:, :, 8, :2], axis=-1)
+
+    num_frames = len(records)
+    features = {name: np.full(num_frames, np.nan) for name in
+                ('right_hand_y', 'left_hand_x', 'left_hand_y', 'right_hand_pinch', 'left_hand_pinch')}
+    # En el mismo orden que el bucle en directo: si se repite una etiqueta gana la última mano
+    for slot in range(MAX_HANDS):
+        right = handedness[:, slot] == HANDEDNESS_CODES['Right']
+        left = handedness[:, slot] == HANDEDNESS_CODES['Left']
+        features['right_hand_y'][right] = centers[right, slot, 1]
+        features['right_hand_pinch'][right] = pinch[right, slot]
+        features['left_hand_x'][left] = centers[left, slot, 0]
+        features['left_hand_y'][left] = centers[left, slot, 1]
+        features['left_hand_pinch'][left] = pinch[left, slot]
+    return features
+
+
+# Landmarks de una mano con la misma interfaz que los de MediaPipe (hand_landmarks.landmark[i].x)
+class ArrayHandLandmarks:
+
+    def __init__(self, array):
+        self.array = array
+        self.landmark = [SimpleNamespace(x=float(x), y=float(y), z=float(z)) for x, y, z in array]
+
+
+# Convierte un registro del fichero en un objeto con la forma de los resultados de MediaPipe
+def record_to_results(record):
+    multi_hand_landmarks = []
+    multi_handedness = []
+    for i in range(int(record['num_hands'])):
+        label = HANDEDNESS_LABELS.get(int(record['handedness'][i]), 'Unknown')
+        multi_hand_landmarks.append(ArrayHandLandmarks(record['landmarks'][i]))
+        multi_handedness.append(SimpleNamespace(
+            classification=[SimpleNamespace(label=label, score=float(record['score'][i]))]
+        ))
+    return SimpleNamespace(
+        multi_hand_landmarks=multi_hand_landmarks or None,
+        multi_handedness=multi_handedness or None,
+    )
+
+
+# Fuente de reproducción con la misma interfaz que VideoProcessor (is_opened, process_frame, cleanup...)
+# No decodifica video ni ejecuta inferencia. realtime=False reproduce a la máxima velocidad posible.
+class LandmarkReplaySource:
+
+    def __init__(self, path, size=(1440, 810), realtime=True, loop=False, metrics=None, draw_landmarks=True,
+                 overlay_detail='full'):
+        self.path = path
+        self.draw_landmarks = draw_landmarks
+        self.frames_annotated = draw_landmarks
+        self.size = size
+        self.realtime = realtime
+        self.loop = loop
+        self.metrics = metrics
+        self.records = open_landmark_file(path)
+        self.index = 0
+        self.last_results = None
+        self.start_time = None
+        self.wait_seconds = 0.0  # Tiempo del último frame esperando a su marca temporal (como cap.read en la cámara)
+        self.opened = len(self.records) > 0
+
+        # Fondo negro preasignado y de solo lectura; solo se copia si hay que dibujar los landmarks encima
+        self.background = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+        self.background.flags.writeable = False
+
+        self.position_calculator = handPositionCalculator.HandPositionCalculator(size[0], size[1])
+        self.skeleton_renderer = SkeletonRenderer(overlay_detail)
+
+    def __len__(self):
+        return len(self.records)
+
+    def process_frame(self):
+        if self.metrics is not None:
+            self.metrics.tick_frame()
+
+        if self.index >= len(self.records):
+            if not self.loop or len(self.records) == 0:
+                self.opened = False
+                return None, None, None
+            self.index = 0
+            self.start_time = None
+
+        record = self.records[self.index]
+        self.index += 1
+
+        # En tiempo real esperamos hasta la marca temporal del registro
+        if self.realtime:
+            now = time.perf_counter()
+            if self.start_time is None:
+                self.start_time = now - float(record['timestamp'])
+            wait = self.start_time + float(record['timestamp']) - now
+            self.wait_seconds = max(wait, 0.0)
+            if wait > 0:
+                time.sleep(wait)
+
+        start_time = time.perf_counter()
+        results = record_to_results(record)
+        self.last_results = results
+
+        self.position_calculator.reset()
+        if results.multi_hand_landmarks:
+            for hand_idx, hand_landmarks in enumerate(results.multi_hand_landmarks):
+                hand_label = results.multi_handedness[hand_idx].classification[0].label
+                self.position_calculator.update_hand_position(hand_landmarks, hand_label)
+        process_time = time.perf_counter() - start_time
+
+        frame = self.background
+        if self.draw_landmarks:
+            frame = frame.copy()
+            self.draw_hands(frame, results)
+        return frame, self.position_calculator, process_time
+
+    # Mismo dibujo que VideoProcessor.draw_hands (los landmarks reproducidos ya son un array)
+    def draw_hands(self, frame, results=None, max_detail=None):
+        results = self.last_results if results is None else results
+        self.skeleton_renderer.draw(frame, results, coarser_detail(self.skeleton_renderer.detail, max_detail))
+
+    def get_average_fps(self, process_time=None):
+        if self.metrics is not None:
+            return self.metrics.get_loop_fps()
+        return 0
+
+    def is_opened(self):
+        return self.opened
+
+    def cleanup(self):
+        self.opened = False
+        self.records = np.zeros(0, dtype=RECORD_DTYPE)
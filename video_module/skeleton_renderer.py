@@ -0,0 +1,133 @@
+"""
+Dibujo del esqueleto de las manos con primitivas agrupadas
+Sustituye a mp_drawing.draw_landmarks: los estilos (los de MediaPipe por defecto) se construyen una sola vez,
+las coordenadas en píxeles salen del array de landmarks de una operación y cada grupo de color se dibuja con una
+sola llamada a cv2.polylines para todas las manos. Los puntos también son polilíneas: un segmento de longitud cero
+con grosor 2r - 1 pinta exactamente el mismo círculo relleno de radio r que cv2.circle.
+
+Niveles de detalle, de más a menos caro:
+    'full'        conexiones, articulaciones con borde, línea de pinch y etiqueta de la mano
+    'skeleton'    conexiones, línea de pinch y etiqueta (sin articulaciones)
+    'fingertips'  solo las puntas de los dedos y la línea de pinch
+"""
+
+import cv2
+import numpy as np
+
+OVERLAY_DETAILS = ('full', 'skeleton', 'fingertips')
+
+# Colores (BGR) y grosores de mp.solutions.drawing_styles para las manos
+_RED = (48, 48, 255)
+_GREEN = (48, 255, 48)
+_BLUE = (192, 101, 21)
+_YELLOW = (0, 204, 255)
+_GRAY = (128, 128, 128)
+_PURPLE = (128, 64, 128)
+_PEACH = (180, 229, 255)
+_WHITE = (224, 224, 224)
+_PINCH_COLOR = (255, 0, 255)
+_LABEL_COLOR = (0, 255, 0)
+
+JOINT_RADIUS = 5
+FINGERTIP_RADIUS = 4
+PINCH_RADIUS = 4
+
+# Conexiones como cadenas de índices (una polilínea por cadena), agrupadas por color y grosor.
+# Son las 21 conexiones de mp_hands.HAND_CONNECTIONS
+CONNECTION_GROUPS = (
+    (_GRAY, 3, ((0, 5, 9, 13, 17, 0), (0, 1))),  # palma
+    (_PEACH, 2, ((1, 2, 3, 4),)),                # pulgar
+    (_PURPLE, 2, ((5, 6, 7, 8),)),               # índice
+    (_YELLOW, 2, ((9, 10, 11, 12),)),            # medio
+    (_GREEN, 2, ((13, 14, 15, 16),)),            # anular
+    (_BLUE, 2, ((17, 18, 19, 20),)),             # meñique
+)
+
+# Articulaciones por color (palma y muñeca en rojo, cada dedo con el color de sus conexiones)
+JOINT_GROUPS = (
+    (_RED, (0, 1, 5, 9, 13, 17)),
+    (_PEACH, (2, 3, 4)),
+    (_PURPLE, (6, 7, 8)),
+    (_YELLOW, (10, 11, 12)),
+    (_GREEN, (14, 15, 16)),
+    (_BLUE, (18, 19, 20)),
+)
+
+FINGERTIPS = (4, 8, 12, 16, 20)
+THUMB_TIP = 4
+INDEX_TIP = 8
+WRIST = 0
+
+
+# Array (21, 2) de coordenadas normalizadas de una mano: directo si viene de la reproducción (ArrayHandLandmarks)
+# o leído de los protos de MediaPipe
+def landmarks_xy(hand_landmarks):
+    array = getattr(hand_landmarks, 'array', None)
+    if array is not None:
+        return np.asarray(array)[:, :2]
+    return np.array([(landmark.x, landmark.y) for landmark in hand_landmarks.landmark], dtype=np.float32)
+
+
+# El nivel con menos detalle de los dos (None = sin límite)
+def coarser_detail(detail, limit):
+    if limit is None:
+        return detail
+    return OVERLAY_DETAILS[max(OVERLAY_DETAILS.index(detail), OVERLAY_DETAILS.index(limit))]
+
+
+class SkeletonRenderer:
+
+    # detail: nivel por defecto (ver OVERLAY_DETAILS); draw puede recibir otro en cada llamada
+    def __init__(self, detail='full'):
+        if detail not in OVERLAY_DETAILS:
+            raise ValueError(f"Nivel de detalle desconocido: {detail} (opciones: {', '.join(OVERLAY_DETAILS)})")
+        self.detail = detail
+
+        # Índices precalculados una vez: cadenas de conexiones y articulaciones de cada grupo
+        self.connection_groups = [(color, thickness, [np.array(chain) for chain in chains])
+                                  for color, thickness, chains in CONNECTION_GROUPS]
+        self.joint_groups = [(color, np.array(indices)) for color, indices in JOINT_GROUPS]
+        self.fingertips = np.array(FINGERTIPS)
+        # Radio del borde blanco como en mp_drawing.draw_landmarks
+        self.border_radius = max(JOINT_RADIUS + 1, int(JOINT_RADIUS * 1.2))
+
+    # Dibuja las manos de unos resultados con la forma de mp.solutions.hands (multi_hand_landmarks, multi_handedness)
+    def draw(self, frame, results, detail=None):
+        if results is None or not results.multi_hand_landmarks:
+            return
+        detail = self.detail if detail is None else detail
+        h, w = frame.shape[:2]
+
+        # Coordenadas en píxeles de todas las manos, (manos, 21, 2), en una sola operación
+        hands = np.stack([landmarks_xy(hand_landmarks) for hand_landmarks in results.multi_hand_landmarks])
+        points = (hands * (w, h)).astype(np.int32)
+        labels = [handedness.classification[0].label for handedness in results.multi_handedness]
+
+        if detail == 'fingertips':
+            self._draw_dots(frame, points[:, self.fingertips].reshape(-1, 2), _LABEL_COLOR, FINGERTIP_RADIUS)
+        else:
+            for color, thickness, chains in self.connection_groups:
+                cv2.polylines(frame, [hand[chain] for hand in points for chain in chains], False, color, thickness)
+            if detail == 'full':
+                self._draw_dots(frame, points.reshape(-1, 2), _WHITE, self.border_radius)
+                for color, indices in self.joint_groups:
+                    self._draw_dots(frame, points[:, indices].reshape(-1, 2), color, JOINT_RADIUS)
+
+        # Línea de vibrato (entre pulgar e índice) solo para la mano derecha
+        right = [hand for hand, label in zip(points, labels) if label == 'Right']
+        if right:
+            cv2.polylines(frame, [hand[[THUMB_TIP, INDEX_TIP]] for hand in right], False, _PINCH_COLOR, 2)
+            self._draw_dots(frame, np.concatenate([hand[[THUMB_TIP, INDEX_TIP]] for hand in right]),
+                            _PINCH_COLOR, PINCH_RADIUS)
+
+        if detail != 'fingertips':
+            for hand, label in zip(points, labels):
+                wrist_x, wrist_y = hand[WRIST]
+                cv2.putText(frame, label, (int(wrist_x) - 30, int(wrist_y) - 20),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, _LABEL_COLOR, 2)
+
+    # Círculos rellenos de radio radius en una sola llamada: segmentos de longitud cero con grosor 2r - 1
+    @staticmethod
+    def _draw_dots(frame, points, color, radius):
+        segments = np.repeat(points[:, None, :], 2, axis=1)
+        cv2.polylines(frame, list(segments), False, color, 2 * radius - 1)
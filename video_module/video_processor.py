@@ -1,85 +1,278 @@
 import cv2
 import numpy as np
 import time
-import mediapipe as mp
+import threading
+import contextlib
 import sys
 import os
+from types import SimpleNamespace
 import handPositionCalculator
+from landmark_recorder import LandmarkRecorder, mirror_results
+from video_recorder import AsyncVideoRecorder, DROP_NEWEST
+from camera_config import DEFAULT_FOURCCS, negotiate_mode, read_mode, format_mode
+from hand_landmarker import DEFAULT_MODEL_PATH, LiveStreamHandTracker
+from skeleton_renderer import SkeletonRenderer, coarser_detail
 
 # Agregar path para importar módulos de utils
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'utils'))
 
 from opencv_draw import cv_draw
+from performance_metrics import PerformanceMetrics
+
+# Resultado vacío mientras el modelo de MediaPipe todavía se está cargando
+_EMPTY_RESULTS = SimpleNamespace(multi_hand_landmarks=None, multi_handedness=None)
+
+# Backends de inferencia: 'solutions' (mp.solutions.hands, bloquea el bucle durante la inferencia) y
+# 'live_stream' (HandLandmarker de MediaPipe Tasks asíncrono, ver hand_landmarker.py)
+INFERENCE_BACKENDS = ('solutions', 'live_stream')
+
+# Ranuras del bus que el grabador nunca retiene: la que se está escribiendo, la última publicada y una para los
+# demás consumidores. Con más frames en su cola, el grabador recibe copias en lugar de referencias
+BUS_RESERVED_SLOTS = 3
 
 # Clase encargada de procesar video y realizar hand tracking
 class VideoProcessor:
     
-    def __init__(self, source=0, size=(1440, 810), save_video=False):
+    # record_landmarks: ruta opcional de un fichero .thlm donde grabar los landmarks de cada frame
+    # video_*: configuración de la grabación en segundo plano cuando save_video=True
+    #   video_size reescala antes de codificar, video_policy decide qué hacer si la cola se llena (drop_newest, drop_oldest, block)
+    # draw_landmarks: dibuja los landmarks en cada frame procesado. Con False el llamador los dibuja con draw_hands
+    #   solo en los frames que muestra (si se graba video, se siguen dibujando en todos)
+    # frame_bus: FrameBus opcional donde se publica cada frame (sin copias). El frame devuelto es entonces
+    #   una vista de solo lectura de la ranura del bus: el HUD debe dibujar sobre su propia capa
+    # camera_*: modo pedido a la cámara (solo con cámaras, no con ficheros). Se busca la resolución más cercana
+    #   a size para no reescalar cada frame; camera_fourccs en orden de preferencia, camera_buffer_size=1 para
+    #   no acumular frames viejos en el driver. negotiate_camera=False deja el modo por defecto del driver
+    # background_init: carga MediaPipe y hace una inferencia de calentamiento en un hilo aparte, así los primeros
+    #   frames se muestran (sin tracking) mientras el modelo se prepara. startup_timer registra las fases del arranque
+    # inference_backend: 'solutions' (síncrono) o 'live_stream' (asíncrono: el bucle no espera a la inferencia,
+    #   los frames que llegan con el modelo ocupado no se infieren y cada frame usa los últimos landmarks
+    #   disponibles). landmarker_model: fichero .task del HandLandmarker para 'live_stream'
+    # overlay_detail: detalle del dibujo de las manos ('full', 'skeleton' o 'fingertips', ver skeleton_renderer.py)
+    def __init__(self, source=0, size=(1440, 810), save_video=False, metrics=None, record_landmarks=None,
+                 video_path="hand-tracking.avi", video_codec="mp4v", video_size=None,
+                 video_queue_size=64, video_policy=DROP_NEWEST, background_init=True, startup_timer=None,
+                 draw_landmarks=True, frame_bus=None, negotiate_camera=True, camera_fps=30,
+                 camera_fourccs=DEFAULT_FOURCCS, camera_buffer_size=1, inference_backend='solutions',
+                 landmarker_model=DEFAULT_MODEL_PATH, overlay_detail='full'):
+        if inference_backend not in INFERENCE_BACKENDS:
+            raise ValueError(f"Backend de inferencia desconocido: {inference_backend} "
+                             f"(opciones: {', '.join(INFERENCE_BACKENDS)})")
         self.source = source
         self.size = size
         self.save_video = save_video
-        self.avg_fps = []
+        # Métricas de rendimiento con ventanas de tamaño fijo (se puede compartir con el bucle principal)
+        self.metrics = metrics if metrics is not None else PerformanceMetrics()
+        self.startup_timer = startup_timer
         self.video_writer = None
         self.last_results = None  # Almacenar resultados de MediaPipe para gestos
+        self.results_time = None  # Instante de captura del frame del que salen last_results
+        self.inference_backend = inference_backend
+        self.landmarker_model = landmarker_model
+        self.frame_rgb = None  # Buffer RGB reutilizado para la inferencia
+        self.frame_small = None  # Buffer del frame reducido cuando inference_scale < 1
+        # Calidad de la inferencia (la ajusta el gobernador de calidad): escala del frame y 1 de cada N frames
+        self.inference_scale = 1.0
+        self.inference_interval = 1
+        self.frames_since_inference = 0
+        self.wait_seconds = 0.0  # Tiempo del último frame bloqueado en cap.read (esperando a la cámara)
+        # Los frames grabados llevan siempre los landmarks dibujados
+        self.draw_landmarks = draw_landmarks or save_video
+        self.frame_bus = frame_bus
+        self.frame_ref = None  # Referencia al frame actual del bus (se libera al publicar el siguiente)
+        # Con bus los frames publicados no se tocan: los landmarks grabados se dibujan sobre la copia del grabador
+        self.frames_annotated = self.draw_landmarks and frame_bus is None
+        # Estilos y grupos de primitivas del dibujo de las manos, construidos una sola vez
+        self.skeleton_renderer = SkeletonRenderer(overlay_detail)
         
-        # Inicializar MediaPipe Hands
-        self.mp_hands = mp.solutions.hands
-        self.mp_drawing = mp.solutions.drawing_utils
-        self.mp_drawing_styles = mp.solutions.drawing_styles
-        
-        self.hands = self.mp_hands.Hands(
-            static_image_mode=False,
-            max_num_hands=2,
-            min_detection_confidence=0.5,
-            min_tracking_confidence=0.5
-        )
+        # MediaPipe Hands se inicializa en _init_model (en segundo plano si background_init)
+        self.hands = None
+        self.model_ready = threading.Event()
+        self.model_error = None
+        self.model_thread = None
+        # Se activa si el modelo no llega a cargarse: el error se lanza una sola vez y después
+        # is_opened() devuelve False y process_frame() no devuelve frames
+        self.stopped = False
         
         # Inicializar captura de video
-        self.cap = cv2.VideoCapture(source)
+        with self._phase('capture_open'):
+            self.cap = cv2.VideoCapture(source)
         if not self.cap.isOpened():
             raise RuntimeError(f"No se pudo abrir la fuente de video: {source}")
+
+        # Negociar el modo de la cámara (los ficheros y streams se leen tal cual)
+        if negotiate_camera and isinstance(source, int):
+            with self._phase('capture_configure'):
+                self.camera_mode = negotiate_mode(self.cap, self.size, fps=camera_fps, fourccs=camera_fourccs,
+                                                  buffer_size=camera_buffer_size)
+        else:
+            self.camera_mode = read_mode(self.cap)
+        # Solo se reescala si la fuente no entrega ya el tamaño de proceso (lo decide _mirror en cada frame)
+        resized = (self.camera_mode['width'], self.camera_mode['height']) != tuple(self.size)
+        print(f"Modo de captura: {format_mode(self.camera_mode)}"
+              f"{f' (reescalado a {self.size[0]}x{self.size[1]})' if resized else ''}")
         
         # Obtener parámetros del video
-        frame_width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        frame_height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        fps = int(self.cap.get(cv2.CAP_PROP_FPS))
+        fps = int(self.camera_mode['fps'])
+        self.metrics.set_expected_fps(fps)
         
         # Inicializar video writer si es necesario
         if self.save_video:
-            self.video_writer = cv2.VideoWriter(
-                "hand-tracking.avi",
-                cv2.VideoWriter_fourcc(*"mp4v"),
-                fps if fps > 0 else 30,
-                self.size
+            self.video_writer = AsyncVideoRecorder(
+                path=video_path,
+                fps=fps if fps > 0 else 30,
+                frame_size=self.size,
+                codec=video_codec,
+                output_size=video_size,
+                queue_size=video_queue_size,
+                policy=video_policy
             )
         
+        # Grabador de landmarks para poder reproducir la sesión sin video ni inferencia
+        self.landmark_recorder = LandmarkRecorder(record_landmarks) if record_landmarks else None
+        
         # Inicializar calculador de posiciones
         self.position_calculator = handPositionCalculator.HandPositionCalculator(
             self.size[0], self.size[1]
         )
+
+        # Inicializar MediaPipe Hands
+        if background_init:
+            self.model_thread = threading.Thread(target=self._init_model, name='MediaPipeInit', daemon=True)
+            self.model_thread.start()
+        else:
+            self._init_model()
+            if self.model_error is not None:
+                raise self.model_error
+
+    def _phase(self, name):
+        if self.startup_timer is None:
+            return contextlib.nullcontext()
+        return self.startup_timer.phase(name)
+
+    # Importa MediaPipe, construye el grafo de Hands y hace una inferencia de calentamiento
+    def _init_model(self):
+        try:
+            with self._phase('mediapipe_import'):
+                import mediapipe as mp
+            self.mp_hands = mp.solutions.hands
+
+            with self._phase('model_init'):
+                if self.inference_backend == 'live_stream':
+                    hands = LiveStreamHandTracker(self.landmarker_model, num_hands=2, min_detection_confidence=0.5,
+                                                  min_tracking_confidence=0.5, metrics=self.metrics)
+                else:
+                    hands = self.mp_hands.Hands(
+                        static_image_mode=False,
+                        max_num_hands=2,
+                        min_detection_confidence=0.5,
+                        min_tracking_confidence=0.5
+                    )
+
+            # La primera inferencia es mucho más lenta (reserva de memoria, compilación), la hacemos aquí
+            # con el tamaño que entrega la cámara, que es el que recibe la inferencia
+            with self._phase('model_warmup'):
+                blank = np.zeros((self.camera_mode['height'], self.camera_mode['width'], 3), dtype=np.uint8)
+                if self.inference_backend == 'live_stream':
+                    hands.submit(blank, time.perf_counter())
+                    hands.wait_idle(10.0)
+                    hands.latest = None
+                else:
+                    hands.process(blank)
+
+            self.hands = hands
+        except Exception as e:
+            self.model_error = e
+            print(f"Error inicializando MediaPipe: {e}")
+        finally:
+            self.model_ready.set()
+
+    # Espera a que el modelo esté listo. Devuelve False si se agota el timeout
+    def wait_until_ready(self, timeout=None):
+        return self.model_ready.wait(timeout)
+
+    # Reduce el coste de la inferencia: scale < 1 reescala el frame antes de MediaPipe y interval = N infiere
+    # solo en uno de cada N frames (en el resto se reutilizan los últimos landmarks)
+    def set_inference_quality(self, scale=None, interval=None):
+        if scale is not None:
+            self.inference_scale = min(max(float(scale), 0.1), 1.0)
+        if interval is not None:
+            self.inference_interval = max(1, int(interval))
+
     # procesa un frame (instante) del video
     def process_frame(self):
-        ret, frame = self.cap.read()
+        if self.stopped:
+            return None, None, None
+        self.metrics.tick_frame()
+        capture_start = time.perf_counter()
+        with self.metrics.span('capture.read'):
+            ret, frame = self.cap.read()
+        self.wait_seconds = time.perf_counter() - capture_start
         
         if not ret:
             return None, None, None
         
-        frame = cv2.resize(frame, self.size)
-        frame = cv2.flip(frame, 1)  # Efecto espejo
+        # Frame para mostrar: espejo (y reescalado si hace falta) escrito directamente en su destino
+        camera_frame = frame
+        frame = self._mirror(camera_frame, capture_start)
+        self.metrics.record('capture', time.perf_counter() - capture_start)
         
-        start_time = time.time()
+        start_time = time.perf_counter()
         
-        # Convertir BGR a RGB para MediaPipe
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
-        # Procesar frame con MediaPipe Hands 
-        results = self.hands.process(frame_rgb)
+        # new_results: resultados de un frame que todavía no se había usado (para grabarlos con su instante)
+        new_results = False
+        inference_due = self.frames_since_inference + 1 >= self.inference_interval \
+            or self.last_results is None or self.last_results is _EMPTY_RESULTS
+        if self.hands is not None and self.inference_backend == 'live_stream':
+            # Se entrega el frame si toca y el modelo está libre (si no, se descarta); el bucle sigue con los
+            # últimos landmarks. El buffer RGB no se toca mientras MediaPipe lo está usando
+            if inference_due and self.hands.accepting():
+                with self.metrics.span('inference.submit'):
+                    self.hands.submit(self._inference_input(camera_frame), capture_start)
+                self.frames_since_inference = 0
+            else:
+                self.frames_since_inference += 1
+            self.metrics.set_counter('inference_dropped_frames', self.hands.dropped)
+            latest = self.hands.latest
+            if latest is None:
+                results = _EMPTY_RESULTS
+            else:
+                results, results_time = latest
+                new_results = results_time != self.results_time
+                self.results_time = results_time
+        elif self.hands is not None and not inference_due:
+            # Frame sin inferencia (calidad reducida): se reutilizan los landmarks del último frame inferido
+            self.frames_since_inference += 1
+            results = self.last_results
+        elif self.hands is not None:
+            # Procesar frame con MediaPipe Hands y aplicar el espejo a los landmarks
+            frame_rgb = self._inference_input(camera_frame)
+            with self.metrics.span('inference.hands_process'):
+                results = self.hands.process(frame_rgb)
+            results = mirror_results(results)
+            self.frames_since_inference = 0
+            self.results_time = capture_start
+            new_results = True
+        elif self.model_error is not None:
+            self.stopped = True
+            raise RuntimeError("No se pudo inicializar MediaPipe Hands") from self.model_error
+        else:
+            # El modelo todavía se está cargando: mostramos el frame sin tracking
+            results = _EMPTY_RESULTS
         
         # Almacenar resultados para acceso externo (para gestos)
         self.last_results = results
 
         
-        process_time = time.time() - start_time
+        process_time = time.perf_counter() - start_time
+        # En modo asíncrono la etapa 'inference' la registra el callback (latencia real de cada inferencia)
+        if new_results and self.inference_backend == 'solutions':
+            self.metrics.record('inference', process_time)
+
+        # Grabar landmarks con la marca temporal de la captura de su frame (en asíncrono, solo los nuevos)
+        if self.landmark_recorder is not None and (new_results or self.inference_backend == 'solutions'):
+            timestamp = self.results_time if new_results else capture_start
+            self.landmark_recorder.write(results, timestamp=timestamp - self.landmark_recorder.start_time)
         
         # Resetear posiciones antes de actualizar
         self.position_calculator.reset()
@@ -91,60 +284,100 @@ class VideoProcessor:
                 
                 # Actualizar posición en el calculador
                 self.position_calculator.update_hand_position(hand_landmarks, hand_label)
-                
-                # Dibujar las conexiones y puntos de la mano
-                self.mp_drawing.draw_landmarks(
-                    frame,
-                    hand_landmarks,
-                    self.mp_hands.HAND_CONNECTIONS,
-                    self.mp_drawing_styles.get_default_hand_landmarks_style(),
-                    self.mp_drawing_styles.get_default_hand_connections_style()
-                )
-                
-                # Dibujar línea de vibrato (entre pulgar e índice) solo para mano derecha
-                h, w, _ = frame.shape
-                if hand_label == 'Right':
-                    thumb_tip = hand_landmarks.landmark[4]
-                    index_tip = hand_landmarks.landmark[8]
-                    
-                    thumb_x, thumb_y = int(thumb_tip.x * w), int(thumb_tip.y * h)
-                    index_x, index_y = int(index_tip.x * w), int(index_tip.y * h)
-                    
-                    # Dibujar línea
-                    cv2.line(frame, (thumb_x, thumb_y), (index_x, index_y), (255, 0, 255), 2)
-                    # Dibujar puntos en los extremos
-                    cv2.circle(frame, (thumb_x, thumb_y), 4, (255, 0, 255), -1)
-                    cv2.circle(frame, (index_x, index_y), 4, (255, 0, 255), -1)
-                
-                # Dibujar etiqueta de la mano
-                wrist = hand_landmarks.landmark[0]
-                wrist_x, wrist_y = int(wrist.x * w), int(wrist.y * h)
-                cv2.putText(frame, hand_label, (wrist_x - 30, wrist_y - 20),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+
+        if self.frames_annotated:
+            self.draw_hands(frame, results)
         
-        # Guardar frame si es necesario
+        # Guardar frame si es necesario (solo se encola, la codificación va en otro hilo). Los frames grabados
+        # llevan siempre los landmarks: si el frame no los tiene dibujados, el grabador los dibuja sobre su copia
+        if self.video_writer:
+            annotate = None if self.frames_annotated else (lambda f: self.draw_hands(f, results))
+            ref = None
+            if self.frame_ref is not None and \
+                    self.video_writer.queued_refs < self.frame_bus.slots - BUS_RESERVED_SLOTS:
+                # El grabador toma su propia referencia a la ranura (sin copia) mientras no agote el bus
+                ref = self.frame_bus.acquire_latest(self.frame_ref.sequence - 1)
+            if ref is not None:
+                self.video_writer.write_ref(ref, annotate=annotate)
+            else:
+                # Sin ranura (bus lleno, o el grabador ya retiene su parte): copia en la cola del grabador
+                self.video_writer.write(frame, timestamp=capture_start, annotate=annotate)
         if self.video_writer:
-            self.video_writer.write(frame)
+            self.metrics.set_counter('video_queue_depth', self.video_writer.get_queue_depth())
+            self.metrics.set_counter('video_dropped_frames', self.video_writer.dropped_frames)
 
         # Returns:   Tupla (frame_processed, position_calculator, process_time) o (None, None, None) si no hay frame
         return frame, self.position_calculator, process_time
     
-    def get_average_fps(self, process_time):
-        if process_time > 0:
-            fps = 1.0 / process_time
-            self.avg_fps.append(fps)
-            return sum(self.avg_fps) / len(self.avg_fps)
-        return 0
+    # Entrada de MediaPipe: el frame tal cual llega de la cámara (sin espejo ni reescalado; MediaPipe ya reduce
+    # la imagen internamente), o reducido si la calidad lo pide. BGR -> RGB sobre un buffer reutilizado
+    def _inference_input(self, camera_frame):
+        inference_frame = camera_frame
+        if self.inference_scale < 1.0:
+            height, width = camera_frame.shape[:2]
+            small_size = (max(1, int(width * self.inference_scale)), max(1, int(height * self.inference_scale)))
+            if self.frame_small is None or self.frame_small.shape[1::-1] != small_size:
+                self.frame_small = np.empty((small_size[1], small_size[0], 3), dtype=np.uint8)
+            inference_frame = cv2.resize(camera_frame, small_size, dst=self.frame_small,
+                                         interpolation=cv2.INTER_AREA)
+        if self.frame_rgb is None or self.frame_rgb.shape != inference_frame.shape:
+            self.frame_rgb = np.empty_like(inference_frame)
+        cv2.cvtColor(inference_frame, cv2.COLOR_BGR2RGB, dst=self.frame_rgb)
+        return self.frame_rgb
+
+    # Espejo del frame (reescalado a size si la fuente no lo entrega ya así), escrito en una sola pasada por
+    # operación. Con bus se escribe directamente en una ranura libre y se publica; si no queda ninguna
+    # (todos los consumidores retrasados) se usa un frame normal y ese frame no llega al bus
+    def _mirror(self, frame, timestamp=None):
+        if self.frame_ref is not None:
+            self.frame_ref.release()
+            self.frame_ref = None
+        slot, target = (None, None) if self.frame_bus is None else self.frame_bus.begin_write()
+        # El tamaño se comprueba en cada frame por si la fuente cambia de resolución sobre la marcha
+        if frame.shape[1] != self.size[0] or frame.shape[0] != self.size[1]:
+            # Reescalado al destino y espejo in-place sobre él (sin frame intermedio)
+            target = cv2.resize(frame, self.size, dst=target)
+            cv2.flip(target, 1, dst=target)
+        else:
+            target = cv2.flip(frame, 1, dst=target)
+        if slot is None:
+            return target
+        self.frame_bus.commit(slot, timestamp)
+        self.frame_ref = self.frame_bus.acquire_latest()
+        return self.frame_ref.array
+
+    # Dibuja las manos (landmarks, línea de vibrato y etiqueta) sobre el frame. results=None usa el último resultado.
+    # max_detail limita el detalle configurado (lo usa el gobernador de calidad para abaratar el dibujo)
+    def draw_hands(self, frame, results=None, max_detail=None):
+        results = self.last_results if results is None else results
+        self.skeleton_renderer.draw(frame, results, coarser_detail(self.skeleton_renderer.detail, max_detail))
+
+    # FPS reales del bucle, medidos entre llamadas consecutivas a process_frame (ventana deslizante).
+    # process_time se mantiene por compatibilidad, el tiempo de inferencia ya queda registrado en las métricas.
+    def get_average_fps(self, process_time=None):
+        return self.metrics.get_loop_fps()
     
     def cleanup(self):
         self.cap.release()
         if self.video_writer:
             self.video_writer.release()
-        cv2.destroyAllWindows()
-        self.hands.close()
+        if self.frame_ref is not None:
+            self.frame_ref.release()
+            self.frame_ref = None
+        if self.landmark_recorder is not None:
+            self.landmark_recorder.close()
+        try:
+            cv2.destroyAllWindows()
+        except cv2.error:
+            # OpenCV sin soporte de ventanas (modo headless)
+            pass
+        if self.model_thread is not None:
+            self.model_thread.join()
+        if self.hands is not None:
+            self.hands.close()
     
     def is_opened(self):
-        return self.cap.isOpened()
+        return not self.stopped and self.cap.isOpened()
 
 
 # Ejemplo de uso de la clase VideoProcessor, no usado para el main
@@ -0,0 +1,149 @@
+"""
+Grabación de video en segundo plano
+El bucle de tracking solo encola el frame; la codificación (y el reescalado opcional)
+se hace en un hilo aparte para que grabar no reduzca los FPS en directo.
+"""
+
+import queue
+import threading
+import time
+
+import cv2
+
+# Políticas cuando la cola está llena
+DROP_NEWEST = 'drop_newest'  # Se descarta el frame nuevo (no bloquea nunca)
+DROP_OLDEST = 'drop_oldest'  # Se descarta el frame más antiguo de la cola (no bloquea nunca)
+BLOCK = 'block'              # Se espera a que haya hueco (no se pierde ningún frame, puede frenar el bucle)
+POLICIES = (DROP_NEWEST, DROP_OLDEST, BLOCK)
+
+
+class AsyncVideoRecorder:
+
+    def __init__(self, path='hand-tracking.avi', fps=30, frame_size=(1440, 810), codec='mp4v',
+                 output_size=None, queue_size=64, policy=DROP_NEWEST):
+        if policy not in POLICIES:
+            raise ValueError(f"Política de grabación desconocida: {policy} (opciones: {', '.join(POLICIES)})")
+
+        self.path = path
+        self.fps = fps
+        self.frame_size = tuple(frame_size)
+        # Tamaño del video guardado. Si es menor que el del frame se reescala en el hilo de escritura
+        self.output_size = tuple(output_size) if output_size else self.frame_size
+        self.codec = codec
+        self.policy = policy
+
+        self.writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*codec), fps, self.output_size)
+        if not self.writer.isOpened():
+            raise RuntimeError(f"No se pudo abrir el video de salida: {path} (codec {codec})")
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.frames_written = 0
+        self.dropped_frames = 0
+        self.max_queue_depth = 0
+        # Ranuras de FrameBus retenidas por la cola = encoladas - descartadas - escritas. Cada contador tiene un
+        # solo escritor (los dos primeros el bucle de tracking, el último el hilo de escritura)
+        self.refs_queued = 0
+        self.refs_discarded = 0
+        self.refs_written = 0
+        # Instante (perf_counter) del primer frame grabado: permite alinear otras grabaciones (p.ej. el audio)
+        self.start_time = None
+        self.running = True
+
+        self.thread = threading.Thread(target=self._writer_loop, name='AsyncVideoRecorder', daemon=True)
+        self.thread.start()
+
+    # Encola una copia del frame (el HUD sigue dibujando sobre el original). Devuelve False si se descartó.
+    # timestamp: instante de captura del frame (por defecto, ahora). annotate(frame) dibuja sobre la copia en el
+    # hilo de escritura
+    def write(self, frame, timestamp=None, annotate=None):
+        if not self.running:
+            return False
+        return self._enqueue((None, frame.copy(), annotate), timestamp)
+
+    # Encola una referencia de FrameBus sin copiar el frame; se libera al terminar de escribirlo.
+    # annotate(frame) dibuja sobre una copia en el hilo de escritura (el frame del bus es de solo lectura)
+    def write_ref(self, ref, annotate=None):
+        if not self.running:
+            ref.release()
+            return False
+        self.refs_queued += 1
+        return self._enqueue((ref, None, annotate), ref.timestamp)
+
+    # Ranuras del bus que la cola tiene retenidas ahora mismo
+    @property
+    def queued_refs(self):
+        return self.refs_queued - self.refs_discarded - self.refs_written
+
+    # Elemento de la cola: (referencia de FrameBus o None, frame copiado o None, annotate o None).
+    # Libera la referencia de un elemento que no se va a escribir
+    def _discard(self, item):
+        if item[0] is not None:
+            item[0].release()
+            self.refs_discarded += 1
+
+    def _enqueue(self, item, timestamp=None):
+        if self.policy == BLOCK:
+            self.queue.put(item)
+        else:
+            try:
+                self.queue.put_nowait(item)
+            except queue.Full:
+                self.dropped_frames += 1
+                if self.policy == DROP_NEWEST:
+                    self._discard(item)
+                    return False
+                # DROP_OLDEST: sacamos el más antiguo y metemos el nuevo
+                try:
+                    self._discard(self.queue.get_nowait())
+                except queue.Empty:
+                    pass
+                try:
+                    self.queue.put_nowait(item)
+                except queue.Full:
+                    self._discard(item)
+                    return False
+
+        if self.start_time is None:
+            self.start_time = time.perf_counter() if timestamp is None else timestamp
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        return True
+
+    def _writer_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            ref, frame, annotate = item
+            if ref is not None:
+                frame = ref.array
+                if annotate is not None:
+                    frame = frame.copy()
+            if annotate is not None:
+                annotate(frame)
+            if (frame.shape[1], frame.shape[0]) != self.output_size:
+                frame = cv2.resize(frame, self.output_size, interpolation=cv2.INTER_AREA)
+            self.writer.write(frame)
+            self.frames_written += 1
+            if ref is not None:
+                ref.release()
+                self.refs_written += 1
+
+    def get_queue_depth(self):
+        return self.queue.qsize()
+
+    def get_stats(self):
+        return {
+            'queue_depth': self.queue.qsize(),
+            'max_queue_depth': self.max_queue_depth,
+            'frames_written': self.frames_written,
+            'dropped_frames': self.dropped_frames,
+        }
+
+    # Vacía la cola, espera al hilo de escritura y cierra el fichero
+    def release(self):
+        if not self.running:
+            return
+        self.running = False
+        self.queue.put(None)
+        self.thread.join()
+        self.writer.release()